@@ -0,0 +1,131 @@
+"""
+Continent, WHO-region and country-group rollups for the COVID-19 tracker.
+
+Everything here is summed from the countries snapshot, including the
+global totals, so none of it costs an upstream call. Rollups are built
+with one group-by per grouping when the countries data is refreshed.
+"""
+
+import numpy as np
+
+from country_frame import COUNT_COLUMNS, safe_ratio
+
+# Groupings /api/aggregate accepts
+AGGREGATE_BY = ('continent', 'who_region', 'group')
+
+# Label for countries a grouping does not cover, such as the cruise ships
+OTHER = 'Other'
+
+# Per-million figures recomputed from the summed counts
+PER_MILLION = ('cases', 'deaths', 'tests', 'active', 'recovered', 'critical')
+
+# Fields of every rollup row, in response order
+AGGREGATE_FIELDS = (['countries', 'updated'] + COUNT_COLUMNS +
+                    [f'{m}PerOneMillion' for m in PER_MILLION] + ['caseFatalityRate', 'recoveryRate'])
+
+# WHO regional offices by ISO3 code, including the territories WHO reports under each
+WHO_REGIONS = {
+    'Africa': (
+        'AGO BDI BEN BFA BWA CAF CIV CMR COD COG COM CPV DZA ERI ETH GAB GHA GIN GMB GNB GNQ KEN '
+        'LBR LSO MDG MLI MOZ MRT MUS MWI MYT NAM NER NGA REU RWA SEN SHN SLE SSD STP SWZ SYC TCD '
+        'TGO TZA UGA ZAF ZMB ZWE'),
+    'Americas': (
+        'ABW AIA ARG ATG BES BHS BLM BLZ BMU BOL BRA BRB CAN CHL COL CRI CUB CUW CYM DMA DOM ECU '
+        'FLK GLP GRD GTM GUF GUY HND HTI JAM KNA LCA MAF MEX MSR MTQ NIC PAN PER PRI PRY SLV SPM '
+        'SUR SXM TCA TTO URY USA VCT VEN VGB VIR'),
+    'South-East Asia': 'BGD BTN IDN IND LKA MDV MMR NPL PRK THA TLS',
+    'Europe': (
+        'ALB AND ARM AUT AZE BEL BGR BIH BLR CHE CYP CZE DEU DNK ESP EST FIN FRA FRO GBR GEO GGY '
+        'GIB GRC GRL HRV HUN IMN IRL ISL ISR ITA JEY KAZ KGZ LIE LTU LUX LVA MCO MDA MKD MLT MNE '
+        'NLD NOR POL PRT ROU RUS SMR SRB SVK SVN SWE TJK TKM TUR UKR UZB VAT XKX'),
+    'Eastern Mediterranean': (
+        'AFG ARE BHR DJI EGY IRN IRQ JOR KWT LBN LBY MAR OMN PAK PSE QAT SAU SDN SOM SYR TUN YEM'),
+    'Western Pacific': (
+        'ASM AUS BRN CHN COK FJI FSM GUM HKG JPN KHM KIR KOR LAO MAC MHL MNG MNP MYS NCL NIU NRU '
+        'NZL PCN PHL PLW PNG PYF SGP SLB TKL TON TUV TWN VNM VUT WLF WSM'),
+}
+WHO_REGION_BY_ISO3 = {iso3: region for region, codes in WHO_REGIONS.items() for iso3 in codes.split()}
+
+
+def add_ratios(table):
+    """Recompute per-million figures and rates from a table's summed counts, in place."""
+    for metric in PER_MILLION:
+        table[f'{metric}PerOneMillion'] = safe_ratio(table[metric], table['population'], 1e6).round(2)
+    table['caseFatalityRate'] = safe_ratio(table['deaths'], table['cases'], 100).round(2)
+    table['recoveryRate'] = safe_ratio(table['recovered'], table['cases'], 100).round(2)
+    return table
+
+
+def rollup(frame, keys):
+    """Sum frame's counts by keys (an array with one label per row) into a table indexed by label."""
+    grouped = frame.groupby(np.asarray(keys), sort=True)
+    table = grouped[COUNT_COLUMNS].sum()
+    table.insert(0, 'updated', grouped['updated'].max())
+    table.insert(0, 'countries', grouped.size())
+    return add_ratios(table)
+
+
+def group_rollup(frame, groups):
+    """Roll up named groups of ISO3 codes, which may overlap, e.g. {'G7': ['CAN', ...]}."""
+    position = {iso3: i for i, iso3 in enumerate(frame['iso3']) if iso3}
+    rows, keys = [], []
+    for name, members in groups.items():
+        found = [position[iso3] for iso3 in members if iso3 in position]
+        rows.extend(found)
+        keys.extend([name] * len(found))
+    if not rows:
+        return rollup(frame.iloc[:0], [])
+    return rollup(frame.iloc[rows], keys)
+
+
+def build_aggregates(frame, groups):
+    """Build every rollup /api/aggregate serves: {by: table indexed by continent, region or group}."""
+    continents = frame['continent'].fillna('').replace('', OTHER)
+    regions = frame['iso3'].map(WHO_REGION_BY_ISO3).fillna(OTHER)
+    return {
+        'continent': rollup(frame, continents),
+        'who_region': rollup(frame, regions),
+        'group': group_rollup(frame, groups),
+    }
+
+
+def aggregate_rows(table, metrics=None):
+    """Return a rollup table as [{'name', 'countries', ...}], largest first by the first metric if given."""
+    if metrics:
+        table = table.sort_values(metrics[0], ascending=False, kind='stable')
+        table = table[['countries'] + [m for m in metrics if m != 'countries']]
+    rows = table.rename_axis('name').reset_index()
+    return rows.to_dict('records')
+
+
+def global_totals(frame):
+    """Return world totals summed from the countries, in the shape of disease.sh's /all."""
+    totals = rollup(frame, np.zeros(len(frame), dtype=np.int8)).iloc[0]
+
+    def per_person(count):
+        # One case, death or test per this many people, as disease.sh computes it
+        return round(int(totals['population']) / int(totals[count])) if totals[count] else 0
+
+    return {
+        'updated': int(totals['updated']),
+        'cases': int(totals['cases']),
+        'todayCases': int(totals['todayCases']),
+        'deaths': int(totals['deaths']),
+        'todayDeaths': int(totals['todayDeaths']),
+        'recovered': int(totals['recovered']),
+        'todayRecovered': int(totals['todayRecovered']),
+        'active': int(totals['active']),
+        'critical': int(totals['critical']),
+        'casesPerOneMillion': float(totals['casesPerOneMillion']),
+        'deathsPerOneMillion': float(totals['deathsPerOneMillion']),
+        'tests': int(totals['tests']),
+        'testsPerOneMillion': float(totals['testsPerOneMillion']),
+        'population': int(totals['population']),
+        'oneCasePerPeople': per_person('cases'),
+        'oneDeathPerPeople': per_person('deaths'),
+        'oneTestPerPeople': per_person('tests'),
+        'activePerOneMillion': float(totals['activePerOneMillion']),
+        'recoveredPerOneMillion': float(totals['recoveredPerOneMillion']),
+        'criticalPerOneMillion': float(totals['criticalPerOneMillion']),
+        'affectedCountries': int(totals['countries']),
+    }
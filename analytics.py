@@ -0,0 +1,112 @@
+"""
+Vectorized time-series analytics for the COVID-19 tracker.
+
+Rolling averages, incidence, growth rates, doubling times and Rt estimates
+are computed for every country at once from the daily arrays of the
+historical store, once per refresh. Requests then slice rows out of the
+precomputed arrays.
+"""
+
+import numpy as np
+
+from timeseries import GLOBAL_NAME
+
+ROLLING_WINDOWS = (7, 14)
+
+# Incidence is reported as new cases per this many people over the last 7 days
+INCIDENCE_POPULATION = 100000
+
+# Mean days between successive infections, used to turn growth into Rt
+SERIAL_INTERVAL = 5
+
+# Series returned for each country, in response order
+ANALYTICS_SERIES = (
+    'newCases7', 'newCases14', 'newDeaths7', 'newDeaths14',
+    'incidence7', 'weeklyGrowth', 'doublingTime', 'rt',
+)
+
+
+def rolling_sum(daily, window):
+    """Trailing sum over `window` days along the last axis of a 2-D array."""
+    cumulative = np.cumsum(daily, axis=1, dtype=np.float64)
+    sums = cumulative.copy()
+    sums[:, window:] -= cumulative[:, :-window]
+    return sums
+
+
+def lagged_ratio(values, lag):
+    """Return values / values shifted back by `lag` days, NaN where undefined."""
+    ratio = np.full(values.shape, np.nan)
+    previous = values[:, :-lag]
+    current = values[:, lag:]
+    np.divide(current, previous, out=ratio[:, lag:], where=previous > 0)
+    return ratio
+
+
+def to_json_values(array, decimals=2):
+    """Round an array for JSON, replacing NaN and infinities with None."""
+    # Adding 0.0 turns -0.0 into 0.0
+    values = (np.round(array, decimals) + 0.0).astype(object)
+    values[~np.isfinite(array)] = None
+    return values.tolist()
+
+
+class TimeSeriesAnalytics:
+    """Derived daily series for every country in a HistoricalStore."""
+
+    def __init__(self, store, populations):
+        self.store = store
+        # The global totals ride along as one extra row after the countries
+        self.rows = dict(store.rows)
+        self.rows[GLOBAL_NAME] = len(store.countries)
+
+        totals = store.totals()
+        # Negative days are upstream corrections, not real counts
+        new_cases = np.maximum(np.vstack([store.daily['newCases'], totals['newCases']]), 0)
+        new_deaths = np.maximum(np.vstack([store.daily['newDeaths'], totals['newDeaths']]), 0)
+
+        population = np.array([populations.get(c, 0) for c in store.countries] +
+                              [populations.get(GLOBAL_NAME, 0)], dtype=np.float64)
+
+        week_cases = rolling_sum(new_cases, 7)
+        cumulative_cases = np.vstack([store.values['cases'], totals['cases']]).astype(np.float64)
+
+        series = {}
+        for window in ROLLING_WINDOWS:
+            series[f'newCases{window}'] = rolling_sum(new_cases, window) / window
+            series[f'newDeaths{window}'] = rolling_sum(new_deaths, window) / window
+
+        incidence = np.full(week_cases.shape, np.nan)
+        np.divide(week_cases * INCIDENCE_POPULATION, population[:, None], out=incidence,
+                  where=population[:, None] > 0)
+        series['incidence7'] = incidence
+
+        # Week-over-week change in weekly cases, as a percentage
+        weekly_ratio = lagged_ratio(week_cases, 7)
+        series['weeklyGrowth'] = (weekly_ratio - 1) * 100
+
+        # Days for cumulative cases to double at the growth of the last week
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.log(lagged_ratio(cumulative_cases, 7))
+            series['doublingTime'] = np.where(growth > 0, 7 * np.log(2) / growth, np.nan)
+
+            # Exponential growth rate of weekly cases scaled by the serial interval
+            series['rt'] = np.exp(np.log(weekly_ratio) * SERIAL_INTERVAL / 7)
+
+        self.series = series
+
+    def has(self, name):
+        return name.lower() in self.rows
+
+    def country(self, name, days=None):
+        """Return the analytics of one country (or 'all') for the last `days` days, or None."""
+        row = self.rows.get(name.lower())
+        if row is None:
+            return None
+        start = 0 if days is None else max(self.store.n_days - days, 0)
+        series = {key: to_json_values(self.series[key][row, start:]) for key in ANALYTICS_SERIES}
+        return {
+            'dates': self.store.date_keys[start:],
+            'series': series,
+            'latest': {key: values[-1] if values else None for key, values in series.items()},
+        }
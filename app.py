@@ -3,68 +3,326 @@ Main application file for the COVID-19 tracker.
 """
 
 import os
-import json
+import threading
 import time
+from concurrent.futures import wait
 from datetime import datetime
-from flask import Flask, jsonify, render_template, request
-from flask_cors import CORS
+import numpy as np
 import requests
-import pandas as pd
-from apscheduler.schedulers.background import BackgroundScheduler
+from flask import Flask, Response, g, jsonify, render_template, request
+from flask_cors import CORS
+
+from aggregates import AGGREGATE_BY, AGGREGATE_FIELDS, aggregate_rows, build_aggregates, global_totals
+from analytics import TimeSeriesAnalytics
+from broadcast import Broadcaster, catch_up, diff_countries, diff_record, open_stream
+from columnar import binary_format, columnar_response
+from country_frame import COMPARE_COLUMNS, build_country_frame, frame_rows
+from country_index import (build_country_index, build_prefix_index, countries_fields,
+                           lookup_country, project_countries, project_country, search_prefix)
+from downsample import downsample_args, downsample_arrays, downsample_timeline
+from export import EXPORT_FORMATS, PARQUET_AVAILABLE, iter_export
+from ingest import ingest_historical, ingest_latest, ingest_vaccines
+from metrics import CACHE_LOOKUPS, instrument_app
+from precomputed import PrecomputedResponse, serve_precomputed
+from refresh import RefreshCoordinator
+from repository import repository
+from risk import build_risk_table
+from timeseries import GLOBAL_NAME, HistoricalStore
+from ttl_cache import TTLCache
+from upstream import BACKUP_FILES
+from vaccines import VACCINE_FLOWS, VACCINE_METRICS, VaccineStore
 
 # Import configuration
 from config import *
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+app.json.sort_keys = False  # Timelines are date-keyed objects whose order matters
+instrument_app(app, caches=repository.stats)  # Request metrics served at /metrics
 
 # In-memory cache
 cache = {
-    'countries': {'data': None, 'timestamp': 0},
-    'global': {'data': None, 'timestamp': 0},
-    'historical': {'data': {}, 'timestamp': 0},
-    'vaccine': {'data': {}, 'timestamp': 0}
+    'countries': {'data': None, 'index': {}, 'frame': None, 'risk': None, 'response': None,
+                  'prefix': [], 'fields': set(), 'aggregates': None, 'timestamp': 0,
+                  'projections': TTLCache(CACHE_HARD_EXPIRATION, PROJECTION_CACHE_MAX_ENTRIES),
+                  'rollups': TTLCache(CACHE_HARD_EXPIRATION, PROJECTION_CACHE_MAX_ENTRIES)},
+    'global': {'data': None, 'response': None, 'timestamp': 0},
+    'timeseries': {'store': None, 'timestamp': 0},
+    'vaccines': {'store': None, 'timestamp': 0},
+    'snapshot': {'version': None, 'checked': 0},
+    'analytics': {'data': None, 'store': None, 'frame': None}
 }
 
+# Makes sure only one fetch_covid_data() runs at a time
+refresher = RefreshCoordinator()
+
+# Held while the countries tables are built or replaced
+tables_lock = threading.Lock()
+
+# Pushes a diff of every new snapshot to /api/stream clients
+broadcaster = Broadcaster(STREAM_HISTORY)
+
+# Parts /api/country/<name>/detail can gather, in response order
+DETAIL_PARTS = ('stats', 'historical', 'risk', 'vaccine')
+
 # Create data directory if it doesn't exist
 os.makedirs(DATA_DIR, exist_ok=True)
 
 
+def set_countries_data(data, timestamp):
+    """Store the countries list with the indexes and encoded response built from it.
+
+    The pandas tables (snapshot frame, risk table and rollups) are left for
+    country_table() to build on first use, so serving a new snapshot, and
+    starting up, never waits on pandas.
+    """
+    # Build everything first so readers never see a half-updated entry
+    index = build_country_index(data)
+    response = PrecomputedResponse(data, timestamp)
+    with tables_lock:
+        cache['countries'].update({'data': data, 'index': index, 'frame': None, 'risk': None,
+                                   'response': response, 'prefix': build_prefix_index(data),
+                                   'fields': countries_fields(data),
+                                   'projections': TTLCache(CACHE_HARD_EXPIRATION, PROJECTION_CACHE_MAX_ENTRIES),
+                                   'aggregates': None,
+                                   'rollups': TTLCache(CACHE_HARD_EXPIRATION, PROJECTION_CACHE_MAX_ENTRIES),
+                                   'timestamp': timestamp})
+
+
+def country_table(name):
+    """Return the countries 'frame', 'risk' or 'aggregates' table, building all three on first use."""
+    entry = cache['countries']
+    # Read under the lock too, so a refresh cannot reset the tables between the check and the read
+    with tables_lock:
+        if entry['frame'] is None and entry['data']:
+            frame = build_country_frame(entry['data'])
+            entry.update({'frame': frame, 'risk': build_risk_table(frame),
+                          'aggregates': build_aggregates(frame, COUNTRY_GROUPS)})
+        return entry[name]
+
+
+def set_global_data(data, timestamp):
+    """Store the global totals together with their encoded response."""
+    response = PrecomputedResponse(data, timestamp)
+    cache['global'].update({'data': data, 'response': response, 'timestamp': timestamp})
+
+
+def load_snapshot():
+    """Serve the snapshot the ingest worker published last, if it is not served already."""
+    try:
+        manifest = repository.snapshots.current()
+        if manifest is None or manifest['version'] == cache['snapshot']['version']:
+            return
+        global_data, _ = repository.snapshot('global')
+        countries_data, _ = repository.snapshot('countries')
+        previous = (cache['snapshot']['version'], cache['global']['data'], cache['countries']['data'])
+        set_global_data(global_data, manifest['timestamp'])
+        set_countries_data(countries_data, manifest['timestamp'])
+        cache['snapshot']['version'] = manifest['version']
+        
+        # Streaming clients get only what changed since the version served before
+        version, old_global, old_countries = previous
+        if version is None or old_global is None or old_countries is None:
+            broadcaster.reset(manifest['version'])
+        else:
+            broadcaster.publish(manifest['version'], {
+                'timestamp': manifest['timestamp'],
+                'global': diff_record(old_global, global_data),
+                'countries': diff_countries(old_countries, countries_data)
+            })
+    except Exception as e:
+        print(f"Error loading snapshot: {e}")
+
+
 def fetch_covid_data():
-    """Fetch latest COVID-19 data and update cache."""
+    """Fetch latest COVID-19 data, publish it as a snapshot and update cache."""
     try:
-        # Fetch global data
-        global_response = requests.get(f"{COVID_API_BASE_URL}/all")
-        if global_response.status_code == 200:
-            cache['global']['data'] = global_response.json()
-            cache['global']['timestamp'] = time.time()
-            
-            # Save to file for backup
-            with open(f"{DATA_DIR}/global_data.json", 'w') as f:
-                json.dump(cache['global']['data'], f)
-            
-        # Fetch countries data
-        countries_response = requests.get(COVID_COUNTRIES_ENDPOINT)
-        if countries_response.status_code == 200:
-            cache['countries']['data'] = countries_response.json()
-            cache['countries']['timestamp'] = time.time()
-            
-            # Save to file for backup
-            with open(f"{DATA_DIR}/countries_data.json", 'w') as f:
-                json.dump(cache['countries']['data'], f)
-            
+        # The repository fetches each dataset once per refresh across all workers
+        ingest_latest(repository, max_age=CACHE_EXPIRATION)
+        load_snapshot()
         print(f"COVID data updated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     except Exception as e:
         print(f"Error updating COVID data: {e}")
 
 
-# Schedule data refresh every hour
-scheduler = BackgroundScheduler()
-scheduler.add_job(func=fetch_covid_data, trigger="interval", hours=1)
-scheduler.start()
+def fetch_historical_store():
+    """Bring the local time-series store up to date, fetching only the days it is missing."""
+    try:
+        # Reuse the copy another worker saved in the last half refresh period
+        store = ingest_historical(repository, cache['timeseries']['store'])
+        cache['timeseries'].update({'store': store,
+                                    'timestamp': os.path.getmtime(f"{TIMESERIES_DIR}/meta.json")})
+        print(f"Historical store updated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    except Exception as e:
+        print(f"Error updating historical store: {e}")
+
+
+def load_historical_store():
+    """Memory-map the time-series store on disk if it was saved since it was last loaded."""
+    meta_path = f"{TIMESERIES_DIR}/meta.json"
+    if os.path.exists(meta_path):
+        try:
+            mtime = os.path.getmtime(meta_path)
+            if mtime != cache['timeseries']['timestamp']:
+                store = HistoricalStore.load(TIMESERIES_DIR)
+                cache['timeseries'].update({'store': store, 'timestamp': mtime})
+        except Exception as e:
+            print(f"Error loading historical store: {e}")
+
+
+def refresh_historical_store(wait=True):
+    """Rebuild the time-series store, sharing any bulk fetch already in flight."""
+    return refresher.refresh('timeseries', fetch_historical_store, wait=wait)
+
+
+def fetch_vaccine_store():
+    """Rebuild the vaccine store from one bulk fetch of every country's coverage."""
+    try:
+        # Its dates are aligned with the historical store, so that comes first
+        if cache['timeseries']['store'] is None:
+            refresh_historical_store(wait=True)
+        store = ingest_vaccines(repository, cache['timeseries']['store'])
+        cache['vaccines'].update({'store': store, 'timestamp': os.path.getmtime(f"{VACCINE_DIR}/meta.json")})
+        print(f"Vaccine store updated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    except Exception as e:
+        print(f"Error updating vaccine store: {e}")
+
+
+def load_vaccine_store():
+    """Memory-map the vaccine store on disk if it was saved since it was last loaded."""
+    meta_path = f"{VACCINE_DIR}/meta.json"
+    if os.path.exists(meta_path):
+        try:
+            mtime = os.path.getmtime(meta_path)
+            if mtime != cache['vaccines']['timestamp']:
+                cache['vaccines'].update({'store': VaccineStore.load(VACCINE_DIR), 'timestamp': mtime})
+        except Exception as e:
+            print(f"Error loading vaccine store: {e}")
+
+
+def refresh_vaccine_store(wait=True):
+    """Rebuild the vaccine store, sharing any bulk fetch already in flight."""
+    return refresher.refresh('vaccines', fetch_vaccine_store, wait=wait)
+
+
+def refresh_covid_data(wait=True):
+    """Refresh the global and countries caches, sharing any fetch already in flight."""
+    if not EMBEDDED_INGEST:
+        # The ingest worker does the fetching; pick up whatever it published
+        load_snapshot()
+        return None
+    return refresher.refresh('latest', fetch_covid_data, wait=wait)
+
+
+def ensure_fresh(key):
+    """Make sure cache[key] holds data that may still be served.
+
+    Expired data is served immediately while a background refresh runs and
+    the response is marked stale. Past CACHE_HARD_EXPIRATION the request
+    waits for the refresh instead. Returns False if no servable data exists.
+    """
+    entry = cache[key]
+    age = time.time() - entry['timestamp']
+
+    if entry['data'] is None or age > CACHE_HARD_EXPIRATION:
+        CACHE_LOOKUPS.inc(key, 'miss')
+        refresh_covid_data(wait=True)
+    elif age > CACHE_EXPIRATION:
+        refresh_covid_data(wait=False)
 
-# Fetch data on startup
-fetch_covid_data()
+    if entry['data'] is None:
+        return False
+
+    age = time.time() - entry['timestamp']
+    if age > CACHE_HARD_EXPIRATION:
+        CACHE_LOOKUPS.inc(key, 'unavailable')
+        return False
+    if age > CACHE_EXPIRATION:
+        CACHE_LOOKUPS.inc(key, 'stale')
+        g.stale_data = True
+    else:
+        CACHE_LOOKUPS.inc(key, 'hit')
+    return True
+
+
+def find_country(name):
+    """Look up a country record by name, ISO code or alias in the cached index."""
+    return lookup_country(cache['countries']['index'], name)
+
+
+def find_series_name(store, name):
+    """Return the name a country is stored under in the time-series store, or None."""
+    if name.lower() == GLOBAL_NAME:
+        return GLOBAL_NAME
+    if name.lower() in store.rows:
+        return store.countries[store.rows[name.lower()]]
+    record = find_country(name)
+    if record and store.has(record['country']):
+        return record['country']
+    return None
+
+
+def get_analytics():
+    """Return the analytics for the current store, computing them once per refresh."""
+    store = cache['timeseries']['store']
+    frame = country_table('frame')
+    entry = cache['analytics']
+    if store is None:
+        return None
+    
+    # Recompute whenever the store or the population figures have been replaced
+    if entry['store'] is not store or entry['frame'] is not frame:
+        populations = {} if frame is None else dict(zip(frame['country'], frame['population']))
+        populations[GLOBAL_NAME] = (cache['global']['data'] or {}).get('population', 0)
+        entry.update({'data': TimeSeriesAnalytics(store, populations), 'store': store, 'frame': frame})
+    return entry['data']
+
+
+# Only scheduled when this process does its own ingest; the debug reloader's parent never serves
+reloader_parent = __name__ == '__main__' and DEBUG and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+scheduler = None
+if EMBEDDED_INGEST and not reloader_parent:
+    from apscheduler.schedulers.background import BackgroundScheduler
+    scheduler = BackgroundScheduler()
+    scheduler.add_job(func=refresh_covid_data, trigger="interval", minutes=INGEST_INTERVAL_MINUTES)
+    scheduler.add_job(func=refresh_historical_store, trigger="interval", hours=HISTORICAL_STORE_REFRESH_HOURS)
+    scheduler.add_job(func=refresh_vaccine_store, trigger="interval", hours=VACCINE_STORE_REFRESH_HOURS)
+    scheduler.start()
+
+# Serve the last published snapshot and stores straight away
+load_snapshot()
+load_historical_store()
+load_vaccine_store()
+
+# Without them, or with an expired snapshot, an embedded ingest fetches in the background
+# while the worker starts serving; requests only wait for it if they have nothing to serve
+if EMBEDDED_INGEST and not reloader_parent:
+    if cache['countries']['data'] is None or time.time() - cache['countries']['timestamp'] > CACHE_EXPIRATION:
+        refresh_covid_data(wait=False)
+    if cache['timeseries']['store'] is None:
+        refresh_historical_store(wait=False)
+    if cache['vaccines']['store'] is None:
+        refresh_vaccine_store(wait=False)
+
+
+@app.before_request
+def sync_snapshots():
+    """Pick up snapshots and stores published by other processes."""
+    now = time.time()
+    if now - cache['snapshot']['checked'] >= SNAPSHOT_CHECK_INTERVAL:
+        cache['snapshot']['checked'] = now
+        load_snapshot()
+        load_historical_store()
+        load_vaccine_store()
+
+
+@app.after_request
+def mark_stale_response(response):
+    """Flag responses that were served from expired data during a refresh."""
+    if g.get('stale_data'):
+        response.headers['Warning'] = '110 - "Response is Stale"'
+        response.headers['X-Cache-Status'] = 'stale'
+    return response
 
 
 @app.route('/')
@@ -78,18 +336,59 @@ def get_countries():
     """API endpoint to get COVID-19 data for all countries."""
     current_time = time.time()
     
-    # If cache is expired or empty, fetch new data
-    if (cache['countries']['data'] is None or 
-            current_time - cache['countries']['timestamp'] > CACHE_EXPIRATION):
-        fetch_covid_data()
+    # Serve cached data, refreshing it in the background if it has expired
+    if not ensure_fresh('countries') and cache['countries']['data'] is not None:
+        # Refreshing keeps failing and the data is past its hard expiry
+        return jsonify({"error": "Data temporarily unavailable"}), 503
         
-    # If we still don't have data, try to load from backup file
-    if cache['countries']['data'] is None and os.path.exists(f"{DATA_DIR}/countries_data.json"):
-        with open(f"{DATA_DIR}/countries_data.json", 'r') as f:
-            cache['countries']['data'] = json.load(f)
-            cache['countries']['timestamp'] = current_time
+    # If we still don't have data, fall back to the last good copy
+    if cache['countries']['data'] is None:
+        backup = repository.client.load_backup(BACKUP_FILES['/countries'])
+        if backup is not None:
+            set_countries_data(backup, current_time)
+    
+    if cache['countries']['response'] is None:
+        return jsonify(None)
+    
+    # ?fields=country,iso2,flag returns a lean projection, encoded once per refresh
+    fields = request.args.get('fields')
+    if fields:
+        # Fields come out in a fixed order, so every spelling of one set shares an entry
+        fields = tuple(sorted({f.strip() for f in fields.split(',') if f.strip()}))
+        unknown = [f for f in fields if f not in cache['countries']['fields']]
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+        
+        projections = cache['countries']['projections']
+        response = projections.get(fields)
+        if response is None:
+            projected = project_countries(cache['countries']['data'], fields)
+            response = PrecomputedResponse(projected, cache['countries']['timestamp'])
+            projections.set(fields, response)
+        return serve_precomputed(response)
+    
+    return serve_precomputed(cache['countries']['response'])
+
+
+@app.route('/api/countries/search')
+def search_countries():
+    """API endpoint for country typeahead, matching names, name words and aliases by prefix."""
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', 10, type=int)
+    fields = [f.strip() for f in request.args.get('fields', 'country,iso2,flag').split(',') if f.strip()]
+    if limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    limit = min(limit, SEARCH_MAX_LIMIT)
     
-    return jsonify(cache['countries']['data'])
+    # Serve cached data, refreshing it in the background if it has expired
+    if not ensure_fresh('countries'):
+        return jsonify({"error": "Data not available"}), 500
+    unknown = [f for f in fields if f not in cache['countries']['fields']]
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+    
+    names = search_prefix(cache['countries']['prefix'], query, limit)
+    return jsonify([project_country(find_country(name), fields) for name in names])
 
 
 @app.route('/api/global')
@@ -97,119 +396,407 @@ def get_global():
     """API endpoint to get global COVID-19 data."""
     current_time = time.time()
     
-    # If cache is expired or empty, fetch new data
-    if (cache['global']['data'] is None or 
-            current_time - cache['global']['timestamp'] > CACHE_EXPIRATION):
-        fetch_covid_data()
+    # Serve cached data, refreshing it in the background if it has expired
+    if not ensure_fresh('global') and cache['global']['data'] is not None:
+        # Refreshing keeps failing and the data is past its hard expiry
+        return jsonify({"error": "Data temporarily unavailable"}), 503
         
-    # If we still don't have data, try to load from backup file
-    if cache['global']['data'] is None and os.path.exists(f"{DATA_DIR}/global_data.json"):
-        with open(f"{DATA_DIR}/global_data.json", 'r') as f:
-            cache['global']['data'] = json.load(f)
-            cache['global']['timestamp'] = current_time
+    # If we still don't have data, sum the last good copy of the countries
+    if cache['global']['data'] is None:
+        backup = repository.client.load_backup(BACKUP_FILES['/countries'])
+        if backup:
+            set_global_data(global_totals(build_country_frame(backup)), current_time)
+    
+    if cache['global']['response'] is None:
+        return jsonify(None)
+    return serve_precomputed(cache['global']['response'])
+
+
+@app.route('/api/aggregate')
+def get_aggregate():
+    """API endpoint for totals by continent, WHO region or country group, summed from the countries data.
+    
+    ?by=continent|who_region|group picks the grouping (groups are
+    COUNTRY_GROUPS) and ?metric=cases,deaths keeps only those fields,
+    largest first by the first one.
+    """
+    by = request.args.get('by', 'continent')
+    if by not in AGGREGATE_BY:
+        return jsonify({"error": f"by must be one of: {', '.join(AGGREGATE_BY)}"}), 400
+    # Order matters (the first metric sorts the rows), repeats do not
+    metrics = tuple(dict.fromkeys(m.strip() for m in request.args.get('metric', '').split(',') if m.strip()))
+    unknown = [m for m in metrics if m not in AGGREGATE_FIELDS]
+    if unknown:
+        return jsonify({"error": f"Unknown metrics: {', '.join(unknown)}"}), 400
+    
+    if not ensure_fresh('countries') or country_table('aggregates') is None:
+        return jsonify({"error": "Data not available"}), 500
     
-    return jsonify(cache['global']['data'])
+    # Rollups are built once per refresh; each shape asked for is encoded once too
+    rollups = cache['countries']['rollups']
+    response = rollups.get((by, metrics))
+    if response is None:
+        rows = aggregate_rows(country_table('aggregates')[by], metrics)
+        response = PrecomputedResponse(rows, cache['countries']['timestamp'])
+        rollups.set((by, metrics), response)
+    return serve_precomputed(response)
 
 
 @app.route('/api/country/<country>')
 def get_country(country):
     """API endpoint to get COVID-19 data for a specific country."""
-    current_time = time.time()
+    return country_part(country)
+
+
+def country_part(country):
+    """Return (body, status) for one country's current figures."""
+    # Serve cached data, refreshing it in the background if it has expired
+    if not ensure_fresh('countries'):
+        # Refreshing keeps failing and the data is past its hard expiry
+        return {"error": "Data temporarily unavailable"}, 503
     
-    # If cache is expired or empty, fetch new data
-    if (cache['countries']['data'] is None or 
-            current_time - cache['countries']['timestamp'] > CACHE_EXPIRATION):
-        fetch_covid_data()
-    
-    if cache['countries']['data']:
-        country_data = None
-        for c in cache['countries']['data']:
-            if c['country'].lower() == country.lower():
-                country_data = c
-                break
-                
-        if country_data:
-            return jsonify(country_data)
+    country_data = find_country(country)
+    
+    if country_data:
+        return country_data, 200
     
     # Country not found
-    return jsonify({"error": "Country not found"}), 404
+    return {"error": "Country not found"}, 404
+
+
+@app.route('/api/country/<country>/detail')
+def get_country_detail(country):
+    """API endpoint returning a country's stats, history, risk and vaccination data in one response.
+    
+    ?include=stats,historical,risk,vaccine picks the parts; each is what its
+    own endpoint returns, or null with the reason under 'errors'.
+    """
+    include = [p.strip() for p in request.args.get('include', ','.join(DETAIL_PARTS)).split(',') if p.strip()]
+    unknown = [p for p in include if p not in DETAIL_PARTS]
+    if unknown:
+        return jsonify({"error": f"Unknown parts: {', '.join(unknown)}"}), 400
+    days = request.args.get('days', '30')
+    try:
+        points, resolution = downsample_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Resolve the name once so every part reads the same record
+    body, status = country_part(country)
+    if status != 200:
+        return jsonify(body), status
+    name = body['country']
+    
+    # Parts that may go upstream run at the same time on the shared fan-out pool
+    executor = repository.client.executor
+    pending = {}
+    if 'historical' in include:
+        pending['historical'] = executor.submit(historical_part, name, days, points, resolution)
+    if 'vaccine' in include:
+        pending['vaccine'] = executor.submit(vaccine_part, name, points, resolution)
+    parts = {'stats': (body, status)}
+    if 'risk' in include:
+        parts['risk'] = risk_part(name)
+    
+    done, _ = wait(pending.values(), timeout=UPSTREAM_FANOUT_DEADLINE)
+    for part, future in pending.items():
+        if future not in done:
+            future.cancel()
+            parts[part] = {"error": "Timed out"}, 504
+        elif future.exception() is not None:
+            print(f"Error building {part} for {name}: {future.exception()}")
+            parts[part] = {"error": f"Failed to fetch {part} data"}, 500
+        else:
+            parts[part] = future.result()
+    
+    detail = {'country': name}
+    errors = {}
+    for part in include:
+        body, status = parts[part]
+        detail[part] = body if status == 200 else None
+        if status != 200:
+            errors[part] = body.get('error')
+    if errors:
+        detail['errors'] = errors
+    return jsonify(detail)
+
+
+@app.route('/api/stream')
+def stream_updates():
+    """Server-sent events with a diff of the global totals and changed countries after each refresh.
+    
+    'update' events carry {'timestamp', 'global': changed fields or null,
+    'countries': {name: changed fields}}; a client that reconnects too far
+    behind gets a 'reset' event and should fetch /api/global and
+    /api/countries again.
+    
+    Here a stream holds a worker thread, so it is closed after one wait of
+    SNAPSHOT_CHECK_INTERVAL seconds, long-poll style, and the browser
+    reconnects after STREAM_RETRY seconds with the last id it saw. The
+    async serving mode keeps its streams open on the event loop instead.
+    """
+    last_id = request.headers.get('Last-Event-ID')
+    
+    def events():
+        text, seen = open_stream(broadcaster, last_id, STREAM_RETRY)
+        yield text
+        if last_id is None or seen == last_id:
+            # Nothing to catch up on: wait once for the next refresh
+            messages = broadcaster.wait(seen, SNAPSHOT_CHECK_INTERVAL)
+            if messages == []:
+                # Look for a snapshot published by another process before giving up
+                sync_snapshots()
+                messages = broadcaster.since(seen)
+            text, seen = catch_up(broadcaster, seen, messages)
+            yield text
+    
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 @app.route('/api/historical/<country>')
 def get_historical(country):
     """API endpoint to get historical COVID-19 data for a specific country."""
-    current_time = time.time()
+    days = request.args.get('days', '30')  # Default to 30 days
     
-    # Check if we have this country's historical data cached and it's not expired
-    if (country not in cache['historical']['data'] or 
-            current_time - cache['historical']['timestamp'] > CACHE_EXPIRATION):
-        
-        try:
-            # Fetch historical data for the country
-            days = request.args.get('days', '30')  # Default to 30 days
-            response = requests.get(f"{COVID_HISTORICAL_ENDPOINT}/{country}?lastdays={days}")
-            
-            if response.status_code == 200:
-                cache['historical']['data'][country] = response.json()
-                cache['historical']['timestamp'] = current_time
-                
-                # Save to file for backup
-                os.makedirs(f"{DATA_DIR}/historical", exist_ok=True)
-                with open(f"{DATA_DIR}/historical/{country}_data.json", 'w') as f:
-                    json.dump(cache['historical']['data'][country], f)
-            else:
-                return jsonify({"error": "Historical data not available"}), 404
-                
-        except Exception as e:
-            print(f"Error fetching historical data: {e}")
-            
-            # Try to load from backup file
-            if os.path.exists(f"{DATA_DIR}/historical/{country}_data.json"):
-                with open(f"{DATA_DIR}/historical/{country}_data.json", 'r') as f:
-                    cache['historical']['data'][country] = json.load(f)
-                    cache['historical']['timestamp'] = current_time
-            else:
-                return jsonify({"error": "Failed to fetch historical data"}), 500
+    # ?points=N or ?resolution=weekly|monthly thins long ranges before they are sent
+    try:
+        points, resolution = downsample_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Binary columnar output is negotiated via Accept or ?format=columns|arrow
+    try:
+        fmt = binary_format(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 406
+    
+    return historical_part(country, days, points, resolution, fmt)
+
+
+def historical_part(country, days, points, resolution, fmt=None):
+    """Return (body, status) for one country's history; the body is a binary Response if fmt is set."""
+    # Answer from the local time-series store when it covers this country
+    store = cache['timeseries']['store']
+    if store is not None and (days == 'all' or days.isdigit()):
+        name = find_series_name(store, country)
+        if name is not None:
+            dates, series = store.series(name, None if days == 'all' else int(days))
+            dates, series = downsample_arrays(dates, series, points, resolution)
+            name = country if name.lower() == 'all' else name
+            if fmt:
+                return columnar_response(fmt, dates, [name], series), 200
+            return {
+                'country': name,
+                'timeline': {metric: dict(zip(dates, values.tolist())) for metric, values in series.items()}
+            }, 200
+    
+    # Otherwise ask upstream through the shared cache, falling back to the backup file
+    try:
+        historical_data = repository.historical(country, days)
+    except requests.exceptions.HTTPError:
+        return {"error": "Historical data not available"}, 404
+    except Exception as e:
+        print(f"Error fetching historical data: {e}")
+        return {"error": "Failed to fetch historical data"}, 500
+    
+    # Countries carry their timeline under 'timeline'; the global history is the timeline itself
+    if isinstance(historical_data, dict) and 'timeline' in historical_data:
+        historical_data = dict(historical_data,
+                               timeline=downsample_timeline(historical_data['timeline'], points, resolution))
+    elif isinstance(historical_data, dict):
+        historical_data = downsample_timeline(historical_data, points, resolution)
+    
+    if fmt and isinstance(historical_data, dict):
+        timeline = historical_data.get('timeline', historical_data)
+        dates = list(timeline.get('cases', {}))
+        columns = {metric: [values.get(d, 0) for d in dates] for metric, values in timeline.items()}
+        return columnar_response(fmt, dates, [historical_data.get('country', country)], columns), 200
+    
+    return historical_data, 200
+
+
+@app.route('/api/historical')
+def get_bulk_historical():
+    """API endpoint to get aligned historical series for many countries, or every country if none are given."""
+    countries = request.args.get('countries')
+    days = request.args.get('days', '30')
+    if not (days == 'all' or days.isdigit()):
+        return jsonify({"error": "days must be a number or 'all'"}), 400
+    if 'points' in request.args:
+        return jsonify({"error": "points is not supported for many countries; use resolution"}), 400
     
-    return jsonify(cache['historical']['data'][country])
+    try:
+        _, resolution = downsample_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        fmt = binary_format(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 406
+    
+    store = cache['timeseries']['store']
+    if store is None:
+        return jsonify({"error": "Historical data not available"}), 503
+    
+    if countries:
+        names = [find_series_name(store, c.strip()) for c in countries.split(',')]
+        names = [name for name in names if name is not None]
+    else:
+        names = store.countries
+    
+    # All rows share one date axis, so the block is sliced and thinned in one go
+    dates, series = store.block(names, None if days == 'all' else int(days))
+    dates, series = downsample_arrays(dates, series, resolution=resolution)
+    if fmt:
+        return columnar_response(fmt, dates, names, series)
+    
+    return jsonify({
+        'dates': dates,
+        'countries': {name: {metric: values[i].tolist() for metric, values in series.items()}
+                      for i, name in enumerate(names)}
+    })
+
+
+@app.route('/api/analytics/<country>')
+def get_country_analytics(country):
+    """API endpoint to get rolling averages, growth and Rt estimates for a country."""
+    days = request.args.get('days', '30')
+    if not (days == 'all' or days.isdigit()):
+        return jsonify({"error": "days must be a number or 'all'"}), 400
+    
+    analytics = get_analytics()
+    if analytics is None:
+        return jsonify({"error": "Historical data not available"}), 503
+    
+    name = find_series_name(analytics.store, country)
+    if name is None:
+        return jsonify({"error": "Country not found"}), 404
+    
+    result = {'country': country if name.lower() == GLOBAL_NAME else name}
+    result.update(analytics.country(name, None if days == 'all' else int(days)))
+    return jsonify(result)
+
+
+@app.route('/api/analytics')
+def get_bulk_analytics():
+    """API endpoint to get analytics for many countries, or every country if none are given."""
+    countries = request.args.get('countries')
+    days = request.args.get('days', '30')
+    if not (days == 'all' or days.isdigit()):
+        return jsonify({"error": "days must be a number or 'all'"}), 400
+    
+    analytics = get_analytics()
+    if analytics is None:
+        return jsonify({"error": "Historical data not available"}), 503
+    
+    if countries:
+        names = [find_series_name(analytics.store, c.strip()) for c in countries.split(',')]
+        names = [name for name in names if name is not None]
+    else:
+        names = analytics.store.countries
+    
+    days = None if days == 'all' else int(days)
+    results = []
+    for name in names:
+        result = {'country': name}
+        result.update(analytics.country(name, days))
+        results.append(result)
+    return jsonify(results)
 
 
 @app.route('/api/vaccine/<country>')
 def get_vaccine(country):
     """API endpoint to get vaccination data for a specific country."""
-    current_time = time.time()
+    try:
+        points, resolution = downsample_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    # Check if we have this country's vaccine data cached and it's not expired
-    if (country not in cache['vaccine']['data'] or 
-            current_time - cache['vaccine']['timestamp'] > CACHE_EXPIRATION):
-        
-        try:
-            # Fetch vaccine data for the country
-            response = requests.get(f"{COVID_VACCINE_ENDPOINT}/{country}")
-            
-            if response.status_code == 200:
-                cache['vaccine']['data'][country] = response.json()
-                cache['vaccine']['timestamp'] = current_time
-                
-                # Save to file for backup
-                os.makedirs(f"{DATA_DIR}/vaccine", exist_ok=True)
-                with open(f"{DATA_DIR}/vaccine/{country}_data.json", 'w') as f:
-                    json.dump(cache['vaccine']['data'][country], f)
-            else:
-                return jsonify({"error": "Vaccine data not available"}), 404
-                
-        except Exception as e:
-            print(f"Error fetching vaccine data: {e}")
-            
-            # Try to load from backup file
-            if os.path.exists(f"{DATA_DIR}/vaccine/{country}_data.json"):
-                with open(f"{DATA_DIR}/vaccine/{country}_data.json", 'r') as f:
-                    cache['vaccine']['data'][country] = json.load(f)
-                    cache['vaccine']['timestamp'] = current_time
-            else:
-                return jsonify({"error": "Failed to fetch vaccine data"}), 500
+    return vaccine_part(country, points, resolution)
+
+
+def vaccine_part(country, points, resolution):
+    """Return (body, status) for one country's vaccination timeline."""
+    # Upstream's default last 30 days, sliced out of the local store when it has the country
+    store = cache['vaccines']['store']
+    name = find_series_name(store, country) if store is not None else None
+    if name is not None and store.has(name):
+        timeline = downsample_timeline(store.timeline(name, 30), points, resolution)
+        return {'country': name, 'timeline': timeline}, 200
+    
+    # Otherwise fetched through the shared cache, falling back to the backup file
+    try:
+        vaccine_data = repository.vaccine(country)
+    except requests.exceptions.HTTPError:
+        return {"error": "Vaccine data not available"}, 404
+    except Exception as e:
+        print(f"Error fetching vaccine data: {e}")
+        return {"error": "Failed to fetch vaccine data"}, 500
+    
+    if isinstance(vaccine_data, dict) and 'timeline' in vaccine_data:
+        vaccine_data = dict(vaccine_data,
+                            timeline=downsample_timeline(vaccine_data['timeline'], points, resolution))
+    
+    return vaccine_data, 200
+
+
+@app.route('/api/vaccine')
+def get_bulk_vaccine():
+    """API endpoint to get aligned vaccination series for many countries, or every country if none are given.
+    
+    ?metrics= picks from total, daily, daily7 (7-day average of daily doses)
+    and perHundred (doses per hundred people); all of them by default.
+    """
+    countries = request.args.get('countries')
+    days = request.args.get('days', '30')
+    if not (days == 'all' or days.isdigit()):
+        return jsonify({"error": "days must be a number or 'all'"}), 400
+    metrics = [m.strip() for m in request.args.get('metrics', ','.join(VACCINE_METRICS)).split(',') if m.strip()]
+    unknown = [m for m in metrics if m not in VACCINE_METRICS]
+    if unknown:
+        return jsonify({"error": f"Unknown metrics: {', '.join(unknown)}"}), 400
+    if 'points' in request.args:
+        return jsonify({"error": "points is not supported for many countries; use resolution"}), 400
     
-    return jsonify(cache['vaccine']['data'][country])
+    try:
+        _, resolution = downsample_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        fmt = binary_format(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 406
+    
+    store = cache['vaccines']['store']
+    if store is None:
+        return jsonify({"error": "Vaccine data not available"}), 503
+    
+    if countries:
+        names = [find_series_name(store, c.strip()) for c in countries.split(',')]
+        names = [name for name in names if name is not None and store.has(name)]
+    else:
+        names = store.countries
+    
+    # Every derived series was computed when the store was built; this only slices and thins
+    dates, series = store.block(names, None if days == 'all' else int(days), metrics)
+    dates, series = downsample_arrays(dates, series, resolution=resolution, flows=VACCINE_FLOWS)
+    if fmt:
+        return columnar_response(fmt, dates, names, series)
+    
+    series = {metric: np.round(values, 2) if values.dtype.kind == 'f' else values
+              for metric, values in series.items()}
+    return jsonify({
+        'dates': dates,
+        'countries': {name: {metric: values[i].tolist() for metric, values in series.items()}
+                      for i, name in enumerate(names)}
+    })
+
+
+@app.route('/api/cache-stats')
+def cache_stats():
+    """API endpoint to report hit/miss/eviction counters for the upstream data caches."""
+    return jsonify(repository.stats())
 
 
 @app.route('/api/compare')
@@ -220,145 +807,134 @@ def compare_countries():
         return jsonify({"error": "No countries specified"}), 400
         
     countries_list = countries.split(',')
-    current_time = time.time()
-    
-    # If cache is expired or empty, fetch new data
-    if (cache['countries']['data'] is None or 
-            current_time - cache['countries']['timestamp'] > CACHE_EXPIRATION):
-        fetch_covid_data()
-    
-    if cache['countries']['data']:
-        comparison_data = []
+    # Serve cached data, refreshing it in the background if it has expired
+    if ensure_fresh('countries'):
+        # Resolve names through the index, then read the rows from the snapshot
+        names = []
         for country_name in countries_list:
-            country_data = None
-            for c in cache['countries']['data']:
-                if c['country'].lower() == country_name.lower():
-                    country_data = {
-                        'country': c['country'],
-                        'cases': c['cases'],
-                        'deaths': c['deaths'],
-                        'recovered': c['recovered'],
-                        'active': c['active'],
-                        'casesPerOneMillion': c['casesPerOneMillion'],
-                        'deathsPerOneMillion': c['deathsPerOneMillion'],
-                        'tests': c['tests'],
-                        'testsPerOneMillion': c['testsPerOneMillion'],
-                        'population': c['population']
-                    }
-                    comparison_data.append(country_data)
-                    break
+            c = find_country(country_name)
+            if c:
+                names.append(c['country'])
+        comparison_data = frame_rows(country_table('frame'), names, COMPARE_COLUMNS)
                     
         return jsonify(comparison_data)
     
     return jsonify({"error": "Data not available"}), 500
 
 
+@app.route('/api/risk-assessment')
+def risk_ranking():
+    """API endpoint to get precomputed risk assessments for many countries, highest risk first."""
+    countries = request.args.get('countries')
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    
+    # Serve cached data, refreshing it in the background if it has expired
+    if not ensure_fresh('countries') or country_table('risk') is None:
+        return jsonify({"error": "Data not available"}), 500
+    
+    table = country_table('risk')
+    if countries:
+        names = []
+        for country_name in countries.split(','):
+            c = find_country(country_name)
+            if c:
+                names.append(c['country'])
+        table = table[table.index.isin(names)]
+    if limit:
+        table = table.head(limit)
+    
+    return jsonify(table.to_dict('records'))
+
+
 @app.route('/api/risk-assessment/<country>')
 def risk_assessment(country):
     """API endpoint to provide a risk assessment for a country."""
-    current_time = time.time()
+    return risk_part(country)
+
+
+def risk_part(country):
+    """Return (body, status) for one country's risk assessment."""
+    # Serve cached data, refreshing it in the background if it has expired
+    if not ensure_fresh('countries'):
+        # Refreshing keeps failing and the data is past its hard expiry
+        return {"error": "Data temporarily unavailable"}, 503
     
-    # If cache is expired or empty, fetch new data
-    if (cache['countries']['data'] is None or 
-            current_time - cache['countries']['timestamp'] > CACHE_EXPIRATION):
-        fetch_covid_data()
-    
-    if cache['countries']['data']:
-        country_data = None
-        for c in cache['countries']['data']:
-            if c['country'].lower() == country.lower():
-                country_data = c
-                break
-                
-        if country_data:
-            # Calculate risk score based on various metrics
-            # This is a simplified example - you can develop a more sophisticated algorithm
-            active_per_million = country_data['active'] / country_data['population'] * 1000000
-            case_fatality_rate = country_data['deaths'] / country_data['cases'] * 100 if country_data['cases'] > 0 else 0
-            
-            risk_score = 0
-            
-            # Active cases per million contribution to risk
-            if active_per_million > 10000:
-                risk_score += 5
-            elif active_per_million > 5000:
-                risk_score += 4
-            elif active_per_million > 1000:
-                risk_score += 3
-            elif active_per_million > 500:
-                risk_score += 2
-            elif active_per_million > 100:
-                risk_score += 1
-                
-            # Case fatality rate contribution to risk
-            if case_fatality_rate > 5:
-                risk_score += 5
-            elif case_fatality_rate > 3:
-                risk_score += 4
-            elif case_fatality_rate > 2:
-                risk_score += 3
-            elif case_fatality_rate > 1:
-                risk_score += 2
-            elif case_fatality_rate > 0.5:
-                risk_score += 1
-                
-            # Determine risk level
-            risk_level = ""
-            if risk_score >= 8:
-                risk_level = "Very High"
-            elif risk_score >= 6:
-                risk_level = "High"
-            elif risk_score >= 4:
-                risk_level = "Moderate"
-            elif risk_score >= 2:
-                risk_level = "Low"
-            else:
-                risk_level = "Very Low"
-                
-            return jsonify({
-                "country": country_data['country'],
-                "riskScore": risk_score,
-                "riskLevel": risk_level,
-                "activeCasesPerMillion": active_per_million,
-                "caseFatalityRate": case_fatality_rate,
-                "timestamp": int(time.time() * 1000)
-            })
+    country_data = find_country(country)
+    
+    if country_data:
+        # Scores for every country are computed once per refresh in risk.py
+        row = country_table('risk').loc[country_data['country']]
+    
+        return {
+            "country": country_data['country'],
+            "riskScore": int(row['riskScore']),
+            "riskLevel": row['riskLevel'],
+            "activeCasesPerMillion": float(row['activeCasesPerMillion']),
+            "caseFatalityRate": float(row['caseFatalityRate']),
+            "rank": int(row['rank']),
+            "timestamp": int(time.time() * 1000)
+        }, 200
     
     # Country not found
-    return jsonify({"error": "Country not found"}), 404
+    return {"error": "Country not found"}, 404
 
 
 @app.route('/api/export/csv/<country>')
 def export_csv(country):
     """API endpoint to export country data as CSV."""
-    current_time = time.time()
+    # Serve cached data, refreshing it in the background if it has expired
+    if not ensure_fresh('countries'):
+        # Refreshing keeps failing and the data is past its hard expiry
+        return jsonify({"error": "Data temporarily unavailable"}), 503
     
-    # If cache is expired or empty, fetch new data
-    if (cache['countries']['data'] is None or 
-            current_time - cache['countries']['timestamp'] > CACHE_EXPIRATION):
-        fetch_covid_data()
-    
-    if cache['countries']['data']:
-        country_data = None
-        for c in cache['countries']['data']:
-            if c['country'].lower() == country.lower():
-                country_data = c
-                break
-                
-        if country_data:
-            # Convert to DataFrame for easy CSV conversion
-            df = pd.DataFrame([country_data])
-            csv_data = df.to_csv(index=False)
-            
-            # Return CSV data
-            return csv_data, 200, {
-                'Content-Type': 'text/csv',
-                'Content-Disposition': f'attachment; filename={country}_covid_data.csv'
-            }
+    country_data = find_country(country)
+    
+    if country_data:
+        # Slice the country's row out of the columnar snapshot
+        df = country_table('frame').loc[[country_data['country']]]
+        csv_data = df.to_csv(index=False)
+    
+        # Return CSV data
+        return csv_data, 200, {
+            'Content-Type': 'text/csv',
+            'Content-Disposition': f'attachment; filename={country}_covid_data.csv'
+        }
     
     # Country not found
     return jsonify({"error": "Country not found"}), 404
 
 
+@app.route('/api/export/bulk')
+def export_bulk():
+    """API endpoint to stream many countries' full history as CSV or Parquet."""
+    countries = request.args.get('countries')
+    days = request.args.get('days', 'all')
+    fmt = request.args.get('format', 'csv')
+    if not (days == 'all' or (days.isdigit() and int(days) > 0)):
+        return jsonify({"error": "days must be a positive number or 'all'"}), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    if fmt == 'parquet' and not PARQUET_AVAILABLE:
+        return jsonify({"error": "Parquet export needs the pyarrow package"}), 406
+    
+    store = cache['timeseries']['store']
+    if store is None:
+        return jsonify({"error": "Historical data not available"}), 503
+    
+    if countries:
+        names = [find_series_name(store, c.strip()) for c in countries.split(',')]
+        names = [name for name in names if name is not None]
+    else:
+        names = store.countries
+    
+    # Rows are encoded a chunk of countries at a time while the response is sent
+    rows = iter_export(fmt, store, names, None if days == 'all' else int(days), EXPORT_CHUNK_COUNTRIES)
+    return Response(rows, mimetype=EXPORT_FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename=covid_historical.{fmt}'
+    })
+
+
 if __name__ == '__main__':
     app.run(host=HOST, port=PORT, debug=DEBUG)
\ No newline at end of file
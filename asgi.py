@@ -0,0 +1,338 @@
+"""
+Async (ASGI) serving mode for the COVID-19 tracker.
+
+The Flask apps answer every request the same way in this mode. What changes
+is who waits on disease.sh: for the endpoints that go upstream on a cache
+miss, an async gateway fetches the missing entry through one shared async
+connection pool and stores it in the repository cache, then hands the
+request to Flask, which answers from that cache without blocking a worker
+thread on the round trip. Thousands of upstream waits can be in flight on
+one event loop, and concurrent misses for the same entry share one fetch.
+The /api/stream event stream is served on the event loop too, so idle
+subscribers cost no thread at all.
+
+Needs aiohttp, a2wsgi and an ASGI server such as uvicorn:
+    uvicorn --factory asgi:create_app --port 5000          # app.py
+    uvicorn --factory asgi:create_index_app --port 5000    # index.py
+"""
+
+import asyncio
+import json
+import random
+import re
+import time
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import MultiDict
+
+from broadcast import catch_up, open_stream
+from config import *
+from country_index import lookup_country
+from downsample import downsample_args
+from metrics import UPSTREAM_SECONDS, upstream_endpoint
+from repository import repository
+from upstream import RETRY_STATUSES, CircuitOpenError
+
+try:
+    import aiohttp
+    from a2wsgi import WSGIMiddleware
+except ImportError:  # the async mode is optional; it needs aiohttp and a2wsgi
+    aiohttp = WSGIMiddleware = None
+
+
+class AsyncUpstreamClient:
+    """Async counterpart of UpstreamClient sharing its circuit breaker, with one connection pool."""
+
+    def __init__(self, client=repository.client, pool_size=ASYNC_UPSTREAM_POOL_SIZE,
+                 max_retries=UPSTREAM_MAX_RETRIES):
+        self.sync_client = client
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.session = None
+
+    async def get_json(self, path, params=None):
+        """GET a path and return (status, decoded JSON or None), retrying transient failures.
+
+        Raises aiohttp.ClientError or asyncio.TimeoutError once retries are
+        exhausted, or CircuitOpenError while the circuit is open.
+        """
+        if self.session is None:
+            # Created on first use so it belongs to the server's event loop
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(sock_connect=UPSTREAM_CONNECT_TIMEOUT,
+                                              sock_read=UPSTREAM_READ_TIMEOUT),
+                connector=aiohttp.TCPConnector(limit=self.pool_size))
+        breaker = self.sync_client.breaker
+        if not breaker.allow_request():
+            raise CircuitOpenError(f"Upstream circuit open, skipping {path}")
+
+        url = self.sync_client.url(path)
+        endpoint = upstream_endpoint(path)
+        params = {k: str(v) for k, v in params.items()} if params else None
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                async with self.session.get(url, params=params) as response:
+                    status = response.status
+                    data = await response.json(content_type=None) if status < 400 else None
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint, 'error')
+                if attempt >= self.max_retries:
+                    breaker.record_failure()
+                    raise
+            else:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint, status)
+                if status not in RETRY_STATUSES:
+                    breaker.record_success()
+                    return status, data
+                if attempt >= self.max_retries:
+                    breaker.record_failure()
+                    return status, data
+
+            # Full jitter, as in UpstreamClient
+            await asyncio.sleep(random.uniform(0, min(UPSTREAM_BACKOFF_MAX,
+                                                      UPSTREAM_BACKOFF_BASE * (2 ** attempt))))
+            attempt += 1
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class AsyncGateway:
+    """ASGI app filling the repository cache asynchronously in front of a Flask app.
+
+    routes is a list of (pattern, resolve) pairs. resolve(name, args) is
+    called with the single path segment the pattern captured and returns
+    None when Flask can answer without upstream, or (request, error): the
+    repository *_request() tuple to fetch, and error(status) building the
+    (status, body) Flask itself would return when upstream answers with an
+    HTTP error status, or with None when upstream cannot be reached and
+    there is no backup.
+
+    stream, if given, is (path, broadcaster, check): the gateway serves that
+    path as an event stream itself, calling check() every
+    SNAPSHOT_CHECK_INTERVAL seconds to pick up new snapshots while any
+    stream is open.
+    """
+
+    def __init__(self, flask_app, routes, repository=repository, stream=None):
+        if aiohttp is None:
+            raise RuntimeError("The async serving mode needs the aiohttp and a2wsgi packages")
+        # Flask only runs once upstream data is cached, so a few threads go a long way
+        self.wsgi = WSGIMiddleware(flask_app, workers=ASYNC_WSGI_THREADS)
+        self.routes = [(re.compile(pattern), resolve) for pattern, resolve in routes]
+        self.repository = repository
+        self.client = AsyncUpstreamClient(repository.client)
+        # Fetches in flight, keyed by (namespace, key), shared by concurrent misses
+        self.inflight = {}
+        self.stream_spec = stream
+        self.checker = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            if self.stream_spec is not None and scope['path'] == self.stream_spec[0]:
+                return await self.stream(scope, receive, send)
+            for pattern, resolve in self.routes:
+                match = pattern.match(scope['path'])
+                if match is None:
+                    continue
+                args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+                spec = resolve(match.group(1), args)
+                if spec is not None:
+                    request, error = spec
+                    failure = await self.prefetch(request)
+                    if failure is not False:
+                        return await self.respond(send, *error(failure))
+                break
+
+        await self.wsgi(scope, receive, send)
+
+    async def prefetch(self, request):
+        """Make sure the cache holds a request's entry.
+
+        Returns False once it does, otherwise the upstream error status, or
+        None if upstream could not be reached and there is no backup.
+        """
+        namespace, key = request[0], request[1]
+        cache = self.repository.caches[namespace]
+        if await self.run(cache.get, key) is not None:
+            return False
+
+        task = self.inflight.get((namespace, key))
+        if task is None:
+            task = asyncio.ensure_future(self.fetch(request))
+            self.inflight[(namespace, key)] = task
+            task.add_done_callback(lambda _: self.inflight.pop((namespace, key), None))
+        return await asyncio.shield(task)
+
+    async def fetch(self, request):
+        namespace, key, path, params, backup = request
+        try:
+            status, data = await self.client.get_json(path, params=params)
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            print(f"Error fetching {path}: {e}")
+            data = await asyncio.to_thread(self.repository.fallback_json, namespace, key, backup)
+            return False if data is not None else None
+
+        if status >= 400:
+            return status
+        # Writing the backup touches the disk, so it never runs on the event loop
+        await asyncio.to_thread(self.repository.store_json, namespace, key, data, backup)
+        return False
+
+    async def stream(self, scope, receive, send):
+        """Serve the event stream until the client disconnects, as the Flask view would."""
+        _, broadcaster, check = self.stream_spec
+        if self.checker is None:
+            self.checker = asyncio.ensure_future(self.check_snapshots(check))
+        headers = dict(scope['headers'])
+        last_id = headers[b'last-event-id'].decode('latin-1') if b'last-event-id' in headers else None
+
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream; charset=utf-8'),
+                                (b'cache-control', b'no-cache'),
+                                (b'x-accel-buffering', b'no'),
+                                (b'access-control-allow-origin', b'*')]})
+        text, seen = open_stream(broadcaster, last_id, STREAM_RETRY)
+        await send({'type': 'http.response.body', 'body': text.encode('utf-8'), 'more_body': True})
+
+        disconnected = asyncio.ensure_future(self.wait_disconnect(receive))
+        try:
+            while True:
+                waiting = asyncio.ensure_future(broadcaster.wait_async(seen, SNAPSHOT_CHECK_INTERVAL))
+                await asyncio.wait((disconnected, waiting), return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    waiting.cancel()
+                    return
+                text, seen = catch_up(broadcaster, seen, waiting.result())
+                await send({'type': 'http.response.body', 'body': (text or ': keepalive\n\n').encode('utf-8'),
+                            'more_body': True})
+        finally:
+            disconnected.cancel()
+
+    async def wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def check_snapshots(self, check):
+        # One thread hop per interval for the whole process, however many streams are open
+        while True:
+            try:
+                await asyncio.to_thread(check)
+            except Exception as e:
+                print(f"Error checking for snapshots: {e}")
+            await asyncio.sleep(SNAPSHOT_CHECK_INTERVAL)
+
+    async def run(self, func, *args):
+        # Only the in-process cache is cheap enough to read on the event loop
+        if CACHE_BACKEND == 'memory':
+            return func(*args)
+        return await asyncio.to_thread(func, *args)
+
+    async def respond(self, send, status, body):
+        # Same body and CORS header as the Flask error responses
+        payload = json.dumps(body, separators=(',', ':')).encode('utf-8') + b'\n'
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json'),
+                                (b'content-length', str(len(payload)).encode('ascii')),
+                                (b'access-control-allow-origin', b'*')]})
+        await send({'type': 'http.response.body', 'body': payload})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.checker is not None:
+                    self.checker.cancel()
+                await self.client.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def valid_downsampling(args):
+    """Return True if the ?points/?resolution args are valid; Flask reports them otherwise."""
+    try:
+        downsample_args(args)
+        return True
+    except ValueError:
+        return False
+
+
+def create_app():
+    """Build the gateway in front of app.py."""
+    import app as main
+
+    def historical(country, args):
+        days = args.get('days', '30')
+        store = main.cache['timeseries']['store']
+        if not valid_downsampling(args):
+            return None
+        if store is not None and (days == 'all' or days.isdigit()) and main.find_series_name(store, country):
+            return None
+        return repository.historical_request(country, days), lambda status: (
+            (404, {"error": "Historical data not available"}) if status is not None
+            else (500, {"error": "Failed to fetch historical data"}))
+
+    def vaccine(country, args):
+        store = main.cache['vaccines']['store']
+        if not valid_downsampling(args):
+            return None
+        if store is not None and store.has(main.find_series_name(store, country) or ''):
+            return None
+        return repository.vaccine_request(country), lambda status: (
+            (404, {"error": "Vaccine data not available"}) if status is not None
+            else (500, {"error": "Failed to fetch vaccine data"}))
+
+    return AsyncGateway(main.app, [
+        (r'^/api/historical/([^/]+)$', historical),
+        (r'^/api/vaccine/([^/]+)$', vaccine),
+    ], stream=('/api/stream', main.broadcaster, main.sync_snapshots))
+
+
+def create_index_app():
+    """Build the gateway in front of index.py."""
+    import index
+
+    def country_stats(country, args):
+        if index.cache.get(f'country_{country}') is not None:
+            return None
+        return repository.country_request(country), lambda status: (
+            500, {"error": f"Failed to fetch data for {country}"})
+
+    def historical(country, args):
+        days = args.get('days', 30, type=int)
+        if index.cache.get(f'historical_{country}_{days}') is not None or not valid_downsampling(args):
+            return None
+        store = index.timeseries['store']
+        if store is not None and days > 0:
+            if country.lower() in store.rows or store.has(country):
+                return None
+            risk = index.cache.get('risk_table')
+            record = lookup_country(risk[0], country) if risk is not None else None
+            if record is not None and store.has(record['country']):
+                return None
+        return repository.historical_request(country, days), lambda status: (
+            500, {"error": f"Failed to fetch historical data for {country}"})
+
+    def vaccine(country, args):
+        if index.cache.get(f'vaccine_{country}') is not None or not valid_downsampling(args):
+            return None
+        store = index.vaccines['store']
+        if store is not None and (country.lower() in store.rows or store.has(country)):
+            return None
+        return repository.vaccine_request(country, 'all'), lambda status: (
+            500, {"error": f"Failed to fetch vaccine data for {country}"})
+
+    return AsyncGateway(index.app, [
+        (r'^/api/country/([^/]+)$', country_stats),
+        (r'^/api/historical/([^/]+)$', historical),
+        (r'^/api/vaccine/([^/]+)$', vaccine),
+    ])
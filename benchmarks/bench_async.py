@@ -0,0 +1,132 @@
+"""
+Load test: WSGI (gunicorn threads) vs the async ASGI mode under a cold cache.
+
+Every request asks app.py for a historical range it has not cached yet, so
+each one needs an upstream round trip to the local stub, which adds
+--latency seconds to every response. Both servers run as one process.
+
+Run from the project root (needs gunicorn, uvicorn, aiohttp and a2wsgi):
+    python benchmarks/bench_async.py --requests 2000 --concurrency 200 --latency 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+with open(os.path.join(ROOT, 'data', 'countries_data.json'), 'r') as f:
+    COUNTRIES = [c['country'] for c in json.load(f)]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).close()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+def start_server(mode, port, upstream_port, threads, workdir):
+    env = dict(os.environ, PYTHONPATH=ROOT, EMBEDDED_INGEST='false',
+               COVID_API_BASE_URL=f"http://127.0.0.1:{upstream_port}/v3/covid-19")
+    if mode == 'wsgi':
+        command = ['gunicorn', '--workers', '1', '--threads', str(threads),
+                   '--bind', f"127.0.0.1:{port}", 'app:app']
+    else:
+        command = ['uvicorn', '--factory', 'asgi:create_app', '--port', str(port),
+                   '--no-access-log', '--log-level', 'warning']
+    # An empty working directory gives the server an empty data dir, so every cache starts cold
+    process = subprocess.Popen(command, cwd=workdir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_until_up(f"http://127.0.0.1:{port}/api/cache-stats")
+    return process
+
+
+async def load(port, total, concurrency):
+    """Fire total cold-cache requests, at most concurrency at a time; return latencies and errors."""
+    latencies = []
+    errors = 0
+    queue = iter(range(total))
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(f"http://127.0.0.1:{port}", connector=connector) as session:
+        async def user():
+            nonlocal errors
+            for i in queue:
+                # A distinct (country, days) pair per request misses every cache
+                country = COUNTRIES[i % len(COUNTRIES)]
+                days = 30 + i // len(COUNTRIES)
+                start = time.perf_counter()
+                try:
+                    async with session.get(f"/api/historical/{country}", params={'days': str(days)}) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return elapsed, sorted(latencies), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds the stub adds to every response')
+    parser.add_argument('--threads', type=int, default=16, help='gunicorn threads in WSGI mode')
+    parser.add_argument('--modes', default='wsgi,asgi')
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    stub = subprocess.Popen([sys.executable, os.path.join(ROOT, 'benchmarks', 'stub_upstream.py'),
+                             '--port', str(upstream_port), '--latency', str(args.latency)],
+                            stdout=subprocess.DEVNULL)
+    try:
+        wait_until_up(f"http://127.0.0.1:{upstream_port}/v3/covid-19/all")
+        print(f"{args.requests} cold requests, {args.concurrency} concurrent, "
+              f"{args.latency * 1000:.0f} ms upstream latency")
+        for mode in args.modes.split(','):
+            with tempfile.TemporaryDirectory() as workdir:
+                port = free_port()
+                server = start_server(mode, port, upstream_port, args.threads, workdir)
+                try:
+                    elapsed, latencies, errors = asyncio.run(load(port, args.requests, args.concurrency))
+                finally:
+                    server.terminate()
+                    server.wait()
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[int(len(latencies) * 0.95)] * 1000
+            label = f"{mode} ({args.threads} threads)" if mode == 'wsgi' else mode
+            print(f"{label:20s} {args.requests / elapsed:8.1f} req/s   p50 {p50:7.0f} ms   "
+                  f"p95 {p95:7.0f} ms   errors {errors}")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark: linear scan vs hashed country index.
+
+Run from the project root:
+    python benchmarks/bench_country_index.py
+"""
+
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from country_index import build_country_index, lookup_country
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         'data', 'countries_data.json')
+
+
+def scan(countries, name):
+    """The original per-request lookup from app.py."""
+    for c in countries:
+        if c['country'].lower() == name.lower():
+            return c
+    return None
+
+
+def main():
+    with open(DATA_FILE, 'r') as f:
+        countries = json.load(f)
+
+    index = build_country_index(countries)
+    names = [c['country'] for c in countries]
+    random.seed(42)
+    compare_requests = [random.sample(names, 5) for _ in range(200)]
+
+    number = 200
+    print(f"{len(countries)} countries, {len(index)} index keys")
+
+    build = timeit.timeit(lambda: build_country_index(countries), number=number) / number
+    print(f"build index:            {build * 1e6:10.2f} us")
+
+    t_scan = timeit.timeit(lambda: [scan(countries, n) for n in names], number=number) / number / len(names)
+    t_index = timeit.timeit(lambda: [lookup_country(index, n) for n in names], number=number) / number / len(names)
+    print(f"single lookup (scan):   {t_scan * 1e6:10.2f} us")
+    print(f"single lookup (index):  {t_index * 1e6:10.2f} us   ({t_scan / t_index:.0f}x)")
+
+    def compare_scan():
+        for request_names in compare_requests:
+            [scan(countries, n) for n in request_names]
+
+    def compare_index():
+        for request_names in compare_requests:
+            [lookup_country(index, n) for n in request_names]
+
+    t_scan = timeit.timeit(compare_scan, number=20) / 20 / len(compare_requests)
+    t_index = timeit.timeit(compare_index, number=20) / 20 / len(compare_requests)
+    print(f"5-country compare (scan):  {t_scan * 1e6:10.2f} us")
+    print(f"5-country compare (index): {t_index * 1e6:10.2f} us   ({t_scan / t_index:.0f}x)")
+
+
+if __name__ == '__main__':
+    main()
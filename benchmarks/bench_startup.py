@@ -0,0 +1,154 @@
+"""
+Startup benchmark: import time of the web apps and time to the first 200.
+
+Import time is measured in a fresh interpreter per run, along with which
+heavy optional modules the import pulled in. Time to first 200 is measured
+from launching a one-worker gunicorn server until /api/global answers 200,
+in three situations:
+
+    cold      empty data dir, upstream reachable (the stub, with --latency)
+    warm      a published snapshot on disk, upstream reachable
+    offline   a published snapshot on disk, upstream unreachable
+
+The warm cases also time the first /api/risk-assessment, which is the
+first request to need pandas.
+
+Run from the project root (needs gunicorn):
+    python benchmarks/bench_startup.py --runs 5 --latency 0.5
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules the apps should only import when a request needs them
+HEAVY_MODULES = ('pandas', 'pyarrow', 'redis', 'apscheduler', 'matplotlib')
+
+IMPORT_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(m for m in {heavy!r} if m in sys.modules) or 'none')
+"""
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def server_env(upstream_port):
+    return dict(os.environ, PYTHONPATH=ROOT, EMBEDDED_INGEST='true',
+                COVID_API_BASE_URL=f"http://127.0.0.1:{upstream_port}/v3/covid-19")
+
+
+def get_status(url):
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+
+def time_import(module, workdir):
+    """Return (seconds, heavy modules loaded) for importing module in a fresh interpreter."""
+    env = dict(os.environ, PYTHONPATH=ROOT, EMBEDDED_INGEST='false')
+    output = subprocess.run([sys.executable, '-c', IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                            cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout
+    elapsed, loaded = output.split()[-2:]
+    return float(elapsed), loaded
+
+
+def time_first_200(workdir, upstream_port, timeout=120):
+    """Start gunicorn in workdir; return (seconds to the first 200 from /api/global, first risk request seconds)."""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(['gunicorn', '--workers', '1', '--threads', '4', '--bind', f"127.0.0.1:{port}",
+                                'app:app'], cwd=workdir, env=server_env(upstream_port),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = start + timeout
+        while get_status(f"http://127.0.0.1:{port}/api/global") != 200:
+            if time.perf_counter() > deadline or process.poll() is not None:
+                raise RuntimeError("server never answered 200")
+            time.sleep(0.01)
+        first_200 = time.perf_counter() - start
+
+        risk_start = time.perf_counter()
+        get_status(f"http://127.0.0.1:{port}/api/risk-assessment?limit=10")
+        return first_200, time.perf_counter() - risk_start
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def publish_snapshot(workdir, upstream_port):
+    """Run one ingest pass in workdir so it holds a snapshot and both stores."""
+    env = dict(server_env(upstream_port), EMBEDDED_INGEST='false')
+    subprocess.run([sys.executable, os.path.join(ROOT, 'ingest.py'), '--once'], cwd=workdir, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.5, help='seconds the stub adds to every response')
+    args = parser.parse_args()
+
+    upstream_port = free_port()
+    stub = subprocess.Popen([sys.executable, os.path.join(ROOT, 'benchmarks', 'stub_upstream.py'),
+                             '--port', str(upstream_port), '--latency', str(args.latency)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with tempfile.TemporaryDirectory() as scratch:
+            print(f"import time, median of {args.runs} fresh interpreters")
+            for module in ('app', 'index'):
+                runs = [time_import(module, scratch) for _ in range(args.runs)]
+                median = statistics.median(elapsed for elapsed, _ in runs)
+                print(f"  {module:10s} {median * 1000:7.0f} ms   heavy modules loaded: {runs[-1][1]}")
+
+            template = os.path.join(scratch, 'template')
+            os.makedirs(template)
+            while get_status(f"http://127.0.0.1:{upstream_port}/v3/covid-19/all") != 200:
+                time.sleep(0.1)
+            publish_snapshot(template, upstream_port)
+
+            print(f"\ntime to first 200 from /api/global, median of {args.runs} server starts "
+                  f"({args.latency * 1000:.0f} ms upstream latency)")
+            offline_port = free_port()  # nothing listens here
+            scenarios = [('cold', None, upstream_port), ('warm', template, upstream_port),
+                         ('offline', template, offline_port)]
+            for name, source, port in scenarios:
+                results = []
+                for i in range(args.runs):
+                    workdir = os.path.join(scratch, f"{name}-{i}")
+                    if source:
+                        shutil.copytree(source, workdir)
+                    else:
+                        os.makedirs(workdir)
+                    results.append(time_first_200(workdir, port))
+                first_200 = statistics.median(r[0] for r in results)
+                risk = statistics.median(r[1] for r in results)
+                print(f"  {name:10s} {first_200 * 1000:7.0f} ms   first risk request {risk * 1000:6.0f} ms")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""
+Local stand-in for the disease.sh API, serving the bundled data files.
+
+Point either app at it with the COVID_API_BASE_URL environment variable:
+    python benchmarks/stub_upstream.py --port 8765 --latency 0.2
+    COVID_API_BASE_URL=http://127.0.0.1:8765/v3/covid-19 python app.py
+
+Historical and vaccine timelines are synthesized from the current totals so
+every country has a full-length series. --fail-rate makes a share of
+requests answer 503 to exercise retries and the circuit breaker.
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+PREFIX = '/v3/covid-19'
+FIRST_DAY = date(2020, 1, 22)
+TOTAL_DAYS = 1100
+
+with open(os.path.join(DATA_DIR, 'countries_data.json'), 'r') as f:
+    COUNTRIES = json.load(f)
+with open(os.path.join(DATA_DIR, 'global_data.json'), 'r') as f:
+    GLOBAL = json.load(f)
+
+DATES = [FIRST_DAY + timedelta(days=i) for i in range(TOTAL_DAYS)]
+DATE_KEYS = [f"{d.month}/{d.day}/{d.year % 100}" for d in DATES]
+
+
+def find_country(name):
+    name = name.lower()
+    for c in COUNTRIES:
+        info = c['countryInfo']
+        if name in (c['country'].lower(), (info.get('iso2') or '').lower(), (info.get('iso3') or '').lower()):
+            return c
+    return None
+
+
+def series(total, days, scale):
+    start = TOTAL_DAYS - days
+    return {DATE_KEYS[i]: int(max(total, 1000) * scale * (i + 1) / TOTAL_DAYS)
+            for i in range(start, TOTAL_DAYS)}
+
+
+def timeline(record, days):
+    return {
+        'cases': series(record['cases'], days, 1),
+        'deaths': series(record['cases'], days, 0.01),
+        'recovered': series(record['cases'], days, 0.9),
+    }
+
+
+def lastdays(query, default=30):
+    value = query.get('lastdays', [str(default)])[0]
+    return TOTAL_DAYS if value == 'all' else max(1, min(int(value), TOTAL_DAYS))
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    fail_rate = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.fail_rate and random.random() < self.fail_rate:
+            return self.send_json({'message': 'Service unavailable'}, 503)
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [p for p in unquote(url.path)[len(PREFIX):].split('/') if p]
+        not_found = ({'message': 'Country not found or doesn\'t have any cases'}, 404)
+
+        if parts == ['all']:
+            return self.send_json(GLOBAL)
+        if parts == ['countries']:
+            return self.send_json(COUNTRIES)
+        if len(parts) == 2 and parts[0] == 'countries':
+            names = parts[1].split(',')
+            if len(names) > 1:
+                return self.send_json([c for c in map(find_country, names) if c])
+            record = find_country(names[0])
+            return self.send_json(record) if record else self.send_json(*not_found)
+        if parts == ['historical']:
+            days = lastdays(query)
+            return self.send_json([{'country': c['country'], 'province': None,
+                                    'timeline': timeline(c, days)} for c in COUNTRIES])
+        if len(parts) == 2 and parts[0] == 'historical':
+            if parts[1] == 'all':
+                return self.send_json(timeline(GLOBAL, lastdays(query)))
+            record = find_country(parts[1])
+            if record is None:
+                return self.send_json(*not_found)
+            return self.send_json({'country': record['country'], 'province': ['mainland'],
+                                   'timeline': timeline(record, lastdays(query))})
+        if parts == ['vaccine', 'coverage', 'countries']:
+            days = lastdays(query)
+            return self.send_json([{'country': c['country'], 'timeline': series(c['population'], days, 2)}
+                                   for c in COUNTRIES])
+        if len(parts) == 4 and parts[:3] == ['vaccine', 'coverage', 'countries']:
+            record = find_country(parts[3])
+            if record is None:
+                return self.send_json(*not_found)
+            return self.send_json({'country': record['country'],
+                                   'timeline': series(record['population'], lastdays(query), 2)})
+        return self.send_json(*not_found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='share of requests answered with 503')
+    args = parser.parse_args()
+
+    StubHandler.latency = args.latency
+    StubHandler.fail_rate = args.fail_rate
+    # A deep accept backlog keeps bursts of new connections from load tests from being dropped
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"Stub upstream on http://{args.host}:{args.port}{PREFIX}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Server-sent event fan-out for data refreshes.
+
+Each web worker keeps one Broadcaster. When the worker starts serving a new
+snapshot it publishes a compact diff (the global totals and the countries
+that changed), and every /api/stream connection wakes up and sends it on.
+Idle connections cost nothing but the wait: threads block on one shared
+condition, and async subscribers share one future per event loop, so the
+async serving mode can hold thousands of them on a single loop.
+"""
+
+import asyncio
+import json
+import threading
+from collections import deque
+
+# Fields that change on every refresh whether or not the figures did; sent only along with real changes
+VOLATILE_FIELDS = {'updated'}
+
+
+def diff_record(old, new):
+    """Return the fields of new that differ from old, or None if only volatile fields changed."""
+    changed = {k: v for k, v in new.items() if k not in old or old[k] != v}
+    if VOLATILE_FIELDS.issuperset(changed):
+        return None
+    return changed
+
+
+def diff_countries(old, new):
+    """Return {country: changed fields} between two countries lists; new countries are sent whole."""
+    previous = {record['country']: record for record in old or []}
+    changes = {}
+    for record in new:
+        before = previous.get(record['country'])
+        changed = record if before is None else diff_record(before, record)
+        if changed:
+            changes[record['country']] = changed
+    return changes
+
+
+def format_event(event, data, event_id=None):
+    """Encode one message in the text/event-stream format."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def open_stream(broadcaster, last_id, retry):
+    """Return (text, last id) to start a stream for a client that has seen last_id (None if new)."""
+    text = f"retry: {int(retry * 1000)}\n\n"
+    if last_id is None:
+        # Tell a new client which version it is looking at, so a reconnect can resume from it
+        last_id = broadcaster.current
+        return text + format_event('ready', {'version': last_id}, last_id), last_id
+    messages = broadcaster.since(last_id)
+    more, last_id = catch_up(broadcaster, last_id, messages)
+    return text + more, last_id
+
+
+def catch_up(broadcaster, last_id, messages):
+    """Return (text, last id) sending messages, as since() returned them, to a client at last_id.
+
+    A client too far behind for the diffs kept gets a 'reset' event telling
+    it to fetch the full datasets again. Returns '' if there is nothing new.
+    """
+    if messages is None:
+        current = broadcaster.current
+        return format_event('reset', {'version': current}, current), current
+    if not messages:
+        return '', last_id
+    return ''.join(format_event('update', data, version) for version, data in messages), messages[-1][0]
+
+
+class Broadcaster:
+    """Keeps the last few diffs and wakes every subscriber when a new one is published.
+
+    Messages are (id, data) pairs, where id is the snapshot version the
+    diff leads to, so a client reconnecting to any worker can say which
+    version it has seen last.
+    """
+
+    def __init__(self, history=24):
+        self.messages = deque(maxlen=history)
+        self.current = None  # version of the data now served
+        self.base = None  # version the oldest diff kept starts from
+        self._condition = threading.Condition()
+        self._futures = {}  # event loop -> future resolved on the next publish
+
+    def reset(self, version):
+        """Serve version without a diff, e.g. the first snapshot loaded; clients that saw another get a reset."""
+        with self._condition:
+            self.messages.clear()
+            self.current = self.base = version
+        self._wake()
+
+    def publish(self, version, data):
+        """Publish the diff leading to version and wake every subscriber."""
+        with self._condition:
+            if len(self.messages) == self.messages.maxlen:
+                self.base = self.messages[0][0]
+            elif not self.messages:
+                self.base = self.current
+            self.messages.append((version, data))
+            self.current = version
+        self._wake()
+
+    def _wake(self):
+        with self._condition:
+            self._condition.notify_all()
+            futures, self._futures = self._futures, {}
+        for loop, future in futures.items():
+            loop.call_soon_threadsafe(lambda f=future: f.done() or f.set_result(None))
+
+    def since(self, last_id):
+        """Return the messages after last_id, or None if last_id is too old to catch up from."""
+        with self._condition:
+            return self._since(last_id)
+
+    def _since(self, last_id):
+        if last_id == self.current:
+            return []
+        ids = [self.base] + [message[0] for message in self.messages]
+        if last_id is None or last_id not in ids:
+            return None
+        return list(self.messages)[ids.index(last_id):]
+
+    def wait(self, last_id, timeout):
+        """Block until there are messages after last_id or timeout seconds pass; return them as since() does."""
+        with self._condition:
+            messages = self._since(last_id)
+            if messages == []:
+                self._condition.wait(timeout)
+                messages = self._since(last_id)
+            return messages
+
+    async def wait_async(self, last_id, timeout):
+        """Event-loop counterpart of wait()."""
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            messages = self._since(last_id)
+            if messages != []:
+                return messages
+            future = self._futures.get(loop)
+            if future is None:
+                future = self._futures[loop] = loop.create_future()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.since(last_id)
@@ -0,0 +1,232 @@
+"""
+Cache backends for the COVID-19 tracker.
+
+Every backend offers the same get/set/add/delete/clear interface with
+per-entry timeouts, so upstream data can be kept in process (TTLCache), in
+a directory shared by every worker on the host (FileCache) or in Redis
+(RedisCache). CACHE_BACKEND picks the one make_cache() builds.
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+
+from config import CACHE_BACKEND, CACHE_DIR, CACHE_REDIS_URL
+from ttl_cache import TTLCache
+
+# Files FileCache is still writing or is about to remove
+TEMP_SUFFIXES = ('.tmp', '.stale')
+
+
+class FileCache:
+    """Cache keeping one JSON file per key in a directory shared between processes.
+
+    Files are written to a temporary name and renamed into place, so readers
+    in other workers never see a partially written entry. Entries are JSON
+    rather than pickles for the same reason as in RedisCache.
+    """
+
+    def __init__(self, directory, default_timeout=300, sweep_interval=300):
+        self.directory = directory
+        self.default_timeout = default_timeout
+        self.sweep_interval = sweep_interval
+        self.swept = time.time()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired."""
+        path = self._path(key)
+        entry = self._read(path)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                self._unlink(path)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, timeout=None):
+        """Store value under key, replacing any existing entry."""
+        path = self._path(key)
+        os.replace(self._write_temp(path, value, timeout), path)
+        if time.time() - self.swept >= self.sweep_interval:
+            self.sweep()
+
+    def sweep(self):
+        """Delete every expired entry, including those no one asks for again."""
+        self.swept = now = time.time()
+        for name in os.listdir(self.directory):
+            if name.endswith(TEMP_SUFFIXES):
+                continue
+            path = os.path.join(self.directory, name)
+            entry = self._read(path)
+            # Entries are renamed into place whole, so an unreadable one is left over from an older format
+            if entry is None or entry[0] < now:
+                self._unlink(path)
+
+    def add(self, key, value, timeout=None):
+        """Store value only if key is missing or expired; return True if it was stored."""
+        path = self._path(key)
+        tmp_path = self._write_temp(path, value, timeout)
+        try:
+            for _ in range(2):
+                try:
+                    # Linking fails if the file exists, which makes this atomic across processes
+                    os.link(tmp_path, path)
+                    return True
+                except FileExistsError:
+                    inode, entry = self._open(path)
+                    if entry is not None and entry[0] >= time.time():
+                        return False
+                    if inode is not None and not self._take_over(path, inode):
+                        return False
+            return False
+        finally:
+            self._unlink(tmp_path)
+    def delete(self, key):
+        """Remove key from the cache if present."""
+        self._unlink(self._path(key))
+
+    def clear(self):
+        """Remove every entry."""
+        for name in os.listdir(self.directory):
+            self._unlink(os.path.join(self.directory, name))
+
+    def stats(self):
+        """Return entry count and hit/miss counters for this process."""
+        return {
+            'backend': 'file',
+            'entries': len([n for n in os.listdir(self.directory) if not n.endswith(TEMP_SUFFIXES)]),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(str(key).encode('utf-8')).hexdigest())
+
+    def _write_temp(self, path, value, timeout):
+        timeout = self.default_timeout if timeout is None else timeout
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump([time.time() + timeout, value], f, separators=(',', ':'))
+        return tmp_path
+
+    def _take_over(self, path, inode):
+        """Remove the expired entry at path with the given inode; return False if another process replaced it first."""
+        # Renaming is atomic, so only one contender can move the entry out of the way
+        tombstone = f"{path}.{os.getpid()}.{threading.get_ident()}.stale"
+        try:
+            os.rename(path, tombstone)
+        except FileNotFoundError:
+            return True
+        try:
+            if os.stat(tombstone).st_ino == inode:
+                return True
+            # What we moved is a newer entry from another contender; put it back
+            try:
+                os.link(tombstone, path)
+            except FileExistsError:
+                pass
+            return False
+        finally:
+            self._unlink(tombstone)
+
+    def _open(self, path):
+        """Return (inode, entry) for the file at path; both are None if it is missing."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                try:
+                    return inode, json.load(f)
+                except ValueError:
+                    return inode, None
+        except OSError:
+            return None, None
+
+    def _read(self, path):
+        return self._open(path)[1]
+
+    def _unlink(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class RedisCache:
+    """Cache kept in Redis, or any server speaking its protocol, shared by every worker and host.
+
+    Values are stored as JSON, never pickled, so whatever else can write to
+    the server cannot make the workers run code. Everything the repository
+    caches is JSON already.
+    """
+
+    def __init__(self, client, prefix='', default_timeout=300):
+        self.client = client
+        self.prefix = prefix
+        self.default_timeout = default_timeout
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired."""
+        data = self.client.get(self.prefix + str(key))
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(data)
+
+    def set(self, key, value, timeout=None):
+        """Store value under key, replacing any existing entry."""
+        self.client.set(self.prefix + str(key), self._dumps(value), ex=self._seconds(timeout))
+
+    def add(self, key, value, timeout=None):
+        """Store value only if key is missing or expired; return True if it was stored."""
+        return bool(self.client.set(self.prefix + str(key), self._dumps(value),
+                                    ex=self._seconds(timeout), nx=True))
+
+    def delete(self, key):
+        """Remove key from the cache if present."""
+        self.client.delete(self.prefix + str(key))
+
+    def clear(self):
+        """Remove every entry under this cache's prefix."""
+        for key in self.client.scan_iter(match=f"{self.prefix}*"):
+            self.client.delete(key)
+
+    def stats(self):
+        """Return hit/miss counters for this process."""
+        return {'backend': 'redis', 'hits': self.hits, 'misses': self.misses}
+
+    def _dumps(self, value):
+        return json.dumps(value, separators=(',', ':'))
+
+    def _seconds(self, timeout):
+        # Redis expiries are whole seconds and must be positive
+        timeout = self.default_timeout if timeout is None else timeout
+        return max(1, math.ceil(timeout))
+
+
+def make_cache(namespace, default_timeout, max_entries=None, max_bytes=None):
+    """Build the CACHE_BACKEND cache for one namespace of keys.
+
+    The entry and byte bounds only apply to the in-process backend; the
+    shared backends are bounded by their own storage.
+    """
+    if CACHE_BACKEND == 'memory':
+        return TTLCache(default_timeout, max_entries, max_bytes)
+    if CACHE_BACKEND == 'file':
+        return FileCache(os.path.join(CACHE_DIR, namespace), default_timeout)
+    if CACHE_BACKEND == 'redis':
+        try:
+            import redis
+        except ImportError:  # redis is optional; only needed for CACHE_BACKEND = "redis"
+            raise RuntimeError("CACHE_BACKEND = 'redis' needs the redis package")
+        return RedisCache(redis.Redis.from_url(CACHE_REDIS_URL), f"covid:{namespace}:", default_timeout)
+    raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND}")
@@ -0,0 +1,139 @@
+"""
+Binary columnar encodings of time series for the COVID-19 tracker.
+
+Time-series endpoints answer in JSON by default. Clients can instead ask,
+through the Accept header or ?format=, for Apache Arrow IPC (when the
+optional pyarrow package is installed) or for a compact typed-array format
+that needs no parser beyond a few lines of JavaScript:
+
+    4 bytes   magic b'CVDC'
+    4 bytes   header length, uint32 little-endian
+    header    UTF-8 JSON, space-padded so the data section is 8-byte aligned
+    data      little-endian columns, each starting on an 8-byte boundary
+
+The header lists the base date, the countries (rows), the day offsets
+column and every metric column with its type, offset into the data
+section and [rows, days] shape, so each column can be viewed in place as
+an Int32Array or BigInt64Array.
+"""
+
+import json
+import struct
+from datetime import date
+from importlib.util import find_spec
+
+import numpy as np
+from flask import Response
+
+from timeseries import parse_date
+
+# pyarrow is optional; the typed-array format is always available. It is
+# imported by the first Arrow response, not at startup.
+ARROW_AVAILABLE = find_spec('pyarrow') is not None
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+COLUMNS_MIMETYPE = 'application/x-covid-columns'
+JSON_MIMETYPE = 'application/json'
+
+COLUMNS_MAGIC = b'CVDC'
+
+BINARY_FORMATS = {'columns': COLUMNS_MIMETYPE, 'arrow': ARROW_MIMETYPE}
+
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+
+def binary_format(request):
+    """Return 'columns' or 'arrow' if the client asked for a binary format, else None.
+
+    An explicit ?format= wins over the Accept header. Raises ValueError if
+    Arrow is asked for by name but pyarrow is not installed.
+    """
+    requested = request.args.get('format')
+    if requested in BINARY_FORMATS:
+        if requested == 'arrow' and not ARROW_AVAILABLE:
+            raise ValueError("Arrow output needs the pyarrow package")
+        return requested
+    if requested:
+        return None
+
+    offers = [JSON_MIMETYPE, COLUMNS_MIMETYPE] + ([ARROW_MIMETYPE] if ARROW_AVAILABLE else [])
+    best = request.accept_mimetypes.best_match(offers, default=JSON_MIMETYPE)
+    return {COLUMNS_MIMETYPE: 'columns', ARROW_MIMETYPE: 'arrow'}.get(best)
+
+
+def narrow(array):
+    """Return an integer array as int32 if every value fits, otherwise as int64."""
+    array = np.asarray(array, dtype=np.int64)
+    if array.size == 0 or (array.min() >= INT32_MIN and array.max() <= INT32_MAX):
+        return array.astype('<i4')
+    return array.astype('<i8')
+
+
+def encode_columns(start, day_offsets, countries, columns, meta=None):
+    """Encode [rows, days] integer columns in the typed-array format described above."""
+    arrays = [('day', narrow(day_offsets))]
+    arrays += [(name, narrow(values)) for name, values in columns.items()]
+
+    described = []
+    chunks = []
+    offset = 0
+    for name, array in arrays:
+        data = array.tobytes()
+        described.append({'name': name, 'type': 'int32' if array.dtype.itemsize == 4 else 'int64',
+                          'offset': offset, 'shape': list(array.shape)})
+        chunks.append(data)
+        padding = -len(data) % 8
+        chunks.append(b'\0' * padding)
+        offset += len(data) + padding
+
+    header = json.dumps({'start': start.isoformat(), 'countries': list(countries),
+                         'columns': described, 'meta': meta or {}},
+                        separators=(',', ':')).encode('utf-8')
+    header += b' ' * (-(len(header) + 8) % 8)
+    return b''.join([COLUMNS_MAGIC, struct.pack('<I', len(header)), header] + chunks)
+
+
+def encode_arrow(start, day_offsets, countries, columns, meta=None):
+    """Encode [rows, days] columns as an Arrow IPC stream in long form, one row per country and day."""
+    import pyarrow as pa
+
+    n_countries, n_days = len(countries), len(day_offsets)
+    epoch_days = (np.datetime64(start, 'D') + np.asarray(day_offsets)).astype('datetime64[D]')
+
+    data = {
+        'country': pa.DictionaryArray.from_arrays(
+            np.repeat(np.arange(n_countries, dtype=np.int32), n_days), pa.array(list(countries))),
+        'date': pa.array(np.tile(epoch_days, n_countries)),
+    }
+    for name, values in columns.items():
+        data[name] = pa.array(np.asarray(values, dtype=np.int64).reshape(-1))
+
+    metadata = {key: json.dumps(value) for key, value in (meta or {}).items()}
+    table = pa.table(data, metadata=metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def columnar_response(fmt, dates, countries, columns, meta=None, filename=None):
+    """Build a binary response for series sharing one list of disease.sh date keys.
+
+    columns maps metric names to arrays shaped [countries, days].
+    """
+    days = [parse_date(key) for key in dates]
+    start = min(days) if days else date.today()
+    day_offsets = np.array([(day - start).days for day in days], dtype=np.int32)
+    columns = {name: np.asarray(values).reshape(len(countries), len(days))
+               for name, values in columns.items()}
+
+    if fmt == 'arrow':
+        body = encode_arrow(start, day_offsets, countries, columns, meta)
+    else:
+        body = encode_columns(start, day_offsets, countries, columns, meta)
+
+    response = Response(body, mimetype=BINARY_FORMATS[fmt])
+    response.headers['Vary'] = 'Accept'
+    if filename:
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
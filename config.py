@@ -2,14 +2,47 @@
 Configuration settings for the COVID-19 tracker application.
 """
 
-# API endpoints for COVID-19 data
-COVID_API_BASE_URL = "https://disease.sh/v3/covid-19"
+import os
+
+# API endpoints for COVID-19 data (override the base URL to point at a local stub)
+COVID_API_BASE_URL = os.environ.get("COVID_API_BASE_URL", "https://disease.sh/v3/covid-19")
 COVID_COUNTRIES_ENDPOINT = f"{COVID_API_BASE_URL}/countries"
 COVID_HISTORICAL_ENDPOINT = f"{COVID_API_BASE_URL}/historical"
 COVID_VACCINE_ENDPOINT = f"{COVID_API_BASE_URL}/vaccine/coverage/countries"
 
+# Upstream HTTP client settings
+UPSTREAM_CONNECT_TIMEOUT = 3.05  # Seconds to establish a connection
+UPSTREAM_READ_TIMEOUT = 15  # Seconds to wait for response data
+UPSTREAM_MAX_RETRIES = 2  # Retries after the first attempt for transient failures
+UPSTREAM_BACKOFF_BASE = 0.5  # Seconds; doubled on each retry and jittered
+UPSTREAM_BACKOFF_MAX = 4  # Upper bound for a single backoff in seconds
+UPSTREAM_POOL_SIZE = 20  # Keep-alive connections kept per host
+CIRCUIT_BREAKER_FAILURES = 5  # Consecutive failures before upstream calls are skipped
+CIRCUIT_BREAKER_RESET = 60  # Seconds before a failing upstream is probed again
+UPSTREAM_FANOUT_WORKERS = 8  # Threads shared by requests that fan out to several upstream calls
+UPSTREAM_FANOUT_DEADLINE = 10  # Seconds a fanned-out request waits before returning partial results
+ASYNC_UPSTREAM_POOL_SIZE = 100  # Connections the async (ASGI) serving mode keeps to upstream
+ASYNC_WSGI_THREADS = 8  # Threads running the Flask views in the async serving mode
+
 # Cache configuration
 CACHE_EXPIRATION = 3600  # Cache expiration time in seconds (1 hour)
+CACHE_HARD_EXPIRATION = 86400  # Stale data is never served past this age (24 hours)
+
+# Per-country caches are evicted least-recently-used first beyond these limits
+HISTORICAL_CACHE_MAX_ENTRIES = 500
+HISTORICAL_CACHE_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
+VACCINE_CACHE_MAX_ENTRIES = 250
+VACCINE_CACHE_MAX_BYTES = 32 * 1024 * 1024  # 32 MB
+
+# Encoded variants of one refresh's data (field projections, rollups) kept at once
+PROJECTION_CACHE_MAX_ENTRIES = 64
+
+# Most matches one country search request can ask for
+SEARCH_MAX_LIMIT = 50
+
+# Compression for pre-serialized responses
+RESPONSE_GZIP_LEVEL = 9
+RESPONSE_BROTLI_QUALITY = 11
 
 # Application settings
 DEBUG = True
@@ -17,4 +50,62 @@ HOST = "0.0.0.0"
 PORT = 5000
 
 # Data directory
-DATA_DIR = "data"
\ No newline at end of file
+DATA_DIR = "data"
+
+# Local time-series store holding every country's historical timeline
+TIMESERIES_DIR = f"{DATA_DIR}/timeseries"
+TIMESERIES_KEEP_VERSIONS = 2
+HISTORICAL_STORE_REFRESH_HOURS = 6
+HISTORICAL_DELTA_DAYS = 7  # Trailing days re-fetched on each incremental refresh
+
+# Local store of every country's vaccination coverage, aligned with the historical store's dates
+VACCINE_DIR = f"{DATA_DIR}/vaccines"
+VACCINE_KEEP_VERSIONS = 2
+VACCINE_STORE_REFRESH_HOURS = 6
+VACCINE_AVERAGE_DAYS = 7  # Days in the rolling average of daily doses
+
+# Countries encoded per chunk of a streamed bulk export
+EXPORT_CHUNK_COUNTRIES = 16
+
+# Cache backend for upstream data: "memory" (per process), "file" (shared by
+# every worker on the host) or "redis" (shared across hosts)
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_DIR = f"{DATA_DIR}/cache"
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# Lock that lets only one worker refresh a dataset while the others wait
+SHARED_LOCK_TIMEOUT = 60  # seconds before a lock left by a crashed worker expires
+SHARED_LOCK_POLL = 0.1  # seconds between checks while waiting for another worker
+STORE_LOCK_TIMEOUT = 900  # the same for a full historical or vaccine store refresh, which takes minutes
+
+# Scheduled upstream fetching. By default the web process runs it itself; with
+# several workers set EMBEDDED_INGEST=false and run `python ingest.py` once
+EMBEDDED_INGEST = os.environ.get("EMBEDDED_INGEST", "true").lower() in ("1", "true", "yes")
+INGEST_INTERVAL_MINUTES = 60
+
+# Versioned snapshots the ingest worker publishes for the web workers
+SNAPSHOT_DIR = f"{DATA_DIR}/snapshots"
+SNAPSHOT_KEEP_VERSIONS = 3
+SNAPSHOT_CHECK_INTERVAL = 5  # seconds between web workers checking for a new snapshot
+
+# Country groups /api/aggregate?by=group rolls up, as ISO3 codes; a country may be in several
+COUNTRY_GROUPS = {
+    'G7': ['CAN', 'DEU', 'FRA', 'GBR', 'ITA', 'JPN', 'USA'],
+    'BRICS': ['BRA', 'CHN', 'IND', 'RUS', 'ZAF'],
+    'EU': ['AUT', 'BEL', 'BGR', 'CYP', 'CZE', 'DEU', 'DNK', 'ESP', 'EST', 'FIN', 'FRA', 'GRC', 'HRV', 'HUN',
+           'IRL', 'ITA', 'LTU', 'LUX', 'LVA', 'MLT', 'NLD', 'POL', 'PRT', 'ROU', 'SVK', 'SVN', 'SWE'],
+    'ASEAN': ['BRN', 'IDN', 'KHM', 'LAO', 'MMR', 'MYS', 'PHL', 'SGP', 'THA', 'VNM'],
+}
+
+# Server-sent events pushing a diff to /api/stream clients after each refresh
+STREAM_HISTORY = 24  # diffs each worker keeps for clients that reconnect
+STREAM_RETRY = 10  # seconds browsers wait before reconnecting a dropped stream
+
+# Last good copy of each upstream response, served while upstream is unreachable
+BACKUP_DIR = f"{DATA_DIR}/backups"
+
+# Sampling profiler writing the stacks of slow requests as flamegraph input
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILER_INTERVAL = 0.005  # seconds between stack samples
+PROFILER_SLOW_SECONDS = 0.5  # requests slower than this get their stacks written
+PROFILER_DIR = f"{DATA_DIR}/profiles"
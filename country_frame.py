@@ -0,0 +1,78 @@
+"""
+Columnar snapshot of the countries dataset for the COVID-19 tracker.
+
+The snapshot is built once per data refresh. Derived ratios for every
+country are computed in one vectorized pass instead of per request.
+pandas is imported by the first build, so importing this module is cheap.
+"""
+
+import numpy as np
+
+# Integer metrics copied straight from the upstream records
+COUNT_COLUMNS = [
+    'cases', 'todayCases', 'deaths', 'todayDeaths', 'recovered', 'todayRecovered',
+    'active', 'critical', 'tests', 'population',
+]
+
+# Per-million figures as reported upstream
+UPSTREAM_RATIO_COLUMNS = [
+    'casesPerOneMillion', 'deathsPerOneMillion', 'testsPerOneMillion',
+    'activePerOneMillion', 'recoveredPerOneMillion', 'criticalPerOneMillion',
+]
+
+# Columns returned by /api/compare
+COMPARE_COLUMNS = [
+    'country', 'cases', 'deaths', 'recovered', 'active', 'casesPerOneMillion',
+    'deathsPerOneMillion', 'tests', 'testsPerOneMillion', 'population',
+]
+
+
+def safe_ratio(numerator, denominator, scale=1.0):
+    """Divide two arrays elementwise, returning 0 where the denominator is 0."""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    out = np.zeros_like(numerator)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out * scale
+
+
+def build_country_frame(countries):
+    """Build a DataFrame indexed by country name with raw and derived metrics."""
+    if not countries:
+        return None
+
+    import pandas as pd
+
+    info = [c.get('countryInfo') or {} for c in countries]
+    frame = pd.DataFrame({
+        'country': [c['country'] for c in countries],
+        'iso2': [i.get('iso2') for i in info],
+        'iso3': [i.get('iso3') for i in info],
+        'flag': [i.get('flag') for i in info],
+        'continent': [c.get('continent') for c in countries],
+        'updated': np.array([c.get('updated') or 0 for c in countries], dtype=np.int64),
+    })
+
+    for column in COUNT_COLUMNS:
+        frame[column] = np.array([c.get(column) or 0 for c in countries], dtype=np.int64)
+    for column in UPSTREAM_RATIO_COLUMNS:
+        frame[column] = np.array([c.get(column) or 0 for c in countries], dtype=np.float64)
+
+    # Derived metrics, computed for every country at once
+    frame['activePerMillion'] = safe_ratio(frame['active'], frame['population'], 1e6)
+    frame['casesPerMillion'] = safe_ratio(frame['cases'], frame['population'], 1e6)
+    frame['deathsPerMillion'] = safe_ratio(frame['deaths'], frame['population'], 1e6)
+    frame['testsPerMillion'] = safe_ratio(frame['tests'], frame['population'], 1e6)
+    frame['caseFatalityRate'] = safe_ratio(frame['deaths'], frame['cases'], 100)
+    frame['recoveryRate'] = safe_ratio(frame['recovered'], frame['cases'], 100)
+    frame['activeCasePercentage'] = safe_ratio(frame['active'], frame['cases'], 100)
+
+    return frame.set_index(frame['country'].rename(None))
+
+
+def frame_rows(frame, names, columns=None):
+    """Return rows for the given country names as a list of plain dicts."""
+    rows = frame.loc[names]
+    if columns is not None:
+        rows = rows[columns]
+    return rows.to_dict('records')
@@ -0,0 +1,145 @@
+"""
+Country lookup index for the COVID-19 tracker.
+
+The index is rebuilt once per data refresh so that request handlers can
+resolve a country name, ISO code or common alias in constant time instead
+of scanning the full countries list. The same refresh also builds a sorted
+prefix index for typeahead search.
+"""
+
+from bisect import bisect_left
+
+# Alternative spellings mapped to the country name used by disease.sh
+COUNTRY_ALIASES = {
+    'united states': 'USA',
+    'united states of america': 'USA',
+    'us': 'USA',
+    'america': 'USA',
+    'united kingdom': 'UK',
+    'great britain': 'UK',
+    'britain': 'UK',
+    'england': 'UK',
+    'south korea': 'S. Korea',
+    'korea': 'S. Korea',
+    'republic of korea': 'S. Korea',
+    'north korea': 'N. Korea',
+    'united arab emirates': 'UAE',
+    'russian federation': 'Russia',
+    'czech republic': 'Czechia',
+    'ivory coast': "Côte d'Ivoire",
+    'cote d\'ivoire': "Côte d'Ivoire",
+    'democratic republic of the congo': 'DRC',
+    'dr congo': 'DRC',
+    'vatican': 'Holy See (Vatican City State)',
+    'vatican city': 'Holy See (Vatican City State)',
+    'laos': "Lao People's Democratic Republic",
+    'libya': 'Libyan Arab Jamahiriya',
+    'syria': 'Syrian Arab Republic',
+    'north macedonia': 'Macedonia',
+    'bosnia and herzegovina': 'Bosnia',
+    'eswatini': 'Swaziland',
+    'cape verde': 'Cabo Verde',
+    'east timor': 'Timor-Leste',
+    'macau': 'Macao',
+    'reunion': 'Réunion',
+    'curacao': 'Curaçao',
+    'falkland islands': 'Falkland Islands (Malvinas)',
+    'saint barthelemy': 'St. Barth',
+}
+
+
+def build_country_index(countries):
+    """Build a lookup dict from lowercased names, ISO codes and aliases to country records."""
+    index = {}
+    if not countries:
+        return index
+
+    for c in countries:
+        index[c['country'].lower()] = c
+
+    # ISO codes and aliases never shadow an actual country name
+    for c in countries:
+        info = c.get('countryInfo') or {}
+        for code in (info.get('iso2'), info.get('iso3')):
+            if code:
+                index.setdefault(code.lower(), c)
+
+    for alias, name in COUNTRY_ALIASES.items():
+        record = index.get(name.lower())
+        if record is not None:
+            index.setdefault(alias, record)
+
+    return index
+
+
+def lookup_country(index, name):
+    """Return the country record matching a name, ISO code or alias, or None."""
+    if not index or not name:
+        return None
+    return index.get(name.strip().lower())
+
+
+def countries_fields(countries):
+    """Return the field names that can be projected from the countries list."""
+    fields = set()
+    for c in countries or []:
+        fields.update(k for k in c if k != 'countryInfo')
+        fields.update(c.get('countryInfo') or {})
+    return fields
+
+
+def project_country(record, fields):
+    """Return a flat dict holding only the requested fields of a country record.
+
+    Fields nested under countryInfo (iso2, iso3, flag, lat, long) are lifted
+    to the top level.
+    """
+    info = record.get('countryInfo') or {}
+    return {field: record[field] if field in record else info.get(field) for field in fields}
+
+
+def project_countries(countries, fields):
+    """Project every country onto the requested fields, sorted by country name."""
+    ordered = sorted(countries, key=lambda c: c['country'])
+    return [project_country(c, fields) for c in ordered]
+
+
+def build_prefix_index(countries):
+    """Build a sorted list of (search key, country name) pairs for typeahead.
+
+    Keys are the full lowercased name, every later word of the name (so
+    'korea' finds 'S. Korea') and the aliases in COUNTRY_ALIASES.
+    """
+    names = {c['country'] for c in countries or []}
+    entries = set()
+    for name in names:
+        lower = name.lower()
+        entries.add((lower, name))
+        for i in range(1, len(lower)):
+            if lower[i - 1] in ' -.(' and lower[i] not in ' -.(':
+                entries.add((lower[i:], name))
+
+    for alias, name in COUNTRY_ALIASES.items():
+        if name in names:
+            entries.add((alias, name))
+
+    return sorted(entries)
+
+
+def search_prefix(prefix_index, query, limit=10):
+    """Return country names with a key starting with query, whole-name matches first."""
+    query = query.strip().lower() if query else ''
+    if not prefix_index or not query:
+        return []
+
+    # Every key sharing the prefix sits in one contiguous run of the sorted list
+    matches = {}
+    position = bisect_left(prefix_index, (query,))
+    while position < len(prefix_index) and prefix_index[position][0].startswith(query):
+        key, name = prefix_index[position]
+        whole_name = key == name.lower()
+        matches[name] = matches.get(name, False) or whole_name
+        position += 1
+
+    ranked = sorted(matches, key=lambda name: (not matches[name], name))
+    return ranked[:limit]
@@ -0,0 +1,116 @@
+"""
+Server-side downsampling of time series for the COVID-19 tracker.
+
+Long timelines are reduced before they are serialized, either to a fixed
+number of points with largest-triangle-three-buckets (LTTB), which keeps
+the visual shape of the line, or to one point per week or month.
+"""
+
+import numpy as np
+
+from timeseries import parse_date
+
+RESOLUTIONS = ('daily', 'weekly', 'monthly')
+
+
+def downsample_args(args):
+    """Read ?points=N and ?resolution=... from request args, raising ValueError if invalid."""
+    points = args.get('points')
+    if points is not None:
+        if not points.isdigit() or int(points) < 3:
+            raise ValueError("points must be a whole number of at least 3")
+        points = int(points)
+
+    resolution = args.get('resolution', 'daily')
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of: {', '.join(RESOLUTIONS)}")
+    return points, resolution
+
+
+def lttb_indices(values, points):
+    """Return the indices of `points` samples of values chosen by largest-triangle-three-buckets."""
+    n = len(values)
+    if points >= n:
+        return np.arange(n)
+
+    y = np.asarray(values, dtype=np.float64)
+    x = np.arange(n, dtype=np.float64)
+
+    # First and last points are kept; the rest fall into points - 2 buckets
+    edges = np.linspace(1, n - 1, points - 1).astype(np.intp)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Average of each bucket, plus the last point as the bucket after the final one
+    cumulative = np.concatenate(([0.0], np.cumsum(y)))
+    avg_y = np.append((cumulative[ends] - cumulative[starts]) / (ends - starts), y[-1])
+    avg_x = np.append((starts + ends - 1) / 2, x[-1])
+
+    selected = np.empty(points, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    # Each pick depends on the previous one, so only the buckets are walked in Python
+    for i in range(points - 2):
+        a = selected[i]
+        lo, hi = starts[i], ends[i]
+        area = np.abs((x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) -
+                      (x[a] - x[lo:hi]) * (avg_y[i + 1] - y[a]))
+        selected[i + 1] = lo + np.argmax(area)
+    return selected
+
+
+def period_starts(dates, resolution):
+    """Return the index of the first day of each week or month in a list of date keys."""
+    days = [parse_date(key) for key in dates]
+    if resolution == 'weekly':
+        # Ordinal 1 is a Monday, so weeks run Monday to Sunday
+        periods = np.array([(day.toordinal() - 1) // 7 for day in days])
+    else:
+        periods = np.array([day.year * 12 + day.month for day in days])
+    return np.flatnonzero(np.diff(periods, prepend=periods[0] - 1))
+
+
+def downsample_arrays(dates, series, points=None, resolution='daily', flows=()):
+    """Downsample aligned series sharing one list of date keys.
+
+    series maps names to arrays whose last axis is time. Cumulative series
+    keep the value of the last day of each week or month; series named in
+    flows are summed over it. LTTB needs 1-D series; it picks its points
+    from the first series and applies them to all.
+    Returns (dates, series) with series as numpy arrays.
+    """
+    arrays = {name: np.asarray(values) for name, values in series.items()}
+    dates = list(dates)
+
+    if resolution != 'daily' and dates:
+        starts = period_starts(dates, resolution)
+        ends = np.append(starts[1:], len(dates)) - 1
+        arrays = {name: np.add.reduceat(values, starts, axis=-1) if name in flows else values[..., ends]
+                  for name, values in arrays.items()}
+        dates = [dates[i] for i in ends]
+
+    if points is not None and arrays and points < len(dates):
+        indices = lttb_indices(next(iter(arrays.values())), points)
+        arrays = {name: values[..., indices] for name, values in arrays.items()}
+        dates = [dates[i] for i in indices]
+
+    return dates, arrays
+
+
+def downsample(dates, series, points=None, resolution='daily', flows=()):
+    """Like downsample_arrays, but returns the series as lists ready for JSON."""
+    dates, arrays = downsample_arrays(dates, series, points, resolution, flows)
+    return dates, {name: values.tolist() for name, values in arrays.items()}
+
+
+def downsample_timeline(timeline, points=None, resolution='daily'):
+    """Downsample a disease.sh timeline of {metric: {date: value}} or a flat {date: value}."""
+    if not timeline or (points is None and resolution == 'daily'):
+        return timeline
+
+    if all(isinstance(values, dict) for values in timeline.values()):
+        dates = list(next(iter(timeline.values())))
+        series = {metric: [values.get(d, 0) for d in dates] for metric, values in timeline.items()}
+        dates, series = downsample(dates, series, points, resolution)
+        return {metric: dict(zip(dates, values)) for metric, values in series.items()}
+
+    dates, series = downsample(list(timeline), {'values': list(timeline.values())}, points, resolution)
+    return dict(zip(dates, series['values']))
@@ -0,0 +1,113 @@
+"""
+Streaming bulk exports of the historical store for the COVID-19 tracker.
+
+Exports are produced a few countries at a time from the memory-mapped
+store and handed to the client as they are encoded, so memory use stays
+the same however many countries and days are exported. pandas and pyarrow
+are imported by the first export rather than when the app starts.
+"""
+
+from importlib.util import find_spec
+
+import numpy as np
+
+from timeseries import DAILY_METRICS, METRICS, parse_date
+
+# pyarrow is optional; CSV exports are always available
+PARQUET_AVAILABLE = find_spec('pyarrow') is not None
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+# Columns of every export, in order
+EXPORT_COLUMNS = ['country', 'date'] + list(METRICS) + list(DAILY_METRICS.values())
+
+
+class ChunkSink:
+    """Write-only file object that hands back what was written since the last drain."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        # Parquet records absolute offsets, so this counts every byte ever written
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def export_frames(store, names, days, chunk_size):
+    """Yield one long-form DataFrame (country, date, metrics) per chunk of countries."""
+    import pandas as pd
+
+    for i in range(0, len(names), chunk_size):
+        chunk = names[i:i + chunk_size]
+        dates, arrays = store.block(chunk, days, daily=True)
+        if not dates:
+            return
+        iso_dates = (np.datetime64(parse_date(dates[0])) + np.arange(len(dates))).astype(str)
+
+        frame = pd.DataFrame({
+            'country': np.repeat(chunk, len(dates)),
+            'date': np.tile(iso_dates, len(chunk)),
+        })
+        for metric in EXPORT_COLUMNS[2:]:
+            frame[metric] = arrays[metric].reshape(-1)
+        yield frame
+
+
+def iter_csv(store, names, days, chunk_size):
+    """Yield a CSV export of the given countries chunk by chunk."""
+    header = True
+    for frame in export_frames(store, names, days, chunk_size):
+        yield frame.to_csv(index=False, header=header)
+        header = False
+    if header:
+        # Nothing matched; the header alone still makes a valid, empty CSV
+        yield ','.join(EXPORT_COLUMNS) + '\n'
+
+
+def iter_parquet(store, names, days, chunk_size):
+    """Yield a Parquet export of the given countries, one row group per chunk."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = ChunkSink()
+    writer = None
+    for frame in export_frames(store, names, days, chunk_size):
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(sink, table.schema)
+        writer.write_table(table)
+        yield sink.drain()
+
+    if writer is None:
+        # Nothing matched; write an empty table so the file is still valid Parquet
+        schema = pa.schema([(column, pa.string() if column in ('country', 'date') else pa.int64())
+                            for column in EXPORT_COLUMNS])
+        writer = pq.ParquetWriter(sink, schema)
+        writer.write_table(schema.empty_table())
+    writer.close()
+    yield sink.drain()
+
+
+def iter_export(fmt, store, names, days, chunk_size):
+    """Yield a bulk export in the given format ('csv' or 'parquet')."""
+    if fmt == 'parquet':
+        return iter_parquet(store, names, days, chunk_size)
+    return iter_csv(store, names, days, chunk_size)
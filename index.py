@@ -1,21 +1,79 @@
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, Response, jsonify, request, render_template
 import requests
 import json
+import time
+from concurrent.futures import wait
 from datetime import datetime, timedelta
-import pandas as pd
 from flask_cors import CORS
-from werkzeug.contrib.cache import SimpleCache
+
+from config import COVID_API_BASE_URL, EXPORT_CHUNK_COUNTRIES, UPSTREAM_FANOUT_DEADLINE
+from aggregates import global_totals
+from columnar import binary_format, columnar_response
+from country_frame import build_country_frame
+from country_index import build_country_index, lookup_country
+from downsample import downsample_args, downsample_arrays
+from export import EXPORT_FORMATS, PARQUET_AVAILABLE, iter_export
+from metrics import instrument_app
+from refresh import RefreshCoordinator
+from repository import repository
+from risk import build_risk_table
+from ttl_cache import TTLCache
+from upstream import upstream
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
-cache = SimpleCache()  # Simple in-memory cache
 
 # Base URL for COVID-19 data API
-BASE_URL = "https://disease.sh/v3/covid-19"
+BASE_URL = COVID_API_BASE_URL
 
 # Cache duration in seconds (15 minutes)
 CACHE_DURATION = 900
 
+# Processed responses are cached per process; upstream data is shared through the repository.
+# Keys carry user input (country names, day counts), so the cache is bounded like the SimpleCache it replaced
+cache = TTLCache(CACHE_DURATION, max_entries=500)
+
+# Request metrics served at /metrics, with this app's response cache next to the shared ones
+instrument_app(app, caches=lambda: dict(repository.stats(), responses=cache.stats()))
+
+# Time-series and vaccine stores shared with app.py, kept current with bulk refreshes
+timeseries = {'store': None, 'timestamp': 0}
+vaccines = {'store': None, 'timestamp': 0}
+refresher = RefreshCoordinator()
+
+def update_historical_store():
+    """Patch the latest days into the time-series store, loading it from disk first if needed"""
+    try:
+        store = repository.historical_store(timeseries['store'], max_age=CACHE_DURATION)
+        timeseries.update({'store': store, 'timestamp': time.time()})
+    except (requests.exceptions.RequestException, OSError, KeyError, ValueError) as e:
+        app.logger.error(f"Error updating historical store: {e}")
+
+def get_historical_store():
+    """Return the time-series store, refreshing it once per cache period"""
+    if time.time() - timeseries['timestamp'] > CACHE_DURATION:
+        # Only the very first request has to wait for the store
+        refresher.refresh('timeseries', update_historical_store, wait=timeseries['store'] is None)
+    return timeseries['store']
+
+def update_vaccine_store():
+    """Rebuild the vaccine store from one bulk fetch, aligned with the time-series store"""
+    try:
+        historical = get_historical_store()
+        start = historical.start if historical is not None and historical.countries else None
+        # Fetched in bulk every VACCINE_STORE_REFRESH_HOURS like app.py; in between the saved copy is loaded
+        store = repository.vaccine_store(vaccines['store'], start=start)
+        vaccines.update({'store': store, 'timestamp': time.time()})
+    except (requests.exceptions.RequestException, OSError, KeyError, ValueError) as e:
+        app.logger.error(f"Error updating vaccine store: {e}")
+
+def get_vaccine_store():
+    """Return the vaccine store, refreshing it once per cache period"""
+    if time.time() - vaccines['timestamp'] > CACHE_DURATION:
+        # Only the very first request has to wait for the store
+        refresher.refresh('vaccines', update_vaccine_store, wait=vaccines['store'] is None)
+    return vaccines['store']
+
 @app.route('/')
 def index():
     """Render the main application page"""
@@ -28,9 +86,8 @@ def get_countries():
     countries = cache.get('countries')
     if countries is None:
         try:
-            response = requests.get(f"{BASE_URL}/countries")
-            response.raise_for_status()
-            data = response.json()
+            # Falls back to the countries backup when upstream is down
+            data = repository.dataset("/countries")
             # Extract relevant country data for autocomplete
             countries = [{"name": country["country"], 
                           "code": country["countryInfo"]["iso2"], 
@@ -53,9 +110,12 @@ def get_global_stats():
     global_stats = cache.get('global_stats')
     if global_stats is None:
         try:
-            response = requests.get(f"{BASE_URL}/all")
-            response.raise_for_status()
-            global_stats = response.json()
+            # Summed from the countries dataset, which falls back to its backup when upstream is down
+            data = repository.dataset("/countries")
+            if not data:
+                app.logger.error("Error fetching global stats: no countries data to sum")
+                return jsonify({"error": "Failed to fetch global data"}), 500
+            global_stats = global_totals(build_country_frame(data))
             # Add calculated metrics
             global_stats["recoveryRate"] = round((global_stats["recovered"] / global_stats["cases"]) * 100, 2) if global_stats["cases"] > 0 else 0
             global_stats["fatalityRate"] = round((global_stats["deaths"] / global_stats["cases"]) * 100, 2) if global_stats["cases"] > 0 else 0
@@ -76,13 +136,7 @@ def get_country_stats(country):
     country_stats = cache.get(cache_key)
     if country_stats is None:
         try:
-            response = requests.get(f"{BASE_URL}/countries/{country}")
-            response.raise_for_status()
-            country_stats = response.json()
-            # Add calculated metrics
-            country_stats["recoveryRate"] = round((country_stats["recovered"] / country_stats["cases"]) * 100, 2) if country_stats["cases"] > 0 else 0
-            country_stats["fatalityRate"] = round((country_stats["deaths"] / country_stats["cases"]) * 100, 2) if country_stats["cases"] > 0 else 0
-            country_stats["activeCasePercentage"] = round((country_stats["active"] / country_stats["cases"]) * 100, 2) if country_stats["cases"] > 0 else 0
+            country_stats = with_rates(repository.country(country))
             # Cache the results
             cache.set(cache_key, country_stats, timeout=CACHE_DURATION)
         except requests.exceptions.RequestException as e:
@@ -91,81 +145,187 @@ def get_country_stats(country):
     
     return jsonify(country_stats)
 
+def with_rates(record):
+    """Return a copy of a country record with recovery, fatality and active-case rates added"""
+    country_stats = dict(record)
+    country_stats["recoveryRate"] = round((country_stats["recovered"] / country_stats["cases"]) * 100, 2) if country_stats["cases"] > 0 else 0
+    country_stats["fatalityRate"] = round((country_stats["deaths"] / country_stats["cases"]) * 100, 2) if country_stats["cases"] > 0 else 0
+    country_stats["activeCasePercentage"] = round((country_stats["active"] / country_stats["cases"]) * 100, 2) if country_stats["cases"] > 0 else 0
+    return country_stats
+
+def store_name(store, country):
+    """Return the name a time-series or vaccine store uses for a country, resolving ISO codes and aliases"""
+    if country.lower() in store.rows:
+        return store.countries[store.rows[country.lower()]]
+    if store.has(country):
+        return country
+    try:
+        index, _ = get_risk_table()
+    except requests.exceptions.RequestException:
+        return None
+    record = lookup_country(index, country)
+    if record is not None and store.has(record['country']):
+        return record['country']
+    return None
+
 @app.route('/api/historical/<country>')
 def get_historical_data(country):
     """Get historical COVID-19 data for a specific country"""
     days = request.args.get('days', 30, type=int)
+    try:
+        points, resolution = downsample_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        fmt = binary_format(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 406
+    try:
+        historical_data = historical_series(country, days)
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Error fetching historical data for {country}: {e}")
+        return jsonify({"error": f"Failed to fetch historical data for {country}"}), 500
+    
+    # Thin the series on request; daily new counts are summed over each week or month
+    dates, series = downsample_historical(historical_data, points, resolution)
+    if fmt:
+        return columnar_response(fmt, dates, [country], series)
+    return jsonify(dict({'dates': dates}, **{k: v.tolist() for k, v in series.items()}))
+
+def historical_series(country, days):
+    """Return a country's daily series over the last days, from the store or upstream; raises RequestException"""
     cache_key = f'historical_{country}_{days}'
     historical_data = cache.get(cache_key)
     
-    if historical_data is None:
-        try:
-            # Get historical data for the specified country
-            response = requests.get(f"{BASE_URL}/historical/{country}?lastdays={days}")
-            response.raise_for_status()
-            data = response.json()
-            
-            # Process the data into a format suitable for charts
-            timeline = data.get('timeline', {})
-            
-            historical_data = {
-                'dates': list(timeline.get('cases', {}).keys()),
-                'cases': list(timeline.get('cases', {}).values()),
-                'deaths': list(timeline.get('deaths', {}).values()),
-                'recovered': list(timeline.get('recovered', {}).values())
-            }
-            
-            # Calculate daily new cases, deaths, and recoveries
-            if len(historical_data['cases']) > 1:
-                historical_data['newCases'] = [0] + [
-                    historical_data['cases'][i] - historical_data['cases'][i-1] 
-                    for i in range(1, len(historical_data['cases']))
-                ]
-                historical_data['newDeaths'] = [0] + [
-                    historical_data['deaths'][i] - historical_data['deaths'][i-1] 
-                    for i in range(1, len(historical_data['deaths']))
-                ]
-                historical_data['newRecovered'] = [0] + [
-                    historical_data['recovered'][i] - historical_data['recovered'][i-1] 
-                    for i in range(1, len(historical_data['recovered']))
-                ]
-            
-            # Cache the results
+    # Slice the series out of the shared store when it covers this country
+    store = get_historical_store() if historical_data is None else None
+    if store is not None and days > 0:
+        name = store_name(store, country)
+        if name is not None:
+            dates, series = store.series(name, days, daily=True)
+            historical_data = {'dates': dates}
+            historical_data.update({metric: values.tolist() for metric, values in series.items()})
+            # The first day of the window has no previous day, as before
+            for metric in ('newCases', 'newDeaths', 'newRecovered'):
+                historical_data[metric][:1] = [0]
             cache.set(cache_key, historical_data, timeout=CACHE_DURATION)
-        except requests.exceptions.RequestException as e:
-            app.logger.error(f"Error fetching historical data for {country}: {e}")
-            return jsonify({"error": f"Failed to fetch historical data for {country}"}), 500
     
-    return jsonify(historical_data)
+    if historical_data is None:
+        # Get historical data for the specified country
+        data = repository.historical(country, days)
+        
+        # Process the data into a format suitable for charts
+        timeline = data.get('timeline', {})
+        
+        historical_data = {
+            'dates': list(timeline.get('cases', {}).keys()),
+            'cases': list(timeline.get('cases', {}).values()),
+            'deaths': list(timeline.get('deaths', {}).values()),
+            'recovered': list(timeline.get('recovered', {}).values())
+        }
+        
+        # Calculate daily new cases, deaths, and recoveries
+        if len(historical_data['cases']) > 1:
+            historical_data['newCases'] = [0] + [
+                historical_data['cases'][i] - historical_data['cases'][i-1] 
+                for i in range(1, len(historical_data['cases']))
+            ]
+            historical_data['newDeaths'] = [0] + [
+                historical_data['deaths'][i] - historical_data['deaths'][i-1] 
+                for i in range(1, len(historical_data['deaths']))
+            ]
+            historical_data['newRecovered'] = [0] + [
+                historical_data['recovered'][i] - historical_data['recovered'][i-1] 
+                for i in range(1, len(historical_data['recovered']))
+            ]
+        
+        # Cache the results
+        cache.set(cache_key, historical_data, timeout=CACHE_DURATION)
+    return historical_data
+
+def downsample_historical(historical_data, points, resolution):
+    """Thin historical series to (dates, arrays); daily new counts are summed over each week or month"""
+    series = {k: v for k, v in historical_data.items() if k != 'dates'}
+    return downsample_arrays(historical_data['dates'], series, points, resolution,
+                             flows=('newCases', 'newDeaths', 'newRecovered'))
 
 @app.route('/api/vaccine/<country>')
 def get_vaccine_data(country):
     """Get vaccination data for a specific country"""
+    try:
+        points, resolution = downsample_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        vaccine_data = vaccine_series(country)
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Error fetching vaccine data for {country}: {e}")
+        return jsonify({"error": f"Failed to fetch vaccine data for {country}"}), 500
+    
+    dates, series = downsample_arrays(vaccine_data['dates'], {'vaccinations': vaccine_data['vaccinations']},
+                                      points, resolution)
+    return jsonify({'dates': dates, 'vaccinations': series['vaccinations'].tolist()})
+
+def vaccine_series(country):
+    """Return a country's cumulative vaccination series, from the store or upstream; raises RequestException"""
     cache_key = f'vaccine_{country}'
     vaccine_data = cache.get(cache_key)
     
+    # Slice the whole series out of the shared store when it covers this country
+    store = get_vaccine_store() if vaccine_data is None else None
+    name = store_name(store, country) if store is not None else None
+    if name is not None:
+        dates, series = store.block([name], metrics=('total',))
+        vaccine_data = {'dates': dates, 'vaccinations': series['total'][0].tolist()}
+        cache.set(cache_key, vaccine_data, timeout=CACHE_DURATION)
+    
     if vaccine_data is None:
+        # Get vaccine data for the specified country
+        data = repository.vaccine(country, 'all')
+        
+        # Process the data
+        timeline = data.get('timeline', {})
+        
+        vaccine_data = {
+            'dates': list(timeline.keys()),
+            'vaccinations': list(timeline.values())
+        }
+        
+        # Cache the results
+        cache.set(cache_key, vaccine_data, timeout=CACHE_DURATION)
+    return vaccine_data
+
+def fetch_countries(names):
+    """Fetch stats for several countries, batching the ones not in the shared cache into one upstream call"""
+    fetched = {}
+    batch_failed = False
+    
+    if len(names) > 1:
         try:
-            # Get vaccine data for the specified country
-            response = requests.get(f"{BASE_URL}/vaccine/coverage/countries/{country}?lastdays=all")
-            response.raise_for_status()
-            data = response.json()
-            
-            # Process the data
-            timeline = data.get('timeline', {})
-            
-            vaccine_data = {
-                'dates': list(timeline.keys()),
-                'vaccinations': list(timeline.values())
-            }
-            
-            # Cache the results
-            cache.set(cache_key, vaccine_data, timeout=CACHE_DURATION)
+            fetched = repository.countries(names)
         except requests.exceptions.RequestException as e:
-            app.logger.error(f"Error fetching vaccine data for {country}: {e}")
-            return jsonify({"error": f"Failed to fetch vaccine data for {country}"}), 500
+            app.logger.error(f"Batched fetch for {names} failed, fetching individually: {e}")
+            batch_failed = True
+    
+    # Single countries, or everything if the batched call failed, go out concurrently
+    if len(names) == 1 or batch_failed:
+        pending = {name: upstream.executor.submit(repository.country, name) for name in names}
+        done, _ = wait(pending.values(), timeout=UPSTREAM_FANOUT_DEADLINE)
+        for name, future in pending.items():
+            if future not in done:
+                # Return whatever arrived in time
+                future.cancel()
+                app.logger.error(f"Timed out fetching data for {name}")
+            elif future.exception() is not None:
+                app.logger.error(f"Error fetching data for {name}: {future.exception()}")
+            else:
+                fetched[name] = future.result()
+    
+    # Cache the results
+    for name, country_stats in fetched.items():
+        cache.set(f'country_{name}', country_stats, timeout=CACHE_DURATION)
     
-    return jsonify(vaccine_data)
+    return fetched
 
 @app.route('/api/compare')
 def compare_countries():
@@ -179,25 +339,24 @@ def compare_countries():
     if not country_list:
         return jsonify({"error": "No countries specified"}), 400
     
+    # Serve what we can from the cache and fetch the rest in one go
+    stats_by_country = {}
+    for country in country_list:
+        country_stats = cache.get(f'country_{country}')
+        if country_stats is not None:
+            stats_by_country[country] = country_stats
+    
+    missing = [c for c in country_list if c not in stats_by_country]
+    if missing:
+        stats_by_country.update(fetch_countries(missing))
+    
     result = {}
     
     for country in country_list:
-        cache_key = f'country_{country}'
-        country_stats = cache.get(cache_key)
-        
-        if country_stats is None:
-            try:
-                response = requests.get(f"{BASE_URL}/countries/{country}")
-                response.raise_for_status()
-                country_stats = response.json()
-                # Cache the results
-                cache.set(cache_key, country_stats, timeout=CACHE_DURATION)
-            except requests.exceptions.RequestException as e:
-                app.logger.error(f"Error fetching data for {country}: {e}")
-                continue
+        country_stats = stats_by_country.get(country)
         
         # Add country data to the result
-        if metric in country_stats:
+        if country_stats is not None and metric in country_stats:
             result[country] = {
                 'value': country_stats[metric],
                 'perMillion': country_stats.get(f"{metric}PerOneMillion", 0),
@@ -207,85 +366,204 @@ def compare_countries():
     if not result:
         return jsonify({"error": "Failed to fetch data for any of the specified countries"}), 500
     
-    return jsonify(result)
+    response = jsonify(result)
+    # Partial results: tell the client which countries could not be fetched
+    failed = [c for c in country_list if c not in stats_by_country]
+    if failed:
+        response.headers['X-Missing-Countries'] = ','.join(failed)
+    return response
+
+def get_risk_table():
+    """Score every country at once from the full countries list, cached like any other response"""
+    risk = cache.get('risk_table')
+    if risk is None:
+        # Falls back to the countries backup when upstream is down
+        data = repository.dataset("/countries")
+        if not data:
+            # Handled like upstream being down, which is what left us without data
+            raise requests.exceptions.RequestException("No countries data")
+        risk = (build_country_index(data), build_risk_table(build_country_frame(data)))
+        cache.set('risk_table', risk, timeout=CACHE_DURATION)
+    return risk
+
+def format_risk_assessment(row):
+    """Shape one row of the risk table into this API's risk assessment format"""
+    return {
+        'country': row['country'],
+        'score': float(row['weightedScore']),
+        'category': row['weightedCategory'],
+        'factors': {
+            'activeCases': float(row['activePerOneMillion']),
+            'deathRate': float(row['deathsPerOneMillion']),
+            'criticalCases': float(row['criticalPerOneMillion']),
+            'testingRate': float(row['testsPerOneMillion'])
+        }
+    }
+
+@app.route('/api/risk-assessment')
+def get_risk_ranking():
+    """Get risk assessments for many countries, highest risk first"""
+    countries = request.args.get('countries', '')
+    limit = request.args.get('limit', type=int)
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be at least 1"}), 400
+    
+    try:
+        index, table = get_risk_table()
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Error calculating risk ranking: {e}")
+        return jsonify({"error": "Failed to calculate risk ranking"}), 500
+    
+    table = table.sort_values('weightedScore', ascending=False, kind='stable')
+    country_list = [c.strip() for c in countries.split(',') if c.strip()]
+    if country_list:
+        records = [lookup_country(index, c) for c in country_list]
+        names = [record['country'] for record in records if record]
+        table = table[table.index.isin(names)]
+    if limit:
+        table = table.head(limit)
+    
+    return jsonify([format_risk_assessment(row) for _, row in table.iterrows()])
 
 @app.route('/api/risk-assessment/<country>')
 def get_risk_assessment(country):
-    """Calculate risk assessment based on various factors"""
-    cache_key = f'risk_{country}'
-    risk_assessment = cache.get(cache_key)
+    """Look up the precomputed risk assessment for a country"""
+    try:
+        index, table = get_risk_table()
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Error calculating risk assessment for {country}: {e}")
+        return jsonify({"error": f"Failed to calculate risk assessment for {country}"}), 500
     
-    if risk_assessment is None:
-        try:
-            # Get country data
-            response = requests.get(f"{BASE_URL}/countries/{country}")
-            response.raise_for_status()
-            country_data = response.json()
-            
-            # Calculate risk factors (simplified version)
-            active_per_million = country_data.get('activePerOneMillion', 0)
-            deaths_per_million = country_data.get('deathsPerOneMillion', 0)
-            critical_per_million = country_data.get('criticalPerOneMillion', 0)
-            tests_per_million = country_data.get('testsPerOneMillion', 0)
-            
-            # Risk scoring logic (simplified)
-            active_risk = min(active_per_million / 500, 100) * 0.4  # Weight of 40%
-            death_risk = min(deaths_per_million / 250, 100) * 0.3   # Weight of 30%
-            critical_risk = min(critical_per_million / 25, 100) * 0.2  # Weight of 20%
-            
-            # Testing factor (more tests = lower risk)
-            testing_factor = max(0, min(1 - (tests_per_million / 500000), 1)) * 0.1  # Weight of 10%
-            
-            # Calculate total risk (0-100 scale)
-            total_risk = active_risk + death_risk + critical_risk + testing_factor
-            
-            # Risk category
-            risk_category = "Low"
-            if total_risk > 70:
-                risk_category = "Very High"
-            elif total_risk > 50:
-                risk_category = "High"
-            elif total_risk > 30:
-                risk_category = "Moderate"
-            elif total_risk > 10:
-                risk_category = "Low"
-            else:
-                risk_category = "Very Low"
-            
-            risk_assessment = {
-                'score': round(total_risk, 2),
-                'category': risk_category,
-                'factors': {
-                    'activeCases': active_per_million,
-                    'deathRate': deaths_per_million,
-                    'criticalCases': critical_per_million,
-                    'testingRate': tests_per_million
-                }
-            }
-            
-            # Cache the results
-            cache.set(cache_key, risk_assessment, timeout=CACHE_DURATION)
-        except requests.exceptions.RequestException as e:
-            app.logger.error(f"Error calculating risk assessment for {country}: {e}")
-            return jsonify({"error": f"Failed to calculate risk assessment for {country}"}), 500
+    record = lookup_country(index, country)
+    if record is None:
+        return jsonify({"error": f"Country {country} not found"}), 404
     
-    return jsonify(risk_assessment)
+    return jsonify(format_risk_assessment(table.loc[record['country']]))
+
+DETAIL_PARTS = ('stats', 'historical', 'risk', 'vaccine')
+
+@app.route('/api/country/<country>/detail')
+def get_country_detail(country):
+    """Get a country's stats, history, risk and vaccination data in one response
+    
+    ?include=stats,historical,risk,vaccine picks the parts; each is what its
+    own endpoint returns, or null with the reason under 'errors'.
+    """
+    include = [p.strip() for p in request.args.get('include', ','.join(DETAIL_PARTS)).split(',') if p.strip()]
+    unknown = [p for p in include if p not in DETAIL_PARTS]
+    if unknown:
+        return jsonify({"error": f"Unknown parts: {', '.join(unknown)}"}), 400
+    days = request.args.get('days', 30, type=int)
+    try:
+        points, resolution = downsample_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Stats and risk both come from the shared countries dataset, so one lookup serves them
+    try:
+        index, table = get_risk_table()
+    except requests.exceptions.RequestException as e:
+        app.logger.error(f"Error fetching data for {country}: {e}")
+        return jsonify({"error": f"Failed to fetch data for {country}"}), 500
+    record = lookup_country(index, country)
+    if record is None:
+        return jsonify({"error": f"Country {country} not found"}), 404
+    name = record['country']
+    
+    def historical():
+        dates, series = downsample_historical(historical_series(name, days), points, resolution)
+        return dict({'dates': dates}, **{k: v.tolist() for k, v in series.items()})
+    
+    def vaccine():
+        vaccine_data = vaccine_series(name)
+        dates, series = downsample_arrays(vaccine_data['dates'], {'vaccinations': vaccine_data['vaccinations']},
+                                          points, resolution)
+        return {'dates': dates, 'vaccinations': series['vaccinations'].tolist()}
+    
+    # Parts that may go upstream run at the same time on the shared fan-out pool
+    pending = {}
+    if 'historical' in include:
+        pending['historical'] = upstream.executor.submit(historical)
+    if 'vaccine' in include:
+        pending['vaccine'] = upstream.executor.submit(vaccine)
+    
+    detail = {'country': name}
+    errors = {}
+    if 'stats' in include:
+        detail['stats'] = with_rates(record)
+    if 'risk' in include:
+        detail['risk'] = format_risk_assessment(table.loc[name])
+    
+    done, _ = wait(pending.values(), timeout=UPSTREAM_FANOUT_DEADLINE)
+    for part, future in pending.items():
+        detail[part] = None
+        if future not in done:
+            future.cancel()
+            errors[part] = "Timed out"
+        elif future.exception() is not None:
+            app.logger.error(f"Error fetching {part} data for {name}: {future.exception()}")
+            errors[part] = f"Failed to fetch {part} data for {name}"
+        else:
+            detail[part] = future.result()
+    if errors:
+        detail['errors'] = errors
+    return jsonify(detail)
+
+@app.route('/api/export/bulk')
+def export_bulk():
+    """Stream many countries' history as CSV or Parquet straight from the time-series store"""
+    countries = request.args.get('countries', '')
+    days = request.args.get('days', type=int)
+    fmt = request.args.get('format', 'csv')
+    if days is not None and days < 1:
+        return jsonify({"error": "days must be at least 1"}), 400
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"Unsupported export format: {fmt}"}), 400
+    if fmt == 'parquet' and not PARQUET_AVAILABLE:
+        return jsonify({"error": "Parquet export needs the pyarrow package"}), 406
+    
+    store = get_historical_store()
+    if store is None:
+        return jsonify({"error": "Historical data not available"}), 503
+    
+    country_list = [c.strip() for c in countries.split(',') if c.strip()]
+    if country_list:
+        names = [name for name in (store_name(store, c) for c in country_list) if name is not None]
+    else:
+        names = store.countries
+    
+    return Response(iter_export(fmt, store, names, days, EXPORT_CHUNK_COUNTRIES),
+                    mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename=covid_historical.{fmt}'})
 
 @app.route('/api/export/<country>')
 def export_data(country):
     """Prepare data for export (CSV format)"""
     format_type = request.args.get('format', 'json')
+    try:
+        fmt = binary_format(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 406
     
     try:
-        # Get country data
-        country_response = requests.get(f"{BASE_URL}/countries/{country}")
-        country_response.raise_for_status()
-        country_data = country_response.json()
+        # Country and historical data come from the shared caches, fetched concurrently on a miss
+        summary = upstream.executor.submit(repository.country, country)
+        historical = upstream.executor.submit(repository.historical, country, 30)
+        done, _ = wait([summary, historical], timeout=UPSTREAM_FANOUT_DEADLINE)
+        if summary not in done:
+            summary.cancel()
+            raise requests.exceptions.Timeout(f"Deadline exceeded fetching {country}")
+        country_data = summary.result()
         
-        # Get historical data
-        historical_response = requests.get(f"{BASE_URL}/historical/{country}?lastdays=30")
-        historical_response.raise_for_status()
-        historical_data = historical_response.json()
+        timeline = {}
+        # Export the summary on its own rather than failing outright
+        if historical not in done:
+            historical.cancel()
+            app.logger.error(f"Timed out fetching historical data for {country} export")
+        elif historical.exception() is not None:
+            app.logger.error(f"Error fetching historical data for {country} export: {historical.exception()}")
+        else:
+            timeline = historical.result().get('timeline', {})
         
         # Prepare export data
         export_data = {
@@ -299,10 +577,12 @@ def export_data(country):
             'population': country_data.get('population', 0),
             'casesPerOneMillion': country_data.get('casesPerOneMillion', 0),
             'deathsPerOneMillion': country_data.get('deathsPerOneMillion', 0),
-            'historical': historical_data.get('timeline', {})
+            'historical': timeline
         }
         
         if format_type.lower() == 'csv':
+            import pandas as pd
+
             # Convert to CSV format
             df = pd.DataFrame({
                 'Date': list(export_data['historical'].get('cases', {}).keys()),
@@ -322,6 +602,13 @@ def export_data(country):
             df = pd.concat([summary_df, df])
             
             return df.to_csv(index=False)
+        elif fmt:
+            # The timeline goes into typed columns and the summary into the metadata
+            historical = export_data.pop('historical')
+            dates = list(historical.get('cases', {}))
+            columns = {metric: [values.get(d, 0) for d in dates] for metric, values in historical.items()}
+            return columnar_response(fmt, dates, [country], columns, meta=export_data,
+                                     filename=f"{country}_covid_data.{'arrow' if fmt == 'arrow' else 'bin'}")
         else:
             return jsonify(export_data)
     except requests.exceptions.RequestException as e:
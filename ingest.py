@@ -0,0 +1,128 @@
+"""
+Ingest worker for the COVID-19 tracker.
+
+Owns all scheduled upstream fetching: the latest global and per-country
+figures are published as versioned snapshots in SNAPSHOT_DIR, the
+historical store is kept current in TIMESERIES_DIR and every country's
+vaccination coverage in VACCINE_DIR. Web workers started
+with EMBEDDED_INGEST=false only read what this worker writes.
+
+    python ingest.py           # refresh on a schedule until interrupted
+    python ingest.py --once    # refresh everything once and exit
+"""
+
+import argparse
+import os
+from datetime import datetime
+
+from aggregates import global_totals
+from config import *
+from country_frame import build_country_frame
+from repository import CovidRepository
+from timeseries import HistoricalStore
+
+
+def ingest_latest(repository, max_age=INGEST_INTERVAL_MINUTES * 60 / 2):
+    """Fetch the countries dataset and publish it, with global totals summed from it, as a new snapshot.
+
+    Nothing is published if the current snapshot already holds the data
+    fetched, for instance because another worker fetched it moments ago.
+    Returns the manifest of the current snapshot.
+    """
+    countries_data, timestamp = repository.latest('/countries', max_age=max_age)
+
+    current = repository.snapshots.current()
+    if current is not None and current['timestamp'] >= timestamp:
+        return current
+    # Summing the countries saves the separate upstream call to /all
+    global_data = global_totals(build_country_frame(countries_data))
+    return repository.snapshots.publish({'global': global_data, 'countries': countries_data}, timestamp)
+
+
+def ingest_historical(repository, store=None):
+    """Bring the historical store in TIMESERIES_DIR up to date and return it."""
+    return repository.historical_store(store, max_age=HISTORICAL_STORE_REFRESH_HOURS * 3600 / 2)
+
+
+def ingest_vaccines(repository, historical=None):
+    """Rebuild the vaccine store in VACCINE_DIR, aligned with the historical store if given, and return it."""
+    if historical is None and os.path.exists(os.path.join(TIMESERIES_DIR, 'meta.json')):
+        historical = HistoricalStore.load(TIMESERIES_DIR)
+    start = historical.start if historical is not None and historical.countries else None
+    return repository.vaccine_store(start=start, max_age=VACCINE_STORE_REFRESH_HOURS * 3600 / 2)
+
+
+class IngestWorker:
+    """Runs the ingest jobs, keeping the historical store between runs for delta refreshes."""
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.store = None
+        self.vaccines = None
+
+    def run_latest(self):
+        """Publish the latest snapshot; return True on success."""
+        try:
+            manifest = ingest_latest(self.repository)
+            print(f"Snapshot {manifest['version']} current at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            return True
+        except Exception as e:
+            print(f"Error ingesting COVID data: {e}")
+            return False
+
+    def run_historical(self):
+        """Refresh the historical store; return True on success."""
+        try:
+            self.store = ingest_historical(self.repository, self.store)
+            print(f"Historical store updated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            return True
+        except Exception as e:
+            print(f"Error ingesting historical data: {e}")
+            return False
+
+    def run_vaccines(self):
+        """Refresh the vaccine store; return True on success."""
+        try:
+            if self.store is None:
+                # Align with the historical store; the shared lock keeps a run in progress from fetching twice
+                self.run_historical()
+            self.vaccines = ingest_vaccines(self.repository, self.store)
+            print(f"Vaccine store updated at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+            return True
+        except Exception as e:
+            print(f"Error ingesting vaccine data: {e}")
+            return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--once', action='store_true', help="refresh everything once and exit")
+    args = parser.parse_args()
+
+    worker = IngestWorker(CovidRepository(fetch=True))
+    if args.once:
+        ok = worker.run_latest()
+        ok = worker.run_historical() and ok
+        ok = worker.run_vaccines() and ok
+        return 0 if ok else 1
+
+    # Imported here so the web app, which uses the ingest functions, does not pay for it
+    from apscheduler.schedulers.blocking import BlockingScheduler
+
+    # Every job also runs straight away, then on its own interval
+    scheduler = BlockingScheduler()
+    scheduler.add_job(worker.run_latest, trigger="interval", minutes=INGEST_INTERVAL_MINUTES,
+                      next_run_time=datetime.now())
+    scheduler.add_job(worker.run_historical, trigger="interval", hours=HISTORICAL_STORE_REFRESH_HOURS,
+                      next_run_time=datetime.now())
+    scheduler.add_job(worker.run_vaccines, trigger="interval", hours=VACCINE_STORE_REFRESH_HOURS,
+                      next_run_time=datetime.now())
+    try:
+        scheduler.start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
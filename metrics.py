@@ -0,0 +1,277 @@
+"""
+Request-level instrumentation for the COVID-19 tracker.
+
+Counters and histograms are kept in process and exposed in the Prometheus
+text format at /metrics by instrument_app(): per-route latency and
+response sizes, upstream call durations by endpoint and status, cache
+counters, and JSON serialization time and payload sizes. Each worker
+process reports its own figures, so scrape every worker.
+
+With PROFILER_ENABLED set, a sampling profiler records the stacks of the
+threads serving requests and writes the folded stacks of every request
+slower than PROFILER_SLOW_SECONDS to PROFILER_DIR, ready for
+flamegraph.pl or speedscope.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+
+from flask import Response, g, request
+from flask.json.provider import DefaultJSONProvider
+
+from config import PROFILER_DIR, PROFILER_ENABLED, PROFILER_INTERVAL, PROFILER_SLOW_SECONDS
+
+# Every metric created, in the order /metrics lists them
+REGISTRY = []
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Upstream paths ending in a country name are reported under one label
+UPSTREAM_ITEM_PATHS = re.compile(r'^/(countries|historical|vaccine/coverage/countries)/[^/]+$')
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Metric:
+    """A named metric with one value per combination of label values."""
+
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self.values.items())
+        for labels, value in items:
+            lines.extend(self.samples(labels, value))
+        return lines
+
+    def samples(self, labels, value):
+        return [f"{self.name}{format_labels(self.labels, labels)} {value}"]
+
+
+class Counter(Metric):
+    """Monotonic count, such as requests served."""
+
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        # Label values are rendered as text anyway; keeping them as str keeps them sortable
+        labels = tuple(map(str, labels))
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Histogram(Metric):
+    """Distribution of observed values over fixed buckets, such as request latency."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        labels = tuple(map(str, labels))
+        with self._lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                # One count per bucket, then the sum and count of all observations
+                entry = self.values[labels] = [0] * len(self.buckets) + [0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def samples(self, labels, value):
+        names = self.labels + ('le',)
+        lines = [f"{self.name}_bucket{format_labels(names, labels + (bound,))} {count}"
+                 for bound, count in zip(self.buckets, value)]
+        lines.append(f"{self.name}_bucket{format_labels(names, labels + ('+Inf',))} {value[-1]}")
+        lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {value[-2]}")
+        lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {value[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', "Time to handle a request, by route.",
+                            ('method', 'route', 'status'))
+RESPONSE_BYTES = Histogram('http_response_size_bytes', "Size of response bodies, by route.",
+                           ('route',), SIZE_BUCKETS)
+UPSTREAM_SECONDS = Histogram('upstream_request_duration_seconds',
+                             "Time of each disease.sh call attempt, by endpoint and status.",
+                             ('endpoint', 'status'))
+CACHE_LOOKUPS = Counter('cache_lookups_total', "Lookups of cached datasets, by key and outcome.",
+                        ('key', 'result'))
+JSON_SECONDS = Histogram('json_serialization_seconds', "Time spent encoding JSON payloads.", ('source',))
+JSON_BYTES = Histogram('json_payload_size_bytes', "Size of encoded JSON payloads.", ('source',), SIZE_BUCKETS)
+
+
+def upstream_endpoint(path):
+    """Return the label an upstream path is reported under, e.g. '/historical/:country'."""
+    path = '/' + path.split('?')[0].lstrip('/')
+    if UPSTREAM_ITEM_PATHS.match(path):
+        return path.rsplit('/', 1)[0] + '/:country'
+    return path
+
+
+def observe_json(source, started, size):
+    """Record one JSON encoding that began at perf_counter() time started."""
+    JSON_SECONDS.observe(time.perf_counter() - started, source)
+    JSON_BYTES.observe(size, source)
+
+
+def render_caches(stats):
+    """Render repository-style cache stats ({namespace: stats}) as Prometheus samples."""
+    lines = []
+    for field, kind, documentation in (('hits', 'counter', "Cache hits"),
+                                       ('misses', 'counter', "Cache misses"),
+                                       ('evictions', 'counter', "Entries evicted to stay within bounds"),
+                                       ('entries', 'gauge', "Entries currently cached"),
+                                       ('bytes', 'gauge', "Approximate size of cached entries")):
+        samples = [(namespace, s[field]) for namespace, s in sorted(stats.items()) if s.get(field) is not None]
+        if samples:
+            name = f"cache_{field}_total" if kind == 'counter' else f"cache_{field}"
+            lines.append(f"# HELP {name} {documentation}, by cache.")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{format_labels(('cache',), (namespace,))} {value}" for namespace, value in samples)
+    return lines
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider recording how long jsonify() spends encoding and how big the result is."""
+
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        body = super().dumps(obj, **kwargs)
+        observe_json('jsonify', started, len(body))
+        return body
+
+
+class SamplingProfiler:
+    """Samples the stacks of threads serving requests and keeps those of slow requests.
+
+    A background thread looks at every registered thread each interval
+    seconds; when a request ends after more than threshold seconds, its
+    samples are written to directory as folded stacks (one
+    'outer;...;inner count' line per distinct stack).
+    """
+
+    def __init__(self, directory=PROFILER_DIR, interval=PROFILER_INTERVAL, threshold=PROFILER_SLOW_SECONDS):
+        self.directory = directory
+        self.interval = interval
+        self.threshold = threshold
+        self.active = {}  # thread id -> (route, start, samples)
+        self.thread = None
+        self._lock = threading.Lock()
+
+    def begin(self, route):
+        """Start sampling the calling thread for a request to route."""
+        with self._lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+                self.thread.start()
+            self.active[threading.get_ident()] = (route, time.perf_counter(), StackCounter())
+
+    def end(self):
+        """Stop sampling the calling thread; return the profile file written, if the request was slow."""
+        with self._lock:
+            entry = self.active.pop(threading.get_ident(), None)
+        if entry is None:
+            return None
+        route, started, samples = entry
+        duration = time.perf_counter() - started
+        if duration < self.threshold or not samples:
+            return None
+
+        os.makedirs(self.directory, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        path = os.path.join(self.directory, f"{name}-{int(time.time() * 1000)}-{int(duration * 1000)}ms.folded")
+        with open(path, 'w') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in samples.most_common())
+        return path
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                active = list(self.active.items())
+            for ident, (_, _, samples) in active:
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if stack:
+                    samples[';'.join(reversed(stack))] += 1
+
+
+def instrument_app(app, caches=None):
+    """Record request metrics for a Flask app and serve them at /metrics.
+
+    caches is a function returning {namespace: stats} for the caches the
+    app reads through, such as repository.stats.
+    """
+    profiler = SamplingProfiler() if PROFILER_ENABLED else None
+
+    # Keep the app's JSON settings, such as sort_keys, on the timed provider
+    provider = TimedJSONProvider(app)
+    provider.sort_keys = app.json.sort_keys
+    app.json = provider
+
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+        if profiler is not None:
+            profiler.begin(request.url_rule.rule if request.url_rule else request.path)
+
+    def record(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, route, response.status_code)
+        # Streamed responses have no length until they are sent
+        if response.content_length is not None:
+            RESPONSE_BYTES.observe(response.content_length, route)
+        return response
+
+    def stop_profiler(error):
+        profiler.end()
+
+    # Timing starts before any other before_request hook the app registered
+    app.before_request_funcs.setdefault(None, []).insert(0, start_timer)
+    app.after_request(record)
+    if profiler is not None:
+        app.teardown_request(stop_profiler)
+
+    @app.route('/metrics')
+    def metrics():
+        """Prometheus metrics for this worker process."""
+        lines = []
+        for metric in REGISTRY:
+            lines.extend(metric.render())
+        if caches is not None:
+            lines.extend(render_caches(caches()))
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
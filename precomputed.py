@@ -0,0 +1,75 @@
+"""
+Pre-serialized, pre-compressed JSON responses for the COVID-19 tracker.
+
+Payloads that only change on a data refresh are encoded once, together
+with their gzip and brotli variants, and served as raw bytes with
+ETag/Last-Modified validators.
+"""
+
+import gzip
+import hashlib
+import json
+import time
+
+import brotli
+from flask import Response, request
+
+from config import RESPONSE_BROTLI_QUALITY, RESPONSE_GZIP_LEVEL
+from metrics import observe_json
+
+
+class PrecomputedResponse:
+    """A JSON payload encoded once in identity, gzip and brotli forms."""
+
+    def __init__(self, payload, last_modified):
+        started = time.perf_counter()
+        self.body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        observe_json('precomputed', started, len(self.body))
+        self.last_modified = last_modified
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+
+        self.encodings = {
+            'gzip': gzip.compress(self.body, compresslevel=RESPONSE_GZIP_LEVEL),
+            'br': brotli.compress(self.body, quality=RESPONSE_BROTLI_QUALITY),
+        }
+
+    def etags(self):
+        """Return every ETag this payload is served under, one per encoding."""
+        return [self.etag] + [f"{self.etag}-{encoding}" for encoding in self.encodings]
+
+
+def choose_encoding(precomputed):
+    """Pick the smallest encoding the client accepts, or None for identity."""
+    accepted = [encoding for encoding in precomputed.encodings
+                if request.accept_encodings[encoding] > 0]
+    if not accepted:
+        return None
+    return min(accepted, key=lambda encoding: len(precomputed.encodings[encoding]))
+
+
+def serve_precomputed(precomputed):
+    """Serve a PrecomputedResponse, answering matching conditional requests with 304."""
+    encoding = choose_encoding(precomputed)
+    etag = f"{precomputed.etag}-{encoding}" if encoding else precomputed.etag
+
+    not_modified = False
+    if request.if_none_match:
+        not_modified = (request.if_none_match.star_tag or
+                        any(request.if_none_match.contains_weak(tag) for tag in precomputed.etags()))
+    elif request.if_modified_since:
+        not_modified = int(precomputed.last_modified) <= request.if_modified_since.timestamp()
+
+    if not_modified:
+        response = Response(status=304)
+    else:
+        body = precomputed.encodings[encoding] if encoding else precomputed.body
+        response = Response(body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+
+    response.set_etag(etag)
+    response.last_modified = int(precomputed.last_modified)
+    response.headers['Vary'] = 'Accept-Encoding'
+    # Let clients keep the bytes but revalidate them on every poll
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,58 @@
+"""
+Single-flight refresh coordination for the COVID-19 tracker caches.
+
+Concurrent requests that find the same cache entry expired share one
+upstream fetch instead of each starting their own.
+"""
+
+import threading
+from concurrent.futures import Future
+
+
+class RefreshCoordinator:
+    """Run at most one refresh per cache key at a time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+
+    def refresh(self, key, func, wait=True):
+        """Run func for key unless a refresh is already in flight and return its Future.
+
+        With wait=False the refresh runs on a background thread and the caller
+        returns immediately, so it can keep serving the data it already has.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if owner:
+            if wait:
+                self._run(key, func, future)
+            else:
+                threading.Thread(target=self._run, args=(key, func, future),
+                                 name=f"refresh-{key}", daemon=True).start()
+
+        if wait:
+            future.exception()  # block until the in-flight refresh finishes
+        return future
+
+    def in_flight(self, key):
+        """Return True if a refresh for key is currently running."""
+        with self._lock:
+            return key in self._inflight
+
+    def _run(self, key, func, future):
+        try:
+            result = func()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+        else:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(result)
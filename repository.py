@@ -0,0 +1,292 @@
+"""
+Data-access layer shared by both COVID-19 tracker apps.
+
+All upstream data goes through one CovidRepository, which keeps it in the
+cache backend chosen by CACHE_BACKEND. With a shared backend every worker
+process sees what any worker fetched, and a lock held in the same backend
+makes sure only one worker calls upstream per refresh while the others
+wait for its result.
+
+Whole datasets are read from the snapshots published by the ingest worker
+when there are fresh ones. A repository built with fetch=False, as web
+workers are when EMBEDDED_INGEST is off, never fetches them itself.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+import requests
+
+from cache_backends import make_cache
+from config import *
+from country_index import build_country_index, lookup_country
+from refresh import RefreshCoordinator
+from snapshots import SnapshotStore
+from timeseries import HistoricalStore, refresh_store
+from vaccines import VaccineStore
+from upstream import BACKUP_FILES, upstream
+
+# Snapshot dataset holding each whole-dataset endpoint
+SNAPSHOT_DATASETS = {'/all': 'global', '/countries': 'countries'}
+
+
+class CovidRepository:
+    """Cached access to the disease.sh datasets, shared between workers."""
+
+    def __init__(self, client=upstream, caches=None, fetch=True):
+        self.client = client
+        self.fetch = fetch
+        self.snapshots = SnapshotStore(SNAPSHOT_DIR)
+        self.caches = caches or {
+            'latest': make_cache('latest', CACHE_HARD_EXPIRATION),
+            'country': make_cache('country', CACHE_EXPIRATION),
+            'historical': make_cache('historical', CACHE_EXPIRATION,
+                                     HISTORICAL_CACHE_MAX_ENTRIES, HISTORICAL_CACHE_MAX_BYTES),
+            'vaccine': make_cache('vaccine', CACHE_EXPIRATION,
+                                  VACCINE_CACHE_MAX_ENTRIES, VACCINE_CACHE_MAX_BYTES),
+        }
+        self.refresher = RefreshCoordinator()
+        # Last whole-dataset entry this process has seen, so fresh reads skip the backend
+        self._latest = {}
+        # Snapshot datasets already loaded, keyed by name: (version, data, timestamp)
+        self._snapshots = {}
+
+    @contextmanager
+    def shared_lock(self, name, timeout=SHARED_LOCK_TIMEOUT):
+        """Hold a lock shared by every worker, or wait until the worker holding it is done.
+
+        Yields True if this process got the lock. Locks expire after timeout
+        so a crashed worker cannot hold one forever.
+        """
+        cache = self.caches['latest']
+        key = f"lock:{name}"
+        acquired = cache.add(key, os.getpid(), timeout=timeout)
+        if not acquired:
+            deadline = time.time() + timeout
+            while time.time() < deadline and cache.get(key) is not None:
+                time.sleep(SHARED_LOCK_POLL)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cache.delete(key)
+
+    def latest(self, path, max_age=CACHE_EXPIRATION):
+        """Return (data, timestamp) for a whole-dataset endpoint such as '/countries'.
+
+        Data fetched less than max_age seconds ago by any worker is reused.
+        Otherwise one worker fetches it and saves a backup while the others
+        wait for its result. Raises a requests exception if the fetch fails.
+        """
+        entry = self._latest.get(path)
+        if entry is None or time.time() - entry['timestamp'] > max_age:
+            future = self.refresher.refresh(path, lambda: self._refresh_latest(path, max_age))
+            entry = future.result()
+        return entry['data'], entry['timestamp']
+
+    def snapshot(self, name):
+        """Return (data, timestamp) of a dataset in the current snapshot, or (None, None)."""
+        manifest = self.snapshots.current()
+        if manifest is None or name not in manifest['datasets']:
+            return None, None
+        loaded = self._snapshots.get(name)
+        if loaded is None or loaded[0] != manifest['version']:
+            loaded = (manifest['version'], self.snapshots.load(manifest, name), manifest['timestamp'])
+            self._snapshots[name] = loaded
+        return loaded[1], loaded[2]
+
+    def dataset(self, path):
+        """Return the data of a whole-dataset endpoint.
+
+        A fresh snapshot is used first, then upstream (when this repository
+        fetches), then an expired snapshot, then the backup file.
+        """
+        data, timestamp = self.snapshot(SNAPSHOT_DATASETS[path])
+        if data is not None and (not self.fetch or time.time() - timestamp <= CACHE_EXPIRATION):
+            return data
+
+        if self.fetch:
+            try:
+                return self.latest(path)[0]
+            except requests.exceptions.RequestException:
+                if data is not None:
+                    return data
+                backup = self.client.load_backup(BACKUP_FILES.get(path))
+                if backup is None:
+                    raise
+                return backup
+
+        backup = self.client.load_backup(BACKUP_FILES.get(path))
+        if backup is None:
+            raise requests.exceptions.ConnectionError(f"No snapshot of {path} has been published yet")
+        return backup
+
+    def country(self, name):
+        """Return upstream stats for one country."""
+        return self._cached_json(*self.country_request(name))
+
+    def countries(self, names):
+        """Return {name: upstream stats} for several countries, fetching the uncached ones in one call.
+
+        Names upstream does not know are left out.
+        """
+        found, missing = {}, []
+        for name in names:
+            data = self.caches['country'].get(name.lower())
+            if data is None:
+                missing.append(name)
+            else:
+                found[name] = data
+        if len(missing) == 1:
+            found[missing[0]] = self.country(missing[0])
+        elif missing:
+            # disease.sh accepts a comma-separated list and returns every match at once
+            response = self.client.get(f"/countries/{','.join(missing)}")
+            response.raise_for_status()
+            data = response.json()
+            index = build_country_index([data] if isinstance(data, dict) else data)
+            for name in missing:
+                record = lookup_country(index, name)
+                if record is not None:
+                    found[name] = self.store_json('country', name.lower(), record)
+        return found
+
+    def historical(self, country, days):
+        """Return upstream historical JSON for one country (or 'all') over the last days."""
+        return self._cached_json(*self.historical_request(country, days))
+
+    def vaccine(self, country, days=None):
+        """Return upstream vaccine coverage JSON for one country, upstream's default range if days is None."""
+        return self._cached_json(*self.vaccine_request(country, days))
+
+    # Each *_request() returns the (namespace, key, path, params, backup) its
+    # reader goes through, so the async gateway can fill the same cache entry.
+    # Backups are kept per range, so a fallback never answers with another one
+
+    def country_request(self, name):
+        return 'country', name.lower(), f"/countries/{name}", None, None
+
+    def historical_request(self, country, days):
+        return ('historical', f"{country.lower()}:{days}", f"/historical/{country}",
+                {'lastdays': days}, f"historical/{country.lower()}:{days}")
+
+    def vaccine_request(self, country, days=None):
+        params = {'lastdays': days} if days is not None else None
+        return ('vaccine', f"{country.lower()}:{days}", f"/vaccine/coverage/countries/{country}",
+                params, f"vaccine/{country.lower()}:{days}")
+
+    def historical_store(self, store=None, max_age=HISTORICAL_STORE_REFRESH_HOURS * 3600):
+        """Return an up-to-date HistoricalStore, refreshing it from upstream in one worker only.
+
+        The store is saved in TIMESERIES_DIR, so a worker that finds it was
+        refreshed less than max_age seconds ago loads that copy instead. A
+        repository that does not fetch only ever loads the saved copy.
+        """
+        meta_path = os.path.join(TIMESERIES_DIR, 'meta.json')
+        if not self.fetch:
+            saved = self._load_historical() if os.path.exists(meta_path) else None
+            return store if saved is None else saved
+        with self.shared_lock('timeseries', STORE_LOCK_TIMEOUT):
+            if os.path.exists(meta_path):
+                saved = self._load_historical()
+                if saved is not None and time.time() - os.path.getmtime(meta_path) < max_age:
+                    return saved
+                # A saved copy this version cannot read is rebuilt with a full fetch
+                if store is None:
+                    store = saved
+            store = refresh_store(store, self.client, '/historical')
+            store.save(TIMESERIES_DIR)
+            return store
+
+    def _load_historical(self):
+        """Load the saved HistoricalStore, or return None if it was saved in an older layout."""
+        try:
+            return HistoricalStore.load(TIMESERIES_DIR)
+        except (KeyError, FileNotFoundError) as e:
+            # Stores from before the incremental refresh lack lastKnown and the daily arrays
+            print(f"Ignoring saved historical store in an older layout: {e!r}")
+            return None
+
+    def vaccine_store(self, store=None, start=None, max_age=VACCINE_STORE_REFRESH_HOURS * 3600):
+        """Return an up-to-date VaccineStore, fetching every country in one call in one worker only.
+
+        start is the historical store's first day, which the columns are
+        aligned with. Like historical_store(), a copy saved in VACCINE_DIR
+        less than max_age seconds ago is loaded instead of fetching.
+        """
+        meta_path = os.path.join(VACCINE_DIR, 'meta.json')
+        if not self.fetch:
+            return VaccineStore.load(VACCINE_DIR) if os.path.exists(meta_path) else store
+        with self.shared_lock('vaccines', STORE_LOCK_TIMEOUT):
+            if os.path.exists(meta_path) and time.time() - os.path.getmtime(meta_path) < max_age:
+                return VaccineStore.load(VACCINE_DIR)
+            response = self.client.get('/vaccine/coverage/countries', params={'lastdays': 'all'})
+            response.raise_for_status()
+            populations = {c['country']: c.get('population') or 0 for c in self.dataset('/countries')}
+            store = VaccineStore.from_upstream(response.json(), populations, start)
+            store.save(VACCINE_DIR)
+            return store
+
+    def stats(self):
+        """Return the counters of every cache namespace."""
+        return {namespace: cache.stats() for namespace, cache in self.caches.items()}
+
+    def _refresh_latest(self, path, max_age):
+        cache = self.caches['latest']
+        entry = cache.get(path)
+        if entry is None or time.time() - entry['timestamp'] > max_age:
+            with self.shared_lock(path):
+                # Another worker may have fetched it while we waited for the lock
+                entry = cache.get(path)
+                if entry is None or time.time() - entry['timestamp'] > max_age:
+                    response = self.client.get(path)
+                    response.raise_for_status()
+                    entry = {'data': response.json(), 'timestamp': time.time()}
+                    cache.set(path, entry)
+                    self._save_backup(BACKUP_FILES.get(path), entry['data'])
+        self._latest[path] = entry
+        return entry
+
+    def store_json(self, namespace, key, data, backup=None):
+        """Cache data fetched from upstream and keep a backup of it; return data."""
+        self.caches[namespace].set(key, data)
+        self._save_backup(backup, data)
+        return data
+
+    def fallback_json(self, namespace, key, backup=None):
+        """Cache and return the backup for an entry upstream could not serve, or None."""
+        data = self.client.load_backup(backup)
+        if data is not None:
+            self.caches[namespace].set(key, data)
+        return data
+
+    def _cached_json(self, namespace, key, path, params=None, backup=None):
+        """Serve JSON from a cache namespace, fetching it from upstream on a miss.
+
+        HTTP errors such as 404 are raised; if upstream cannot be reached the
+        backup file is used instead.
+        """
+        data = self.caches[namespace].get(key)
+        if data is None:
+            try:
+                response = self.client.get(path, params=params)
+                response.raise_for_status()
+                data = self.store_json(namespace, key, response.json(), backup)
+            except requests.exceptions.HTTPError:
+                raise
+            except requests.exceptions.RequestException:
+                data = self.fallback_json(namespace, key, backup)
+                if data is None:
+                    raise
+        return data
+
+    def _save_backup(self, name, data):
+        try:
+            self.client.save_backup(name, data)
+        except OSError as e:
+            print(f"Error saving backup {name}: {e}")
+
+
+# Shared data-access layer used by both apps
+repository = CovidRepository(fetch=EMBEDDED_INGEST)
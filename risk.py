@@ -0,0 +1,79 @@
+"""
+Vectorized risk scoring for the COVID-19 tracker.
+
+Both risk algorithms are applied to every country at once from the columnar
+snapshot built in country_frame, so a refresh scores the whole world in a
+handful of array operations and per-country requests become lookups.
+"""
+
+import numpy as np
+
+RISK_LEVELS = np.array(['Very Low', 'Low', 'Moderate', 'High', 'Very High'])
+
+# Band edges for the app.py score; a value scores one point per edge it exceeds
+ACTIVE_PER_MILLION_BANDS = [100, 500, 1000, 5000, 10000]
+CASE_FATALITY_BANDS = [0.5, 1, 2, 3, 5]
+
+# Total band score needed for each level above 'Very Low'
+RISK_LEVEL_THRESHOLDS = [2, 4, 6, 8]
+
+# Weighted 0-100 score from index.py; categories start above these values
+WEIGHTED_CATEGORY_THRESHOLDS = [10, 30, 50, 70]
+
+
+def band_scores(active_per_million, case_fatality_rate):
+    """Return the 0-10 band score and level for arrays of country metrics."""
+    # right=True makes a value sitting exactly on an edge fall in the lower band
+    active_points = np.digitize(active_per_million, ACTIVE_PER_MILLION_BANDS, right=True)
+    fatality_points = np.digitize(case_fatality_rate, CASE_FATALITY_BANDS, right=True)
+    scores = active_points + fatality_points
+    levels = RISK_LEVELS[np.digitize(scores, RISK_LEVEL_THRESHOLDS)]
+    return scores, levels
+
+
+def weighted_scores(active_per_million, deaths_per_million, critical_per_million, tests_per_million):
+    """Return the weighted 0-100 score and category for arrays of per-million metrics."""
+    active_risk = np.minimum(np.asarray(active_per_million) / 500, 100) * 0.4
+    death_risk = np.minimum(np.asarray(deaths_per_million) / 250, 100) * 0.3
+    critical_risk = np.minimum(np.asarray(critical_per_million) / 25, 100) * 0.2
+
+    # Testing factor (more tests = lower risk)
+    testing_factor = np.clip(1 - np.asarray(tests_per_million) / 500000, 0, 1) * 0.1
+
+    totals = active_risk + death_risk + critical_risk + testing_factor
+    categories = RISK_LEVELS[np.digitize(totals, WEIGHTED_CATEGORY_THRESHOLDS, right=True)]
+    return totals, categories
+
+
+def build_risk_table(frame):
+    """Score every country in the snapshot and return a table ranked from highest risk down."""
+    if frame is None or frame.empty:
+        return None
+
+    import pandas as pd
+
+    active_per_million = frame['activePerMillion'].to_numpy()
+    case_fatality_rate = frame['caseFatalityRate'].to_numpy()
+    scores, levels = band_scores(active_per_million, case_fatality_rate)
+    weighted, categories = weighted_scores(frame['activePerOneMillion'], frame['deathsPerOneMillion'],
+                                           frame['criticalPerOneMillion'], frame['testsPerOneMillion'])
+
+    table = pd.DataFrame({
+        'country': frame['country'].to_numpy(),
+        'flag': frame['flag'].to_numpy(),
+        'riskScore': scores,
+        'riskLevel': levels,
+        'activeCasesPerMillion': active_per_million,
+        'caseFatalityRate': case_fatality_rate,
+        'weightedScore': np.round(weighted, 2),
+        'weightedCategory': categories,
+        'activePerOneMillion': frame['activePerOneMillion'].to_numpy(),
+        'deathsPerOneMillion': frame['deathsPerOneMillion'].to_numpy(),
+        'criticalPerOneMillion': frame['criticalPerOneMillion'].to_numpy(),
+        'testsPerOneMillion': frame['testsPerOneMillion'].to_numpy(),
+    }, index=frame.index)
+
+    # Rank by band score, breaking ties with the finer-grained weighted score
+    table = table.sort_values(['riskScore', 'weightedScore'], ascending=False, kind='stable')
+    table['rank'] = np.arange(1, len(table) + 1)
+    return table
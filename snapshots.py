@@ -0,0 +1,212 @@
+"""
+Atomic, compact on-disk snapshots of the COVID-19 datasets.
+
+Everything kept on disk between runs goes through this module: the
+versioned snapshots the ingest worker publishes, the versioned historical
+store and the per-key fallback copies of upstream responses. Files are
+always written under a temporary name and renamed into place, so a crash
+mid-write never leaves a truncated file where a reader could find it.
+
+Datasets are encoded with msgpack and decoded through mmap. JSON files
+written by older versions are still read, but never written.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+
+import msgpack
+
+from config import SNAPSHOT_KEEP_VERSIONS
+
+MANIFEST = 'manifest.json'
+
+# Encoding used for new files; JSON files already written are still read
+SNAPSHOT_FORMAT = 'msgpack'
+
+# Characters allowed in a file name derived from a key
+UNSAFE_KEY_CHARS = re.compile(r'[^a-z0-9_-]+')
+
+
+def safe_key(key):
+    """Turn an arbitrary key, such as one built from a URL, into a safe file name.
+
+    Keys are lowercased and anything outside [a-z0-9_-] is replaced; a
+    digest of the original key is appended whenever that changed it, so
+    distinct keys never share a file.
+    """
+    name = UNSAFE_KEY_CHARS.sub('_', key.lower()).strip('_')[:80]
+    if name != key:
+        name = f"{name}-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:10]}"
+    return name
+
+
+def encode(data):
+    """Encode a JSON-compatible value as msgpack bytes."""
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def decode(buffer, fmt):
+    """Decode bytes written by encode(), or by older versions in the 'json' format."""
+    if fmt == 'msgpack':
+        return msgpack.unpackb(buffer, raw=False, strict_map_key=False)
+    return json.loads(buffer)
+
+
+def read_file(path, fmt):
+    """Decode one file; msgpack is decoded straight from a memory map instead of a copy of the file."""
+    with open(path, 'rb') as f:
+        # json.loads cannot read a memory map, so JSON is read into one buffer
+        if fmt != 'msgpack' or os.fstat(f.fileno()).st_size == 0:
+            return decode(f.read(), fmt)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return decode(mapped, fmt)
+
+
+def write_atomic(path, payload):
+    """Write bytes to path by renaming a fully written temporary file over it."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class SnapshotStore:
+    """A directory of immutable snapshot versions plus a manifest naming the current one."""
+
+    def __init__(self, directory, keep=SNAPSHOT_KEEP_VERSIONS, manifest=MANIFEST):
+        self.directory = directory
+        self.keep = keep
+        self.manifest = manifest
+
+    def current(self):
+        """Return the manifest of the current version, or None if nothing is published yet."""
+        try:
+            with open(os.path.join(self.directory, self.manifest), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def path(self, manifest, filename):
+        """Return the path of a file in the version a manifest points at."""
+        return os.path.join(self.directory, manifest['version'], filename)
+
+    def load(self, manifest, name):
+        """Load one dataset of the version a manifest points at."""
+        fmt = manifest.get('format', 'json')
+        return read_file(self.path(manifest, f"{safe_key(name)}.{fmt}"), fmt)
+
+    def publish(self, datasets, timestamp):
+        """Write datasets ({name: data}) as a new version and make it current; return its manifest."""
+        def write(version_dir):
+            for name, data in datasets.items():
+                with open(os.path.join(version_dir, f"{safe_key(name)}.{SNAPSHOT_FORMAT}"), 'wb') as f:
+                    f.write(encode(data))
+
+        return self.publish_files(write, {'timestamp': timestamp, 'format': SNAPSHOT_FORMAT,
+                                          'datasets': sorted(datasets)}, timestamp)
+
+    def publish_files(self, write, manifest, timestamp=None):
+        """Publish a new version whose files write(version_dir) creates; return its manifest.
+
+        manifest holds whatever readers need besides the version name, which
+        is added to it.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        version = f"v{int((timestamp or time.time()) * 1000)}"
+        if os.path.exists(os.path.join(self.directory, version)):
+            version = f"{version}-{os.getpid()}"
+        version_dir = os.path.join(self.directory, version)
+
+        # Fill a private directory, then rename it into place in one step
+        tmp_dir = os.path.join(self.directory, f".tmp-{version}-{os.getpid()}")
+        os.makedirs(tmp_dir)
+        try:
+            write(tmp_dir)
+            os.rename(tmp_dir, version_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        manifest = dict(manifest, version=version)
+        write_atomic(os.path.join(self.directory, self.manifest), json.dumps(manifest).encode('utf-8'))
+
+        self.prune(version)
+        return manifest
+
+    def versions(self):
+        """Return the published version names, oldest first."""
+        if not os.path.isdir(self.directory):
+            return []
+        names = [n for n in os.listdir(self.directory)
+                 if n.startswith('v') and os.path.isdir(os.path.join(self.directory, n))]
+        return sorted(names, key=lambda n: int(n[1:].split('-')[0]))
+
+    def prune(self, current):
+        """Delete all but the newest `keep` versions, never the current one."""
+        # Older versions stay around briefly for readers that loaded the previous manifest
+        for name in self.versions()[:-self.keep]:
+            if name != current:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+
+class BackupStore:
+    """Last good copy of each upstream response, used when upstream cannot be reached.
+
+    Each key is kept in its own file named by safe_key(). Decoded copies are
+    kept in memory until the file changes, so repeated fallbacks during an
+    outage do not decode the same file again. Backups written as JSON by
+    older versions (DATA_DIR/<key>_data.json) are still read until a new
+    copy replaces them.
+    """
+
+    def __init__(self, directory, legacy_dir=None):
+        self.directory = directory
+        self.legacy_dir = legacy_dir
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        """Return the backup stored under key, or None if there is none."""
+        if not key:
+            return None
+        for path, fmt in self._candidates(key):
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            with self._lock:
+                loaded = self._loaded.get(key)
+            if loaded is not None and loaded[0] == (path, mtime):
+                return loaded[1]
+            try:
+                data = read_file(path, fmt)
+            except (OSError, ValueError) as e:
+                print(f"Error reading backup {path}: {e}")
+                continue
+            with self._lock:
+                self._loaded[key] = ((path, mtime), data)
+            return data
+        return None
+
+    def save(self, key, data):
+        """Store data as the backup for key, replacing any older copy."""
+        if not key:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        write_atomic(os.path.join(self.directory, f"{safe_key(key)}.{SNAPSHOT_FORMAT}"), encode(data))
+
+    def _candidates(self, key):
+        name = safe_key(key)
+        yield os.path.join(self.directory, f"{name}.{SNAPSHOT_FORMAT}"), SNAPSHOT_FORMAT
+        yield os.path.join(self.directory, f"{name}.json"), 'json'
+        # Legacy names are only trusted for keys that were already safe path segments
+        if self.legacy_dir and all(part and safe_key(part) == part for part in key.split('/')):
+            yield os.path.join(self.legacy_dir, f"{key}_data.json"), 'json'
@@ -32,7 +32,7 @@ document.addEventListener('DOMContentLoaded', () => {
      * Fetch all countries data
      */
     function fetchCountries() {
-        fetch('/api/countries')
+        fetch('/api/countries?fields=country,flag')
             .then(response => {
                 if (!response.ok) {
                     throw new Error('Network response was not ok');
@@ -117,7 +117,7 @@ document.addEventListener('DOMContentLoaded', () => {
         
         // Find country flag
         const countryData = countriesCache.find(c => c.country === countryName);
-        const flagUrl = countryData ? countryData.countryInfo.flag : '';
+        const flagUrl = countryData ? countryData.flag : '';
         
         // Create pill content
         countryPill.innerHTML = `
@@ -203,7 +203,7 @@ document.addEventListener('DOMContentLoaded', () => {
             
             // Find country flag
             const countryData = countriesCache.find(c => c.country === country.country);
-            const flagUrl = countryData ? countryData.countryInfo.flag : '';
+            const flagUrl = countryData ? countryData.flag : '';
             
             row.innerHTML = `
                 <td>
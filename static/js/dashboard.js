@@ -8,6 +8,10 @@ let worldMap = null;
 let globalTrendsChart = null;
 let vaccinationChart = null;
 let historicalData = null;
+let countryMarkers = null;
+
+// Maximum points requested for the trends chart
+const CHART_POINTS = 200;
 
 // Initialize the dashboard
 function initDashboard() {
@@ -25,6 +29,13 @@ function initDashboard() {
     document.getElementById('date-range-selector').addEventListener('change', (e) => {
         updateHistoricalCharts(e.target.value);
     });
+    
+    // Redraw what depends on the latest figures whenever the server pushes a refresh
+    document.addEventListener('covid-data-updated', (e) => {
+        if (e.detail && !Object.keys(e.detail.countries || {}).length) return;
+        addCountriesToMap();
+        loadTopCountriesTable();
+    });
 }
 
 // Initialize the world map using Leaflet
@@ -59,6 +70,13 @@ function initWorldMap() {
 
 // Add countries COVID data to the map
 function addCountriesToMap() {
+    // Replace the markers drawn from older data
+    if (countryMarkers) {
+        countryMarkers.clearLayers();
+    } else {
+        countryMarkers = L.layerGroup().addTo(worldMap);
+    }
+    
     countriesData.forEach(country => {
         if (!country.countryInfo || !country.countryInfo.lat || !country.countryInfo.long) {
             return; // Skip countries without coordinates
@@ -75,7 +93,7 @@ function addCountriesToMap() {
             fillColor: color,
             fillOpacity: 0.6,
             radius: Math.max(radius * 50000, 50000) // Ensure minimum visibility
-        }).addTo(worldMap);
+        }).addTo(countryMarkers);
         
         // Add popup with country information
         marker.bindPopup(`
@@ -333,7 +351,8 @@ function loadTopCountriesTable() {
 // Fetch historical data for a country
 async function fetchHistoricalData(country, days = 30) {
     try {
-        const response = await fetch(`${appUtils.API_BASE_URL}/api/historical/${country}?days=${days}`);
+        // Long ranges are downsampled on the server to about one point per few pixels
+        const response = await fetch(`${appUtils.API_BASE_URL}/api/historical/${country}?days=${days}&points=${CHART_POINTS}`);
         if (!response.ok) {
             throw new Error(`Failed to fetch historical data for ${country}`);
         }
@@ -91,6 +91,45 @@ function updateGlobalStats(data) {
     lastUpdatedElement.textContent = formatDate(data.updated);
 }
 
+// Apply a refresh diff pushed by /api/stream to the loaded data
+function applyUpdate(update) {
+    if (update.global && globalData) {
+        Object.assign(globalData, update.global);
+        updateGlobalStats(globalData);
+    }
+    
+    const changes = update.countries || {};
+    countriesData.forEach(country => {
+        if (changes[country.country]) {
+            Object.assign(country, changes[country.country]);
+            delete changes[country.country];
+        }
+    });
+    // Whatever is left are countries we did not have yet
+    countriesData.push(...Object.values(changes));
+}
+
+// Listen for data refreshes instead of polling for them
+function subscribeToUpdates() {
+    if (!window.EventSource) return;
+    
+    const stream = new EventSource(`${API_BASE_URL}/api/stream`);
+    
+    stream.addEventListener('update', (event) => {
+        const update = JSON.parse(event.data);
+        applyUpdate(update);
+        document.dispatchEvent(new CustomEvent('covid-data-updated', { detail: update }));
+    });
+    
+    // Sent when we missed too many updates to catch up from diffs
+    stream.addEventListener('reset', async () => {
+        await Promise.all([fetchGlobalData(), fetchCountriesData()]);
+        document.dispatchEvent(new CustomEvent('covid-data-updated', { detail: null }));
+    });
+    
+    // The browser reconnects by itself and resumes from the last update it saw
+}
+
 // Show error message
 function showErrorMessage(message) {
     // Could be enhanced with a proper error notification system
@@ -155,6 +194,8 @@ async function initApp() {
     if (typeof initCompare === 'function') initCompare();
     if (typeof initVaccination === 'function') initVaccination();
     if (typeof initRisk === 'function') initRisk();
+    
+    subscribeToUpdates();
 }
 
 // Event Listeners
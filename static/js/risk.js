@@ -21,6 +21,10 @@ document.addEventListener('DOMContentLoaded', () => {
     const vaccinationCoverage = document.getElementById('vaccination-coverage');
     const vaccinationCoverageBar = document.getElementById('vaccination-coverage-bar');
     const recommendationsContainer = document.getElementById('recommendations-container');
+    const riskRankingBody = document.querySelector('#risk-ranking-table tbody');
+
+    // Number of countries shown in the global ranking
+    const RANKING_SIZE = 10;
 
     // Countries data cache
     let countriesCache = [];
@@ -30,20 +34,72 @@ document.addEventListener('DOMContentLoaded', () => {
         // Fetch countries for search
         fetchCountries();
 
+        // Fetch the global ranking, scored for all countries in one call
+        fetchRiskRanking();
+
         // Set up event listeners
         riskCountrySearch.addEventListener('input', handleCountrySearch);
         riskSearchSuggestions.addEventListener('click', handleSuggestionClick);
+        riskRankingBody.addEventListener('click', handleRankingClick);
+    }
+
+    // Fetch the highest risk countries
+    async function fetchRiskRanking() {
+        try {
+            const response = await fetch(`/api/risk-assessment?limit=${RANKING_SIZE}`);
+            if (!response.ok) {
+                throw new Error('Failed to fetch risk ranking');
+            }
+
+            const ranking = await response.json();
+            updateRiskRanking(ranking);
+        } catch (error) {
+            console.error('Error fetching risk ranking:', error);
+            riskRankingBody.innerHTML = '<tr><td colspan="4" class="loading-message">Failed to load risk ranking.</td></tr>';
+        }
+    }
+
+    // Render the global ranking table
+    function updateRiskRanking(ranking) {
+        riskRankingBody.innerHTML = '';
+
+        ranking.forEach(entry => {
+            const row = document.createElement('tr');
+            row.setAttribute('data-country', entry.country);
+
+            const flag = entry.flag ?
+                `<img src="${entry.flag}" alt="${entry.country} flag" class="suggestion-flag">` : '';
+
+            row.innerHTML = `
+                <td>${entry.rank}</td>
+                <td>${flag} ${entry.country}</td>
+                <td class="${getRiskLevelClass(entry.riskLevel)}">${entry.riskLevel}</td>
+                <td>${entry.riskScore}</td>
+            `;
+
+            riskRankingBody.appendChild(row);
+        });
+    }
+
+    // Handle a click on a ranking row
+    function handleRankingClick(event) {
+        const row = event.target.closest('tr[data-country]');
+        if (row) {
+            const country = row.getAttribute('data-country');
+            riskCountrySearch.value = country;
+            fetchRiskAssessment(country);
+        }
     }
 
     // Fetch countries for search suggestions
     async function fetchCountries() {
         try {
-            const response = await fetch('/api/countries');
+            const response = await fetch('/api/countries?fields=country,flag');
             if (response.ok) {
                 const data = await response.json();
                 countriesCache = data.map(country => ({
                     name: country.country,
-                    flag: country.countryInfo?.flag || ''
+                    flag: country.flag || ''
                 }));
             } else {
                 console.error('Failed to fetch countries data');
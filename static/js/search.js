@@ -27,7 +27,7 @@ document.addEventListener('DOMContentLoaded', () => {
      * Fetch all countries data for search functionality
      */
     function fetchCountries() {
-        fetch('/api/countries')
+        fetch('/api/countries?fields=country,flag')
             .then(response => {
                 if (!response.ok) {
                     throw new Error('Network response was not ok');
@@ -83,7 +83,7 @@ document.addEventListener('DOMContentLoaded', () => {
             
             // Create suggestion content with flag and country name
             suggestionItem.innerHTML = `
-                <img src="${country.countryInfo.flag}" alt="${country.country} flag" class="suggestion-flag">
+                <img src="${country.flag}" alt="${country.country} flag" class="suggestion-flag">
                 <span>${country.country}</span>
             `;
             
@@ -120,34 +120,19 @@ document.addEventListener('DOMContentLoaded', () => {
         countryData.innerHTML = '<div class="loading">Loading country data...</div>';
         countryDetail.classList.add('hidden');
         
-        // Fetch country data
-        fetch(`/api/country/${encodeURIComponent(countryName)}`)
+        // Stats, history and risk arrive together; a part that failed comes back as null
+        fetch(`/api/country/${encodeURIComponent(countryName)}/detail?include=stats,historical,risk`)
             .then(response => {
                 if (!response.ok) {
                     throw new Error('Country data not found');
                 }
                 return response.json();
             })
-            .then(data => {
-                // Also fetch historical data for charts
-                fetch(`/api/historical/${encodeURIComponent(countryName)}`)
-                    .then(response => response.json())
-                    .then(historicalData => {
-                        // Also fetch risk assessment data
-                        fetch(`/api/risk-assessment/${encodeURIComponent(countryName)}`)
-                            .then(response => response.json())
-                            .then(riskData => {
-                                displayCountryData(data, historicalData, riskData);
-                            })
-                            .catch(error => {
-                                console.error('Error fetching risk data:', error);
-                                displayCountryData(data, historicalData, null);
-                            });
-                    })
-                    .catch(error => {
-                        console.error('Error fetching historical data:', error);
-                        displayCountryData(data, null, null);
-                    });
+            .then(detail => {
+                if (detail.errors) {
+                    console.error('Some country data could not be loaded:', detail.errors);
+                }
+                displayCountryData(detail.stats, detail.historical, detail.risk);
             })
             .catch(error => {
                 console.error('Error fetching country data:', error);
@@ -68,10 +68,11 @@ function initializeVaccinationData() {
         });
     
     // Fetch countries list for search functionality
-    fetch('/api/countries')
+    fetch('/api/countries?fields=country,population')
         .then(response => response.json())
         .then(countries => {
             vaccineCountryList = countries.map(country => country.country);
+            loadVaccinationComparison(countries);
         })
         .catch(error => {
             console.error('Error fetching countries list:', error);
@@ -91,8 +92,41 @@ function updateGlobalVaccinationUI(data) {
     // Update UI elements
     document.getElementById('global-vaccine-progress').style.width = `${clampedPercent}%`;
     document.getElementById('global-vaccine-percent').textContent = `${clampedPercent}%`;
+}
+
+/**
+ * Chart doses per hundred people for the most populous countries, all read in one request
+ * @param {Array} countries - Countries with their population
+ */
+function loadVaccinationComparison(countries) {
+    const names = countries
+        .sort((a, b) => b.population - a.population)
+        .slice(0, 10)
+        .map(country => country.country);
     
-    // Create a chart for global vaccination progress
+    fetch(`/api/vaccine?countries=${encodeURIComponent(names.join(','))}&days=1&metrics=perHundred`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error('Vaccination data not available');
+            }
+            return response.json();
+        })
+        .then(data => {
+            const labels = Object.keys(data.countries);
+            const dosesPerHundred = labels.map(name => data.countries[name].perHundred.slice(-1)[0] || 0);
+            createVaccinationComparisonChart(labels, dosesPerHundred);
+        })
+        .catch(error => {
+            console.error('Error fetching vaccination comparison:', error);
+        });
+}
+
+/**
+ * Create the bar chart comparing doses per hundred people
+ * @param {Array} labels - Country names
+ * @param {Array} dosesPerHundred - Doses given per hundred people, one per country
+ */
+function createVaccinationComparisonChart(labels, dosesPerHundred) {
     const ctx = document.getElementById('global-vaccination-chart').getContext('2d');
     
     // Destroy existing chart if it exists
@@ -100,14 +134,13 @@ function updateGlobalVaccinationUI(data) {
         window.globalVaccinationChart.destroy();
     }
     
-    // Create chart with mock data (in a real app, you'd use actual global vaccination data)
     window.globalVaccinationChart = new Chart(ctx, {
         type: 'bar',
         data: {
-            labels: ['North America', 'Europe', 'Asia', 'South America', 'Africa', 'Oceania'],
+            labels: labels,
             datasets: [{
-                label: 'Fully Vaccinated (%)',
-                data: [65, 70, 55, 45, 25, 75],
+                label: 'Doses per 100 People',
+                data: dosesPerHundred,
                 backgroundColor: 'rgba(54, 162, 235, 0.7)',
                 borderColor: 'rgba(54, 162, 235, 1)',
                 borderWidth: 1
@@ -119,10 +152,9 @@ function updateGlobalVaccinationUI(data) {
             scales: {
                 y: {
                     beginAtZero: true,
-                    max: 100,
                     title: {
                         display: true,
-                        text: 'Population Percentage'
+                        text: 'Doses per 100 People'
                     }
                 }
             },
@@ -192,45 +224,41 @@ function fetchCountryVaccinationData(country) {
     
     document.getElementById('country-vaccine-detail').classList.add('hidden');
     
-    // Fetch country data first to get population
-    fetch(`/api/country/${country}`)
+    // Population and vaccination data arrive together
+    fetch(`/api/country/${country}/detail?include=stats,vaccine`)
         .then(response => response.json())
-        .then(countryData => {
-            // Now fetch vaccination data
-            fetch(`/api/vaccine/${country}`)
-                .then(response => {
-                    if (!response.ok) {
-                        throw new Error('Vaccination data not available');
-                    }
-                    return response.json();
-                })
-                .then(vaccineData => {
-                    // Combine country data with vaccine data
-                    const combinedData = {
-                        country: countryData.country,
-                        population: countryData.population,
-                        flag: countryData.countryInfo?.flag,
-                        ...vaccineData
-                    };
-                    
-                    // Cache the data
-                    countryVaccineCache[country] = {
-                        data: combinedData,
-                        timestamp: Date.now()
-                    };
-                    
-                    // Display the data
-                    displayCountryVaccinationData(country, combinedData);
-                })
-                .catch(error => {
-                    console.error('Error fetching vaccination data:', error);
-                    countryVaccinationData.innerHTML = `
-                        <div class="error-state">
-                            <p>Sorry, vaccination data is not available for ${country}</p>
-                            <button class="retry-btn" onclick="fetchCountryVaccinationData('${country}')">Retry</button>
-                        </div>
-                    `;
-                });
+        .then(detail => {
+            if (!detail.stats) {
+                throw new Error(detail.error || 'Country data not available');
+            }
+            if (!detail.vaccine) {
+                console.error('Error fetching vaccination data:', detail.errors);
+                countryVaccinationData.innerHTML = `
+                    <div class="error-state">
+                        <p>Sorry, vaccination data is not available for ${country}</p>
+                        <button class="retry-btn" onclick="fetchCountryVaccinationData('${country}')">Retry</button>
+                    </div>
+                `;
+                return;
+            }
+            
+            // Combine country data with vaccine data
+            const countryData = detail.stats;
+            const combinedData = {
+                country: countryData.country,
+                population: countryData.population,
+                flag: countryData.countryInfo?.flag,
+                ...detail.vaccine
+            };
+            
+            // Cache the data
+            countryVaccineCache[country] = {
+                data: combinedData,
+                timestamp: Date.now()
+            };
+            
+            // Display the data
+            displayCountryVaccinationData(country, combinedData);
         })
         .catch(error => {
             console.error('Error fetching country data:', error);
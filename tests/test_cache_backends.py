@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+
+import fakeredis
+import pytest
+import redis
+
+import cache_backends
+from cache_backends import FileCache, RedisCache, make_cache
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+@pytest.fixture
+def redis_cache(server):
+    return RedisCache(fakeredis.FakeRedis(server=server), 'covid:test:', default_timeout=60)
+
+
+def test_redis_get_set(redis_cache):
+    assert redis_cache.get('missing') is None
+    redis_cache.set('countries', [{'country': 'Italy', 'cases': 1}])
+    assert redis_cache.get('countries') == [{'country': 'Italy', 'cases': 1}]
+    assert redis_cache.stats() == {'backend': 'redis', 'hits': 1, 'misses': 1}
+
+
+def test_redis_values_are_json(redis_cache):
+    redis_cache.set('timeline', {'1/22/20': 1, '1/23/20': 2})
+    assert redis_cache.client.get('covid:test:timeline') == b'{"1/22/20":1,"1/23/20":2}'
+    # Dates keep their order, which timelines rely on
+    assert list(redis_cache.get('timeline')) == ['1/22/20', '1/23/20']
+
+
+def test_redis_expiry(redis_cache):
+    redis_cache.set('short', 1, timeout=0.2)
+    redis_cache.set('default', 2)
+    # Expiries are rounded up to whole seconds
+    assert redis_cache.client.ttl('covid:test:short') == 1
+    assert redis_cache.client.ttl('covid:test:default') == 60
+    time.sleep(1.1)
+    assert redis_cache.get('short') is None
+    assert redis_cache.get('default') == 2
+
+
+def test_redis_add_delete_clear(redis_cache):
+    assert redis_cache.add('lock', 1, timeout=10)
+    assert not redis_cache.add('lock', 2, timeout=10)
+    assert redis_cache.get('lock') == 1
+    redis_cache.delete('lock')
+    assert redis_cache.add('lock', 3, timeout=10)
+
+    redis_cache.client.set('other:key', b'kept')
+    redis_cache.clear()
+    assert redis_cache.get('lock') is None
+    assert redis_cache.client.get('other:key') == b'kept'
+
+
+def test_make_cache_redis(monkeypatch, server):
+    monkeypatch.setattr(cache_backends, 'CACHE_BACKEND', 'redis')
+    monkeypatch.setattr(redis.Redis, 'from_url', classmethod(lambda cls, url: fakeredis.FakeRedis(server=server)))
+
+    historical = make_cache('historical', 60)
+    vaccine = make_cache('vaccine', 60)
+    assert isinstance(historical, RedisCache)
+    historical.set('Italy', {'cases': {}})
+    assert historical.get('Italy') == {'cases': {}}
+    # Namespaces share the server but not their keys
+    assert vaccine.get('Italy') is None
+
+
+def test_make_cache_unknown_backend(monkeypatch):
+    monkeypatch.setattr(cache_backends, 'CACHE_BACKEND', 'memcached')
+    with pytest.raises(ValueError):
+        make_cache('latest', 60)
+
+
+def test_file_cache_removes_expired_entries(tmp_path):
+    cache = FileCache(str(tmp_path), default_timeout=60, sweep_interval=0)
+    cache.set('old', 1, timeout=-1)
+    cache.set('read', 2, timeout=-1)
+    assert cache.get('read') is None
+    cache.set('new', 3)
+    # The expired entries are gone, whether or not anyone read them again
+    assert len(list(tmp_path.iterdir())) == 1
+    assert cache.get('new') == 3
+
+
+def test_file_cache_add_expired_lock_two_contenders(tmp_path, monkeypatch):
+    first = FileCache(str(tmp_path), default_timeout=60)
+    second = FileCache(str(tmp_path), default_timeout=60)
+    first.set('lock', 'crashed', timeout=-1)
+    results = {}
+    interleaved = []
+    rename = os.rename
+
+    def second_takes_over_first(src, dst):
+        # Let the second contender take over the expired lock between the first one's read and rename
+        if not interleaved:
+            interleaved.append(True)
+            thread = threading.Thread(target=lambda: results.update(second=second.add('lock', 'second')))
+            thread.start()
+            thread.join()
+        rename(src, dst)
+
+    monkeypatch.setattr(os, 'rename', second_takes_over_first)
+    results['first'] = first.add('lock', 'first')
+
+    assert results == {'first': False, 'second': True}
+    assert first.get('lock') == 'second'
+    assert [p.name for p in tmp_path.iterdir()] == [os.path.basename(first._path('lock'))]
+
+
+def test_file_cache_add_expired_lock_many_contenders(tmp_path):
+    caches = [FileCache(str(tmp_path), default_timeout=60) for _ in range(8)]
+    for _ in range(20):
+        caches[0].set('lock', 'crashed', timeout=-1)
+        barrier = threading.Barrier(len(caches))
+        won = []
+
+        def contend(cache):
+            barrier.wait()
+            if cache.add('lock', id(cache)):
+                won.append(id(cache))
+
+        threads = [threading.Thread(target=contend, args=(cache,)) for cache in caches]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(won) == 1
+        assert caches[0].get('lock') == won[0]
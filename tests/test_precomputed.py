@@ -0,0 +1,49 @@
+import gzip
+import json
+
+import brotli
+import pytest
+from flask import Flask
+
+from precomputed import PrecomputedResponse, serve_precomputed
+
+PAYLOAD = [{'country': 'Italy', 'cases': 1000}] * 50
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    precomputed = PrecomputedResponse(PAYLOAD, 1700000000)
+    app.add_url_rule('/data', 'data', lambda: serve_precomputed(precomputed))
+    return app.test_client()
+
+
+def test_brotli_preferred_when_accepted(client):
+    response = client.get('/data', headers={'Accept-Encoding': 'gzip, br'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'br'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    assert json.loads(brotli.decompress(response.data)) == PAYLOAD
+    assert response.get_etag()[0].endswith('-br')
+
+
+def test_gzip_and_identity(client):
+    response = client.get('/data', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.data)) == PAYLOAD
+    assert response.get_etag()[0].endswith('-gzip')
+
+    response = client.get('/data', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json() == PAYLOAD
+
+
+def test_brotli_etag_revalidates(client):
+    etag = client.get('/data', headers={'Accept-Encoding': 'br'}).headers['ETag']
+    response = client.get('/data', headers={'Accept-Encoding': 'br', 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    # A tag from another encoding still names the same payload
+    response = client.get('/data', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.get_etag()[0].endswith('-gzip')
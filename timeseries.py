@@ -0,0 +1,297 @@
+"""
+Local time-series store for historical COVID-19 data.
+
+All countries' timelines are pulled from disease.sh in one bulk call and
+kept as one dense int64 array per metric (countries x days). The arrays are
+saved as a versioned set of .npy files and memory-mapped on load, so historical requests are
+answered by slicing the store instead of calling upstream.
+
+After the first load the store is kept current incrementally: only a short
+trailing window is fetched, patched into the arrays, and the derived daily
+columns are recomputed for the changed tail only.
+"""
+
+import os
+from datetime import date, timedelta
+
+import numpy as np
+
+from config import HISTORICAL_DELTA_DAYS, TIMESERIES_KEEP_VERSIONS
+from snapshots import SnapshotStore
+
+METRICS = ('cases', 'deaths', 'recovered')
+
+# Daily new counts derived from each cumulative metric
+DAILY_METRICS = {'cases': 'newCases', 'deaths': 'newDeaths', 'recovered': 'newRecovered'}
+
+# Name of the pseudo-country holding the sum over all countries
+GLOBAL_NAME = 'all'
+
+
+def parse_date(key):
+    """Parse a disease.sh date key such as '3/14/21'."""
+    month, day, year = key.split('/')
+    return date(2000 + int(year), int(month), int(day))
+
+
+def format_date(day):
+    """Format a date the way disease.sh keys its timelines."""
+    return f"{day.month}/{day.day}/{day.year % 100}"
+
+
+def update_daily(values, daily, start_col):
+    """Recompute daily new counts in place from column start_col onwards."""
+    for metric, name in DAILY_METRICS.items():
+        cumulative = values[metric]
+        # The first day has no previous day to compare with
+        if start_col <= 0:
+            daily[name][:, 0] = 0
+        col = max(start_col, 1)
+        daily[name][:, col:] = cumulative[:, col:] - cumulative[:, col - 1:-1]
+
+
+class HistoricalStore:
+    """Dense per-metric arrays of daily cumulative counts for every country."""
+
+    def __init__(self, countries, start, values, last_known=None, daily=None):
+        self.countries = list(countries)
+        self.start = start
+        self.values = values
+        self.rows = {name.lower(): i for i, name in enumerate(self.countries)}
+        self.n_days = values[METRICS[0]].shape[1] if self.countries else 0
+        self.date_keys = [format_date(start + timedelta(days=i)) for i in range(self.n_days)]
+        self._totals = None
+
+        # Column of the last day upstream reported for each country
+        if last_known is None:
+            last_known = np.full(len(self.countries), self.n_days - 1, dtype=np.int64)
+        self.last_known = np.asarray(last_known, dtype=np.int64)
+
+        if daily is None:
+            daily = {name: np.zeros_like(values[metric], dtype=np.int64)
+                     for metric, name in DAILY_METRICS.items()}
+            if self.n_days:
+                update_daily(values, daily, 0)
+        self.daily = daily
+
+    @property
+    def end(self):
+        """Date of the last column in the store."""
+        return self.start + timedelta(days=self.n_days - 1)
+
+    @classmethod
+    def from_upstream(cls, payload):
+        """Build a store from a /historical?lastdays=... response.
+
+        Province-level entries are summed into their country, and a day
+        missing for one country repeats that country's previous value.
+        """
+        entries = [e for e in payload if e.get('timeline')]
+        parsed = {}
+        for entry in entries:
+            for key in entry['timeline'].get('cases', {}):
+                if key not in parsed:
+                    parsed[key] = parse_date(key)
+        if not parsed:
+            return cls([], date.today(), {m: np.zeros((0, 0), dtype=np.int64) for m in METRICS})
+
+        start = min(parsed.values())
+        n_days = (max(parsed.values()) - start).days + 1
+        columns = {key: (day - start).days for key, day in parsed.items()}
+
+        countries = []
+        rows = {}
+        for entry in entries:
+            if entry['country'] not in rows:
+                rows[entry['country']] = len(countries)
+                countries.append(entry['country'])
+
+        values = {m: np.zeros((len(countries), n_days), dtype=np.int64) for m in METRICS}
+        present = np.zeros((len(countries), n_days), dtype=bool)
+        for entry in entries:
+            row = rows[entry['country']]
+            for metric in METRICS:
+                series = entry['timeline'].get(metric) or {}
+                if not series:
+                    continue
+                cols = np.fromiter((columns[k] for k in series), dtype=np.intp, count=len(series))
+                vals = np.fromiter((v or 0 for v in series.values()), dtype=np.int64, count=len(series))
+                values[metric][row, cols] += vals
+                present[row, cols] = True
+
+        # Forward-fill gaps by pointing every missing day at the last day seen
+        last_seen = np.where(present, np.arange(n_days), 0)
+        np.maximum.accumulate(last_seen, axis=1, out=last_seen)
+        if not present.all():
+            row_index = np.arange(len(countries))[:, None]
+            for metric in METRICS:
+                values[metric] = values[metric][row_index, last_seen]
+
+        return cls(countries, start, values, last_known=last_seen[:, -1])
+
+    @classmethod
+    def load(cls, directory):
+        """Load a saved store, memory-mapping the metric arrays."""
+        snapshots = SnapshotStore(directory, manifest='meta.json')
+        meta = snapshots.current()
+        if meta is None:
+            raise FileNotFoundError(f"No historical store in {directory}")
+        # Stores saved before versioning kept their arrays next to meta.json
+        array_dir = os.path.join(directory, meta['version']) if 'version' in meta else directory
+        values = {m: np.load(os.path.join(array_dir, f"{m}.npy"), mmap_mode='r') for m in METRICS}
+        daily = {n: np.load(os.path.join(array_dir, f"{n}.npy"), mmap_mode='r')
+                 for n in DAILY_METRICS.values()}
+        return cls(meta['countries'], date.fromisoformat(meta['start']), values,
+                   last_known=meta['lastKnown'], daily=daily)
+
+    def save(self, directory):
+        """Write the store as a new version of one .npy file per metric, then point meta.json at it.
+
+        Readers load meta.json first, so they always get arrays from one
+        complete version even while another save is in progress.
+        """
+        arrays = dict(self.values)
+        arrays.update(self.daily)
+
+        def write(version_dir):
+            for name, array in arrays.items():
+                np.save(os.path.join(version_dir, f"{name}.npy"), np.ascontiguousarray(array))
+
+        SnapshotStore(directory, keep=TIMESERIES_KEEP_VERSIONS, manifest='meta.json').publish_files(
+            write, {'countries': self.countries, 'start': self.start.isoformat(),
+                    'days': self.n_days, 'lastKnown': self.last_known.tolist()})
+
+        # Arrays of an unversioned store are no longer referenced
+        for name in arrays:
+            legacy_path = os.path.join(directory, f"{name}.npy")
+            if os.path.exists(legacy_path):
+                os.remove(legacy_path)
+
+    def delta_window(self):
+        """Number of trailing days to request so every country's last known day is re-fetched."""
+        if not self.countries:
+            return None
+        behind = int(self.n_days - 1 - self.last_known.min())
+        return max(HISTORICAL_DELTA_DAYS, behind + 2)
+
+    def merged(self, window):
+        """Return a new store with a trailing-window store patched in.
+
+        Returns None if the window does not reach back to the end of this
+        store, in which case the caller needs a full reload.
+        """
+        if not window.countries:
+            return self
+        offset = (window.start - self.start).days
+        if offset < 0 or offset > self.n_days:
+            return None
+        known_rows = [self.rows[c.lower()] for c in window.countries if c.lower() in self.rows]
+        if known_rows and (self.last_known[known_rows] < offset - 1).any():
+            return None
+
+        n_days = max(self.n_days, offset + window.n_days)
+        countries = self.countries + [c for c in window.countries if c.lower() not in self.rows]
+        window_rows = []
+        new_row = len(self.countries)
+        for c in window.countries:
+            if c.lower() in self.rows:
+                window_rows.append(self.rows[c.lower()])
+            else:
+                window_rows.append(new_row)
+                new_row += 1
+
+        values = {}
+        daily = {}
+        old_rows = len(self.countries)
+        for metric in METRICS:
+            array = np.zeros((len(countries), n_days), dtype=np.int64)
+            array[:old_rows, :self.n_days] = self.values[metric]
+            # Countries missing from the window carry their last value forward
+            if n_days > self.n_days and self.n_days:
+                array[:old_rows, self.n_days:] = self.values[metric][:, -1:]
+            array[window_rows, offset:offset + window.n_days] = window.values[metric]
+            values[metric] = array
+        for name, array in self.daily.items():
+            daily[name] = np.zeros((len(countries), n_days), dtype=np.int64)
+            daily[name][:old_rows, :self.n_days] = array
+
+        # Only the patched tail needs its daily deltas recomputed
+        update_daily(values, daily, offset)
+
+        last_known = np.concatenate([self.last_known, np.full(len(countries) - old_rows, -1)])
+        last_known[window_rows] = np.maximum(last_known[window_rows], offset + window.last_known)
+        return HistoricalStore(countries, self.start, values, last_known=last_known, daily=daily)
+
+    def has(self, name):
+        return name.lower() == GLOBAL_NAME or name.lower() in self.rows
+
+    def totals(self):
+        """Return the per-metric sums over all countries, computed once."""
+        if self._totals is None:
+            arrays = dict(self.values)
+            arrays.update(self.daily)
+            self._totals = {m: v.sum(axis=0) for m, v in arrays.items()}
+        return self._totals
+
+    def series(self, name, days=None, daily=False):
+        """Return (date keys, {metric: 1-D array}) for the last `days` days of a country.
+
+        With daily=True the newCases/newDeaths/newRecovered arrays are included.
+        """
+        start = 0 if days is None else max(self.n_days - days, 0)
+        names = list(METRICS) + (list(DAILY_METRICS.values()) if daily else [])
+        if name.lower() == GLOBAL_NAME:
+            totals = self.totals()
+            arrays = {m: totals[m][start:] for m in names}
+        else:
+            row = self.rows.get(name.lower())
+            if row is None:
+                return None, None
+            source = dict(self.values)
+            source.update(self.daily)
+            arrays = {m: source[m][row, start:] for m in names}
+        return self.date_keys[start:], arrays
+
+    def block(self, names, days=None, daily=False):
+        """Return (date keys, {metric: 2-D array}) for several countries at once, one row per name.
+
+        Every name must be one the store has.
+        """
+        start = 0 if days is None else max(self.n_days - days, 0)
+        metrics = list(METRICS) + (list(DAILY_METRICS.values()) if daily else [])
+        rows = [self.rows.get(name.lower(), 0) for name in names]
+        global_rows = [i for i, name in enumerate(names) if name.lower() == GLOBAL_NAME]
+        source = dict(self.values)
+        source.update(self.daily)
+
+        arrays = {}
+        for metric in metrics:
+            arrays[metric] = source[metric][rows, start:]
+            for i in global_rows:
+                arrays[metric][i] = self.totals()[metric][start:]
+        return self.date_keys[start:], arrays
+
+    def timeline(self, name, days=None):
+        """Return a country's timeline in the disease.sh {metric: {date: value}} shape."""
+        dates, arrays = self.series(name, days)
+        if dates is None:
+            return None
+        return {m: dict(zip(dates, arrays[m].tolist())) for m in METRICS}
+
+
+def refresh_store(store, client, endpoint):
+    """Bring a store up to date and return it, fetching only its missing tail when possible.
+
+    With no store, or when the trailing window would leave a gap, the full
+    history is fetched instead.
+    """
+    if store is not None and store.countries:
+        response = client.get(endpoint, params={'lastdays': store.delta_window()})
+        response.raise_for_status()
+        merged = store.merged(HistoricalStore.from_upstream(response.json()))
+        if merged is not None:
+            return merged
+
+    response = client.get(endpoint, params={'lastdays': 'all'})
+    response.raise_for_status()
+    return HistoricalStore.from_upstream(response.json())
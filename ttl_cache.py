@@ -0,0 +1,127 @@
+"""
+Bounded in-memory cache with per-entry expiry for the COVID-19 tracker.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_size(value):
+    """Approximate the memory footprint of a JSON-compatible value in bytes."""
+    try:
+        return len(json.dumps(value, separators=(',', ':')))
+    except (TypeError, ValueError):
+        return 0
+
+
+class TTLCache:
+    """LRU cache where every entry expires on its own timestamp.
+
+    The cache is bounded both by entry count and by an approximate byte
+    budget; the least recently used entries are evicted first. Entries live
+    for ttl seconds unless set() is given its own timeout.
+    """
+
+    def __init__(self, ttl, max_entries=None, max_bytes=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, expires, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires, size = entry
+            if time.time() > expires:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        """Store value under key and evict old entries if over budget."""
+        size = estimate_size(value)
+        with self._lock:
+            self._store(key, value, timeout, size)
+
+    def add(self, key, value, timeout=None):
+        """Store value only if key is missing or expired; return True if it was stored."""
+        size = estimate_size(value)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() <= entry[1]:
+                return False
+            self._store(key, value, timeout, size)
+            return True
+
+    def delete(self, key):
+        """Remove key from the cache if present."""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        """Remove every entry without resetting the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.time() <= entry[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return entry counts, size and hit/miss/eviction counters."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxEntries': self.max_entries,
+                'maxBytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def _store(self, key, value, timeout, size):
+        if key in self._entries:
+            self._remove(key)
+        expires = time.time() + (self.ttl if timeout is None else timeout)
+        self._entries[key] = (value, expires, size)
+        self._bytes += size
+        self._evict()
+
+    def _remove(self, key):
+        value, expires, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        # Always keep the newest entry, even if it alone exceeds the byte budget
+        while len(self._entries) > 1 and (
+                (self.max_entries is not None and len(self._entries) > self.max_entries) or
+                (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
@@ -0,0 +1,175 @@
+"""
+Shared HTTP client for the disease.sh API.
+
+Both Flask apps go through this module so that upstream calls reuse pooled
+keep-alive connections, never wait without a timeout, retry transient
+failures with jittered backoff and stop hammering disease.sh while it is
+down.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import *
+from metrics import UPSTREAM_SECONDS, upstream_endpoint
+from snapshots import BackupStore
+
+# Status codes worth retrying; everything else is returned to the caller
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Backup keys used for the bulk endpoints
+BACKUP_FILES = {
+    '/all': 'global',
+    '/countries': 'countries',
+}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stop calling upstream after repeated failures, then probe it again later."""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.time() - self.opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow_request(self):
+        """Return True if a call may go upstream right now."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.reset_timeout:
+                # Let one probe through and hold the rest until it reports back
+                self.opened_at = time.time()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+
+class UpstreamClient:
+    """Pooled, keep-alive client with timeouts, retries and a circuit breaker."""
+
+    def __init__(self, base_url=COVID_API_BASE_URL,
+                 timeout=(UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT),
+                 max_retries=UPSTREAM_MAX_RETRIES,
+                 backoff_base=UPSTREAM_BACKOFF_BASE,
+                 backoff_max=UPSTREAM_BACKOFF_MAX,
+                 pool_size=UPSTREAM_POOL_SIZE,
+                 breaker=None,
+                 backup_dir=BACKUP_DIR):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.backups = BackupStore(backup_dir, legacy_dir=DATA_DIR)
+        self.breaker = breaker or CircuitBreaker(CIRCUIT_BREAKER_FAILURES, CIRCUIT_BREAKER_RESET)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        # Shared pool for fanning out several upstream calls from one request
+        self.executor = ThreadPoolExecutor(max_workers=UPSTREAM_FANOUT_WORKERS,
+                                           thread_name_prefix='upstream')
+
+    def url(self, path):
+        """Resolve a path such as '/countries' against the base URL."""
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def get(self, path, params=None):
+        """GET a path or URL, retrying transient failures.
+
+        Non-retryable responses (including 404) are returned as-is. Raises a
+        requests exception once retries are exhausted or the circuit is open.
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"Upstream circuit open, skipping {path}")
+
+        url = self.url(path)
+        endpoint = upstream_endpoint(path)
+        attempt = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint, 'error')
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    raise
+            else:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - started, endpoint, response.status_code)
+                if response.status_code not in RETRY_STATUSES:
+                    self.breaker.record_success()
+                    return response
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    return response
+
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def get_json(self, path, params=None, backup=None):
+        """GET a path and decode JSON, falling back to a backup on failure.
+
+        backup is a key in the backup store; the bulk
+        endpoints in BACKUP_FILES use their backups automatically.
+        """
+        try:
+            response = self.get(path, params=params)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.RequestException:
+            data = self.load_backup(backup or BACKUP_FILES.get(path))
+            if data is None:
+                raise
+            return data
+
+    def load_backup(self, name):
+        """Load the backup stored under a key, or return None."""
+        return self.backups.load(name)
+
+    def save_backup(self, name, data):
+        """Store a backup under a key, atomically replacing any older copy."""
+        self.backups.save(name, data)
+
+    def _backoff(self, attempt):
+        # Full jitter keeps concurrent retries from landing at the same moment
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+
+# Shared client used by both apps
+upstream = UpstreamClient()
@@ -0,0 +1,139 @@
+"""
+Local vaccination coverage store for the COVID-19 tracker.
+
+All countries' vaccine timelines are pulled from disease.sh in one bulk call
+and kept as dense arrays (countries x days). The columns start on the
+historical store's first day, so a column is the same date in both stores.
+Daily doses, their 7-day average and doses per hundred people are derived
+for every country at once when the store is built, and everything is saved
+as a versioned set of .npy files that are memory-mapped on load.
+"""
+
+import os
+from datetime import date, timedelta
+
+import numpy as np
+
+from config import VACCINE_AVERAGE_DAYS, VACCINE_KEEP_VERSIONS
+from snapshots import SnapshotStore
+from timeseries import format_date, parse_date
+
+# Arrays kept per country: cumulative doses, daily doses, their rolling
+# average and cumulative doses per hundred people
+VACCINE_METRICS = ('total', 'daily', 'daily7', 'perHundred')
+
+# Metrics summed rather than sampled when a series is thinned to weeks or months
+VACCINE_FLOWS = ('daily',)
+
+
+def derive(total, populations, window=VACCINE_AVERAGE_DAYS):
+    """Return every VACCINE_METRICS array from cumulative doses (countries x days) and populations."""
+    daily = np.zeros_like(total)
+    # Revisions can lower a cumulative count; those days count as no doses
+    daily[:, 1:] = np.maximum(total[:, 1:] - total[:, :-1], 0)
+
+    # Trailing mean over the window, or over the days so far at the start
+    summed = np.cumsum(daily, axis=1, dtype=np.float64)
+    summed[:, window:] -= summed[:, :-window].copy()
+    days = np.minimum(np.arange(1, total.shape[1] + 1), window)
+    daily7 = summed / days
+
+    populations = np.asarray(populations, dtype=np.float64)[:, None]
+    per_hundred = np.zeros(total.shape, dtype=np.float64)
+    np.divide(total * 100.0, populations, out=per_hundred, where=populations > 0)
+
+    return {'total': total, 'daily': daily, 'daily7': daily7, 'perHundred': per_hundred}
+
+
+class VaccineStore:
+    """Dense per-metric arrays of vaccination figures for every country."""
+
+    def __init__(self, countries, start, arrays, first=0):
+        self.countries = list(countries)
+        self.start = start
+        self.arrays = arrays
+        self.rows = {name.lower(): i for i, name in enumerate(self.countries)}
+        self.n_days = arrays['total'].shape[1] if self.countries else 0
+        self.date_keys = [format_date(start + timedelta(days=i)) for i in range(self.n_days)]
+        # Column of the first day any country reported doses
+        self.first = first
+
+    @classmethod
+    def from_upstream(cls, payload, populations, start=None):
+        """Build a store from a /vaccine/coverage/countries?lastdays=all response.
+
+        populations maps country names to population. Columns begin at start
+        (the historical store's first day) if given; a day missing for one
+        country repeats that country's previous value.
+        """
+        entries = [e for e in payload if e.get('timeline')]
+        parsed = {}
+        for entry in entries:
+            for key in entry['timeline']:
+                if key not in parsed:
+                    parsed[key] = parse_date(key)
+        if not parsed:
+            return cls([], start or date.today(), {m: np.zeros((0, 0)) for m in VACCINE_METRICS})
+
+        first_day = min(parsed.values())
+        start = start or first_day
+        n_days = (max(parsed.values()) - start).days + 1
+        columns = {key: (day - start).days for key, day in parsed.items() if day >= start}
+
+        countries = [entry['country'] for entry in entries]
+        total = np.zeros((len(countries), n_days), dtype=np.int64)
+        present = np.zeros((len(countries), n_days), dtype=bool)
+        for row, entry in enumerate(entries):
+            series = {k: v for k, v in entry['timeline'].items() if k in columns}
+            cols = np.fromiter((columns[k] for k in series), dtype=np.intp, count=len(series))
+            total[row, cols] = np.fromiter((v or 0 for v in series.values()), dtype=np.int64, count=len(series))
+            present[row, cols] = True
+
+        # Forward-fill gaps; days before a country's first report stay at zero
+        last_seen = np.where(present, np.arange(n_days), 0)
+        np.maximum.accumulate(last_seen, axis=1, out=last_seen)
+        total = total[np.arange(len(countries))[:, None], last_seen]
+
+        arrays = derive(total, [populations.get(name, 0) for name in countries])
+        return cls(countries, start, arrays, first=max((first_day - start).days, 0))
+
+    @classmethod
+    def load(cls, directory):
+        """Load a saved store, memory-mapping its arrays."""
+        snapshots = SnapshotStore(directory, manifest='meta.json')
+        meta = snapshots.current()
+        if meta is None:
+            raise FileNotFoundError(f"No vaccine store in {directory}")
+        array_dir = os.path.join(directory, meta['version'])
+        arrays = {m: np.load(os.path.join(array_dir, f"{m}.npy"), mmap_mode='r') for m in VACCINE_METRICS}
+        return cls(meta['countries'], date.fromisoformat(meta['start']), arrays, first=meta['first'])
+
+    def save(self, directory):
+        """Write the store as a new version of one .npy file per metric, then point meta.json at it."""
+        def write(version_dir):
+            for name, array in self.arrays.items():
+                np.save(os.path.join(version_dir, f"{name}.npy"), np.ascontiguousarray(array))
+
+        SnapshotStore(directory, keep=VACCINE_KEEP_VERSIONS, manifest='meta.json').publish_files(
+            write, {'countries': self.countries, 'start': self.start.isoformat(),
+                    'days': self.n_days, 'first': self.first})
+
+    def has(self, name):
+        return name.lower() in self.rows
+
+    def block(self, names, days=None, metrics=VACCINE_METRICS):
+        """Return (date keys, {metric: 2-D array}) for several countries at once, one row per name.
+
+        Without days the series begin on the first day any country reported
+        doses. Every name must be one the store has.
+        """
+        start = self.first if days is None else max(self.n_days - days, 0)
+        rows = [self.rows[name.lower()] for name in names]
+        return self.date_keys[start:], {m: self.arrays[m][rows, start:] for m in metrics}
+
+    def timeline(self, name, days=None):
+        """Return a country's cumulative doses as the disease.sh {date: doses} timeline."""
+        if not self.has(name):
+            return None
+        dates, arrays = self.block([name], days, ('total',))
+        return dict(zip(dates, arrays['total'][0].tolist()))